@@ -0,0 +1,133 @@
+# backend/access.py
+"""
+Role-based access from JWT claims.
+
+Access tokens carry the user's id, role and a version stamp
+(User.token_version) as claims, so routes authorize without loading the user.
+Changing a user's role, password or name bumps the version, and tokens with
+an older stamp are refused by the blocklist check below. A token only counts
+for the account it was issued to: the id must match, and new accounts start
+at a time-based version, so a deleted user's token does not work for a
+re-created account with the same name (SQLite may hand out the same id again). The current version of each user is
+kept in an in-process cache that is filled on first use and invalidated by
+create/update/delete (and by peers via the worker broker, see set_publisher).
+Unknown users are not cached, so a re-created username works immediately.
+"""
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt
+
+from models import User
+
+ROLE_CLAIM = "role"
+VERSION_CLAIM = "ver"
+UID_CLAIM = "uid"
+
+_MISSING = object()
+# username -> (user id, token version)
+_versions: Dict[str, Tuple[int, int]] = {}
+_lock = threading.Lock()
+_publish: Optional[Callable[[str], None]] = None
+
+
+def claims_for(user: User) -> Dict[str, Any]:
+    """Additional claims for a user's access token."""
+    remember(user)
+    return {ROLE_CLAIM: user.role, VERSION_CLAIM: user.token_version or 0, UID_CLAIM: user.id}
+
+
+def remember(user: User):
+    with _lock:
+        _versions[user.username] = (user.id, user.token_version or 0)
+
+
+def initial_version() -> int:
+    """
+    token_version for a new account: above anything a previous account with
+    the same name can have reached, since versions only grow one per change.
+    """
+    return int(time.time() * 1000)
+
+
+def current_version(username: str) -> Optional[Tuple[int, int]]:
+    """(user id, token version) of a user, or None if the user does not exist."""
+    with _lock:
+        version = _versions.get(username, _MISSING)
+    if version is not _MISSING:
+        return version
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        return None
+    version = (user.id, user.token_version or 0)
+    with _lock:
+        _versions[username] = version
+    return version
+
+
+def forget(username: str):
+    """Drop a cached version so the next request reloads it."""
+    with _lock:
+        _versions.pop(username, None)
+
+
+def invalidate(*usernames: str):
+    """
+    Forget users in this process and tell the other workers to do the same.
+
+    Call after committing a change that created or removed the user or bumped
+    its token_version.
+    """
+    for username in usernames:
+        forget(username)
+        if _publish:
+            _publish(username)
+
+
+def set_publisher(publish: Callable[[str], None]):
+    """Register how invalidations reach other worker processes."""
+    global _publish
+    _publish = publish
+
+
+def revoke_tokens(user: User):
+    """Bump a user's token version; existing tokens stop working after commit."""
+    user.token_version = (user.token_version or 0) + 1
+
+
+def is_revoked(jwt_payload: Dict[str, Any]) -> bool:
+    """
+    Blocklist check: tokens without claims, for another account with the
+    same name, or with a stale version are refused.
+    """
+    version = jwt_payload.get(VERSION_CLAIM)
+    uid = jwt_payload.get(UID_CLAIM)
+    if version is None or uid is None:
+        return True
+    return current_version(jwt_payload["sub"]) != (uid, version)
+
+
+def current_role() -> Optional[str]:
+    return get_jwt().get(ROLE_CLAIM)
+
+
+def admin_required(**forbidden):
+    """
+    Allow only admins; use below @jwt_required().
+
+    Args:
+        forbidden: JSON body of the 403 response
+    """
+    body = forbidden or {"error": "Admin access required"}
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_role() != "admin":
+                return jsonify(body), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
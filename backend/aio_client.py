@@ -0,0 +1,184 @@
+# backend/aio_client.py
+"""
+Asyncio ComfyUI client, used by the async runtime (see aio_runtime).
+
+Mirrors the polling side of comfyui_client with aiohttp: one pooled session
+per node with the same connection limits, timeouts, retry policy and
+circuit breaker, and the same return shapes. Payload parsing is shared with
+comfyui_client. aiohttp is optional; available() is False without it.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import comfyui_client
+import json_codec
+import node_health
+from comfyui_client import CircuitOpenError, NodeClient
+from models import Node
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+def available() -> bool:
+    return aiohttp is not None
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status: int, url: str, body: str = ""):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+        self.body = body
+
+
+class AsyncNodeClient:
+    """Pooled keep-alive aiohttp session for a single ComfyUI node."""
+
+    def __init__(self, base_url: str, max_connections: int = 10, max_retries: int = 2,
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeouts = dict(NodeClient.DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_connections, limit_per_host=max_connections)
+        )
+
+    async def get_json(self, endpoint: str, path: str, bypass_breaker: bool = False) -> Any:
+        return await self._request("GET", endpoint, path, idempotent=True, bypass_breaker=bypass_breaker)
+
+    async def post_json(self, endpoint: str, path: str, payload: Dict[str, Any]) -> Any:
+        # See NodeClient.post: only retried if the connection was never established
+        return await self._request("POST", endpoint, path, idempotent=False, data=json_codec.dumps(payload),
+                                   headers={"Content-Type": "application/json"})
+
+    async def close(self):
+        await self.session.close()
+
+    async def _request(self, method: str, endpoint: str, path: str, idempotent: bool,
+                       bypass_breaker: bool = False, **kwargs) -> Any:
+        if not bypass_breaker and not node_health.is_available(self.base_url):
+            raise CircuitOpenError(f"circuit open for {self.base_url}")
+
+        timeout = aiohttp.ClientTimeout(total=self.timeouts.get(endpoint, 5))
+        url = f"{self.base_url}{path}"
+
+        started = time.time()
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                async with self.session.request(method, url, timeout=timeout, **kwargs) as response:
+                    retry = idempotent and not last_attempt and response.status in NodeClient.RETRY_STATUSES
+                    if not retry:
+                        if response.status >= 500:
+                            self._record(endpoint, started, error=f"HTTP {response.status}")
+                        else:
+                            self._record(endpoint, started)
+                        if response.status >= 400:
+                            raise HTTPStatusError(response.status, url, await response.text())
+                        return await response.json(content_type=None)
+            except aiohttp.ClientConnectionError as e:
+                # ServerDisconnectedError / ClientOSError can follow a sent
+                # body; only ClientConnectorError means nothing reached the node
+                if last_attempt or not (idempotent or isinstance(e, aiohttp.ClientConnectorError)):
+                    self._record(endpoint, started, error=str(e))
+                    raise
+            except asyncio.TimeoutError as e:
+                if last_attempt or not idempotent:
+                    self._record(endpoint, started, error=f"timeout: {e}")
+                    raise
+
+            # Exponential backoff with full jitter
+            await asyncio.sleep(random.uniform(0, NodeClient.BACKOFF_BASE * (2 ** attempt)))
+
+    # Same bookkeeping as the blocking client
+    _record = NodeClient._record
+
+
+# Only touched from the runtime's event loop thread, so no lock
+_clients: Dict[str, AsyncNodeClient] = {}
+
+
+def get_client(node_url: str) -> AsyncNodeClient:
+    key = node_url.rstrip("/")
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = AsyncNodeClient(key)
+    return client
+
+
+async def configure_clients(nodes: Iterable[Node]):
+    """Create or rebuild sessions whose limits differ from their node rows."""
+    for node in nodes:
+        key = node.url.rstrip("/")
+        settings = comfyui_client._client_settings(node)
+        client = _clients.get(key)
+        if client and client.max_connections == settings["max_connections"] \
+                and client.max_retries == settings["max_retries"] \
+                and client.timeouts == dict(NodeClient.DEFAULT_TIMEOUTS, **(settings["timeouts"] or {})):
+            continue
+        _clients[key] = AsyncNodeClient(key, **settings)
+        if client:
+            await client.close()
+
+
+async def close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
+
+
+# =====================================================
+# --- ComfyUI API Functions ---
+# =====================================================
+async def get_node_queue_size(node_url: str) -> int:
+    """See comfyui_client.get_node_queue_size."""
+    try:
+        return comfyui_client.parse_queue_size(await get_client(node_url).get_json("queue", "/queue"))
+    except Exception as e:
+        logger.error(f"Error getting queue size from {node_url}: {e}")
+        raise
+
+
+async def get_system_stats(node_url: str) -> Dict[str, Any]:
+    """See comfyui_client.get_system_stats."""
+    return await get_client(node_url).get_json("system_stats", "/system_stats")
+
+
+async def check_job_status(node_url: str, prompt_id: str) -> Dict[str, Any]:
+    """See comfyui_client.check_job_status."""
+    try:
+        data = await get_client(node_url).get_json("history", f"/history/{prompt_id}")
+        return comfyui_client.parse_history_status(prompt_id, data)
+    except Exception as e:
+        logger.error(f"Failed to check status for {prompt_id} on {node_url}: {e}")
+        return {"status": "unknown", "outputs": None, "error": str(e)}
+
+
+async def submit_workflow_to_comfyui(node_url: str, workflow_json: Dict[str, Any]) -> Optional[str]:
+    """See comfyui_client.submit_workflow_to_comfyui."""
+    try:
+        payload = {"prompt": workflow_json, "client_id": comfyui_client.CLIENT_ID}
+        data = await get_client(node_url).post_json("prompt", "/prompt", payload)
+        prompt_id = data.get("prompt_id")
+        logger.info(f"Workflow submitted to {node_url}. Prompt ID: {prompt_id}, Queue #: {data.get('number')}")
+        return prompt_id
+    except HTTPStatusError as e:
+        if 400 <= e.status < 500:
+            rejected = comfyui_client.PromptRejectedError(e.status, comfyui_client.rejection_detail(e.body))
+            logger.error(f"{node_url} rejected workflow: {rejected}")
+            raise rejected
+        logger.error(f"Failed to submit workflow to {node_url}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Failed to submit workflow to {node_url}: {e}")
+        return None
@@ -0,0 +1,80 @@
+# backend/aio_runtime.py
+"""
+Asyncio runtime for node I/O.
+
+With `"runtime": "asyncio"` in config.json the node refresher and the status
+poller run as tasks on one event loop instead of as threads doing blocking
+HTTP calls. Each pass fans out to every node (or every running job) at once
+through aio_client, bounded by `max_concurrency`, so slow nodes hold a
+coroutine rather than a thread.
+
+The loop runs in its own thread next to Flask; synchronous code (such as
+the dispatcher) can run a coroutine on it with call().
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    def __init__(self, app, max_concurrency: int = 256):
+        """
+        Args:
+            app: Flask app; periodic tasks run inside its app context
+            max_concurrency: Node requests in flight at once across all tasks
+        """
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """Start the event loop thread and wait until it is running."""
+        if self.loop:
+            return
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True, name="asyncio-runtime").start()
+        self._ready.wait()
+
+    def call(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop from another thread and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def bounded(self, coro: Awaitable[Any]) -> Any:
+        """Await `coro` holding one of the runtime's concurrency slots."""
+        async with self.semaphore:
+            return await coro
+
+    async def gather(self, coros) -> list:
+        """Run coroutines concurrently under the concurrency limit; exceptions are returned."""
+        return await asyncio.gather(*(self.bounded(c) for c in coros), return_exceptions=True)
+
+    def every(self, interval: float, task: Callable[[], Awaitable[None]], name: str):
+        """
+        Schedule `task` to run every `interval` seconds, measured from the
+        start of each run, inside the app context.
+        """
+
+        async def loop():
+            while True:
+                started = time.time()
+                try:
+                    with self.app.app_context():
+                        await task()
+                except Exception as e:
+                    logger.error(f"Error in {name}: {e}")
+                await asyncio.sleep(max(0, interval - (time.time() - started)))
+
+        self.loop.call_soon_threadsafe(lambda: self.loop.create_task(loop(), name=name))
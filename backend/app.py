@@ -1,21 +1,57 @@
 # backend/app.py
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_file, g
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, verify_jwt_in_request
 from flask_socketio import SocketIO
-from models import db, bcrypt
+from models import db, bcrypt, Node
 from auth import auth_bp
 from users import users_bp
 from nodes import nodes_bp
+import access
+from access import admin_required
 import comfyui_client
-import os, json, sqlite3, time
-from datetime import datetime
+import ws_listener
+import node_state
+from dispatcher import Dispatcher
+import scheduler
+import node_health
+from duration_stats import parse_timestamp
+from job_store import JobStore
+import workflow_store
+import results_store
+import sweeps
+import memo
+import metrics
+import stage_stats
+from image_cache import ImageCache, THUMBNAIL_SIZES
+from static_assets import StaticIndex
+import json_codec
+import aio_client
+from aio_runtime import AsyncRuntime
+import lease
+from lease import Lease
+from broker import LocalBroker
+import log_setup
+import os, json, sqlite3, time, base64, zipfile, asyncio, logging, threading, hmac, hashlib, socket, uuid
+from datetime import datetime, timedelta
+from collections import OrderedDict
 
 # =====================================================
 # --- Load config ---
 # =====================================================
 CONFIG = json.load(open("config.json"))
 DB = os.path.join(os.path.dirname(__file__), "queue.db")
+# ComfyUI clientId shared by every worker on this host and database, so /ws
+# events keep reaching whichever worker holds the dispatcher lease
+comfyui_client.CLIENT_ID = CONFIG.get("comfyui_client_id") or str(
+    uuid.uuid5(uuid.NAMESPACE_URL, f"comfyqueue://{socket.gethostname()}{os.path.abspath(DB)}"))
+
+# Components with their own level/sampling (see log_setup)
+logger = logging.getLogger("comfyqueue")
+request_log = logging.getLogger("comfyqueue.requests")
+static_log = logging.getLogger("comfyqueue.static")
+job_log = logging.getLogger("comfyqueue.jobs")
+poller_log = logging.getLogger("comfyqueue.poller")
 
 # =====================================================
 # --- Create Flask app ---
@@ -31,6 +67,11 @@ app = Flask(__name__, static_folder=DIST_DIR, static_url_path="/dist")
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///comfyqueue.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["JWT_SECRET_KEY"] = "change-this-in-production"
+# Bodies above this are rejected with 413 while streaming; multipart files
+# larger than 500 KB are spooled to a temporary file rather than kept in memory
+UPLOAD_MAX_MB = CONFIG.get("upload_max_mb", 100)
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_MB * 1024 * 1024
+json_codec.set_parse_concurrency(CONFIG.get("upload_parse_concurrency", 4))
 
 # =====================================================
 # --- Initialize extensions ---
@@ -39,7 +80,19 @@ CORS(app)
 db.init_app(app)
 bcrypt.init_app(app)
 jwt = JWTManager(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+@jwt.token_in_blocklist_loader
+def token_revoked(jwt_header, jwt_payload):
+    return access.is_revoked(jwt_payload)
+
+# Flask-SocketIO has no asyncio mode, and eventlet/gevent would need the
+# whole process monkey-patched (sqlite3, requests, threads), so Socket.IO
+# runs in threading mode; node I/O uses the asyncio runtime instead.
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"ok": False, "error": f"Upload exceeds {UPLOAD_MAX_MB} MB"}), 413
 
 # =====================================================
 # --- Register blueprints ---
@@ -60,6 +113,7 @@ os.makedirs("../logs", exist_ok=True)
 # =====================================================
 def init_db():
     conn = sqlite3.connect(DB)
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
     c.execute("""
         CREATE TABLE IF NOT EXISTS jobs(
@@ -83,7 +137,21 @@ def init_db():
         "ALTER TABLE jobs ADD COLUMN comfyui_prompt_id TEXT",
         "ALTER TABLE jobs ADD COLUMN node_url TEXT",
         "ALTER TABLE jobs ADD COLUMN error_message TEXT",
-        "ALTER TABLE jobs ADD COLUMN completed_at TIMESTAMP"
+        "ALTER TABLE jobs ADD COLUMN completed_at TIMESTAMP",
+        "ALTER TABLE jobs ADD COLUMN version INTEGER",
+        "ALTER TABLE jobs ADD COLUMN priority INTEGER DEFAULT 0",
+        "ALTER TABLE jobs ADD COLUMN workflow_hash TEXT",
+        "ALTER TABLE jobs ADD COLUMN models TEXT",
+        "ALTER TABLE jobs ADD COLUMN fingerprint TEXT",
+        "ALTER TABLE jobs ADD COLUMN dispatched_at TIMESTAMP",
+        "ALTER TABLE jobs ADD COLUMN sweep_id INTEGER",
+        "ALTER TABLE jobs ADD COLUMN sweep_index INTEGER",
+        "ALTER TABLE jobs ADD COLUMN memo_key TEXT",
+        "ALTER TABLE jobs ADD COLUMN memo_of INTEGER",
+        "ALTER TABLE jobs ADD COLUMN queued_at TIMESTAMP",
+        "ALTER TABLE jobs ADD COLUMN started_at TIMESTAMP",
+        "ALTER TABLE jobs ADD COLUMN finished_at TIMESTAMP",
+        "ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0"
     ]
     for migration in migrations:
         try:
@@ -92,11 +160,332 @@ def init_db():
         except sqlite3.OperationalError:
             # Column already exists, ignore
             pass
+    # Workflow bodies, stored once per canonical hash (see workflow_store)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS workflow_blobs(
+            hash TEXT PRIMARY KEY,
+            data BLOB,
+            size INTEGER,
+            compressed_size INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_workflow_hash ON jobs(workflow_hash)")
+
+    # Outputs captured when a job completes (see results_store)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS job_results(
+            job_id INTEGER PRIMARY KEY,
+            prompt_id TEXT,
+            outputs TEXT,
+            status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Parameter sweeps: one template, jobs reference it by sweep_id/sweep_index
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sweeps(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT,
+            filename TEXT,
+            workflow_hash TEXT,
+            spec TEXT,
+            total INTEGER,
+            priority INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_sweep ON jobs(sweep_id, sweep_index)")
+
+    # Result memoization lookups (see memo.py)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_memo_key ON jobs(memo_key, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_memo_of ON jobs(memo_of)")
+
+    # Per-stage timing percentiles (see stage_stats)
+    c.execute(stage_stats.CREATE_SQL)
+
+    # Dispatcher leadership between worker processes (see lease.py)
+    c.execute(lease.CREATE_SQL)
+
+    # Listener events arrive keyed by ComfyUI prompt_id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_prompt_id ON jobs(comfyui_prompt_id)")
+    # Keyset pagination for /api/jobs, unfiltered and per filter column
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs(user, created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_node_created ON jobs(node, created_at, id)")
+
+    # Change sequence for /api/jobs/changes: every insert or update stamps the
+    # row with MAX(version) + 1. SQLite serializes writers, so versions commit
+    # in increasing order and a client cursor never skips a change.
+    c.execute("UPDATE jobs SET version = id WHERE version IS NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_version ON jobs(version)")
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS jobs_version_insert AFTER INSERT ON jobs
+        BEGIN
+            UPDATE jobs SET version = (SELECT COALESCE(MAX(version), 0) + 1 FROM jobs)
+            WHERE id = NEW.id;
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS jobs_version_update AFTER UPDATE ON jobs
+        WHEN NEW.version IS OLD.version
+        BEGIN
+            UPDATE jobs SET version = (SELECT COALESCE(MAX(version), 0) + 1 FROM jobs)
+            WHERE id = NEW.id;
+        END
+    """)
     conn.commit()
     conn.close()
 
 init_db()
 
+# Long-lived WAL connections; terminal status transitions are batched
+store = JobStore(
+    DB,
+    flush_interval=CONFIG.get("store_flush_interval", 0.5),
+    batch_size=CONFIG.get("store_batch_size", 200)
+)
+workflow_store.cache.max_bytes = CONFIG.get("workflow_cache_mb", 64) * 1024 * 1024
+workflow_store.migrate_inline_workflows(store)
+results_store.cache.maxsize = CONFIG.get("results_cache_size", 512)
+
+image_cache = ImageCache(
+    os.path.join("../completed", "image_cache"),
+    comfyui_client.fetch_image,
+    max_bytes=CONFIG.get("image_cache_max_mb", 2048) * 1024 * 1024
+)
+
+def migrate_model_tables():
+    """Add columns introduced after the users and nodes tables were first created"""
+    from sqlalchemy import text
+    migrations = [
+        "ALTER TABLE users ADD COLUMN token_version INTEGER DEFAULT 0",
+        "ALTER TABLE nodes ADD COLUMN max_connections INTEGER DEFAULT 10",
+        "ALTER TABLE nodes ADD COLUMN max_retries INTEGER DEFAULT 2",
+        "ALTER TABLE nodes ADD COLUMN timeouts TEXT"
+    ]
+    with app.app_context():
+        for migration in migrations:
+            try:
+                db.session.execute(text(migration))
+                db.session.commit()
+            except Exception:
+                # Column already exists (or table not created yet), ignore
+                db.session.rollback()
+
+migrate_model_tables()
+
+# =====================================================
+# --- Job creation ---
+# =====================================================
+BATCH_MAX_JOBS = CONFIG.get("batch_max_jobs", 1000)
+
+def find_memo_source(conn, key):
+    """
+    Latest job with this memo key whose result can be shared.
+
+    Completed jobs qualify within memoize_ttl; queued and running ones
+    always do. Jobs that are themselves memoized copies are skipped.
+    """
+    cutoff = datetime.now() - timedelta(seconds=memo.settings["memoize_ttl"])
+    return conn.execute(f"""
+        SELECT id, status FROM jobs
+        WHERE memo_key=? AND memo_of IS NULL
+          AND (status IN ({','.join('?' * len(memo.IN_FLIGHT))})
+               OR (status='completed' AND completed_at >= ?))
+        ORDER BY status='completed' DESC, id DESC
+        LIMIT 1
+    """, (key, *memo.IN_FLIGHT, cutoff)).fetchone()
+
+def copy_memo_result(conn, job_id, source_id):
+    """Complete `job_id` with the node, prompt and stored outputs of `source_id`"""
+    conn.execute("""
+        UPDATE jobs
+        SET status='completed', completed_at=:now, error_message=NULL,
+            node=(SELECT node FROM jobs WHERE id=:source),
+            node_url=(SELECT node_url FROM jobs WHERE id=:source),
+            comfyui_prompt_id=(SELECT comfyui_prompt_id FROM jobs WHERE id=:source)
+        WHERE id=:job
+    """, {"now": datetime.now(), "source": source_id, "job": job_id})
+    conn.execute("""
+        INSERT OR REPLACE INTO job_results(job_id, prompt_id, outputs, status)
+        SELECT ?, prompt_id, outputs, status FROM job_results WHERE job_id=?
+    """, (job_id, source_id))
+    results_store.cache.discard(job_id)
+    return conn.execute("SELECT node FROM jobs WHERE id=?", (job_id,)).fetchone()[0]
+
+def create_jobs(items, username, memoize=False):
+    """
+    Insert jobs in one transaction and hand the queued ones to the dispatcher.
+
+    Args:
+        items: List of (filename, workflow_json, priority)
+        username: Owner of the jobs
+        memoize: Reuse the result of an identical completed or in-flight job
+
+    Returns:
+        List of {"id", "status", "memo_of"}, in the order of `items`; status
+        is "queued", "completed" (result reused) or "linked" (waiting on
+        the in-flight job `memo_of`)
+    """
+    rows = []
+    for filename, workflow_json, priority in items:
+        blob = workflow_store.blob_row(workflow_json)
+        models = scheduler.extract_models(workflow_json)
+        fingerprint = scheduler.workflow_fingerprint(workflow_json)
+        rows.append((filename, blob, priority, models, fingerprint, memo.memo_key(workflow_json)))
+
+    jobs = []
+    queued_at = datetime.now()
+    with store.transaction() as conn:
+        conn.executemany(workflow_store.INSERT_SQL, {r[1][0]: r[1] for r in rows}.values())
+        for filename, blob, priority, models, fingerprint, key in rows:
+            source = find_memo_source(conn, key) if memoize else None
+            if source is None:
+                status, memo_of = "queued", None
+            elif source["status"] == "completed":
+                status, memo_of = "completed", source["id"]
+            else:
+                status, memo_of = memo.LINKED, source["id"]
+
+            c = conn.execute("""
+                INSERT INTO jobs(filename, status, node, user, workflow_hash, node_url, priority, models,
+                                 fingerprint, memo_key, memo_of, queued_at)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (filename, status, None, username, blob[0], None, priority,
+                  json.dumps(models), fingerprint, key, memo_of, queued_at))
+            node = copy_memo_result(conn, c.lastrowid, memo_of) if status == "completed" else None
+            jobs.append({"id": c.lastrowid, "status": status, "memo_of": memo_of, "node": node})
+
+    for job in jobs:
+        metrics.job_created(job["status"], job.pop("node"))
+
+    # The dispatcher picks a node and submits as soon as one is free
+    enqueue([
+        (job["id"], username, priority, job_meta(models, fingerprint, queued_at))
+        for job, (_, _, priority, models, fingerprint, _) in zip(jobs, rows)
+        if job["status"] == "queued"
+    ])
+    return jobs
+
+def resolve_memo_followers(job_id, status):
+    """
+    Settle jobs linked to `job_id` once it reached a terminal status.
+
+    On completion they share its result. Otherwise the oldest follower is
+    queued to run itself and the others are re-linked to it.
+    """
+    followers = store.read("""
+        SELECT id, user, priority, models, fingerprint, queued_at FROM jobs
+        WHERE memo_of=? AND status=?
+        ORDER BY id
+    """, (job_id, memo.LINKED))
+    if not followers:
+        return
+
+    if status == "completed":
+        with store.transaction() as conn:
+            for row in followers:
+                node = copy_memo_result(conn, row["id"], job_id)
+                metrics.job_moved(memo.LINKED, None, "completed", node)
+        for row in followers:
+            broadcast("job_update", {"id": row["id"], "status": "completed", "memo_of": job_id})
+        return
+
+    lead = followers[0]
+    with store.transaction() as conn:
+        conn.execute("UPDATE jobs SET status='queued', memo_of=NULL WHERE id=?", (lead["id"],))
+        conn.execute("UPDATE jobs SET memo_of=? WHERE memo_of=? AND status=?",
+                     (lead["id"], job_id, memo.LINKED))
+    metrics.job_moved(memo.LINKED, None, "queued", None)
+    broadcast("job_update", {"id": lead["id"], "status": "queued"})
+    enqueue([(lead["id"], lead["user"], lead["priority"] or 0,
+              job_meta(lead["models"], lead["fingerprint"], lead["queued_at"]))])
+
+def memoize_requested():
+    """Memoization choice from the `memoize` / `force` form or query flags"""
+    return memo.wanted(memo.parse_flag(request.values.get("memoize")),
+                       memo.parse_flag(request.values.get("force")))
+
+def parse_batch_request():
+    """
+    Collect (filename, workflow_json, priority) items from a batch upload.
+
+    Accepts multipart `files` (JSON or .zip of JSON files) or a JSON body that
+    is a list of workflows or of {"filename", "workflow", "priority"} objects.
+
+    Returns:
+        Tuple of (items, errors); errors is a list of "name: reason" strings
+    """
+    items, errors = [], []
+
+    try:
+        default_priority = int(request.form.get("priority", 0))
+    except ValueError:
+        return [], ["priority must be an integer"]
+
+    def add(name, content, priority=default_priority):
+        try:
+            if hasattr(content, "read"):
+                workflow_json = json_codec.load_upload(content)
+            elif isinstance(content, (str, bytes)):
+                workflow_json = json_codec.loads(content)
+            else:
+                workflow_json = content
+        except ValueError:
+            errors.append(f"{name}: invalid JSON")
+            return
+        if not isinstance(workflow_json, dict):
+            errors.append(f"{name}: workflow must be a JSON object")
+            return
+        items.append((name, workflow_json, priority))
+
+    if request.files:
+        for file in request.files.getlist("files") + request.files.getlist("file"):
+            if file.filename.lower().endswith(".zip"):
+                try:
+                    with zipfile.ZipFile(file.stream) as archive:
+                        entries = [e for e in archive.infolist()
+                                   if not e.is_dir() and not e.filename.startswith("__MACOSX/")
+                                   and e.filename.lower().endswith(".json")]
+                        # upload_max_mb also bounds the unpacked size, so a
+                        # small zip bomb cannot exhaust memory. Headers can
+                        # lie, hence the running cap while reading as well.
+                        remaining = UPLOAD_MAX_MB * 1024 * 1024
+                        if sum(e.file_size for e in entries) > remaining:
+                            errors.append(f"{file.filename}: unpacks to more than {UPLOAD_MAX_MB} MB")
+                            continue
+                        for entry in entries:
+                            with archive.open(entry) as member:
+                                content = member.read(remaining + 1)
+                            if len(content) > remaining:
+                                errors.append(f"{file.filename}: unpacks to more than {UPLOAD_MAX_MB} MB")
+                                break
+                            remaining -= len(content)
+                            add(os.path.basename(entry.filename), content)
+                except zipfile.BadZipFile:
+                    errors.append(f"{file.filename}: not a valid zip file")
+            else:
+                add(file.filename, file.stream)
+        return items, errors
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, list):
+        return [], ["Expected files, a zip or a JSON array of workflows"]
+    for i, entry in enumerate(body):
+        if isinstance(entry, dict) and "workflow" in entry:
+            try:
+                priority = int(entry.get("priority", default_priority))
+            except (TypeError, ValueError):
+                errors.append(f"item {i}: priority must be an integer")
+                continue
+            add(entry.get("filename") or f"batch-{i}.json", entry["workflow"], priority)
+        else:
+            add(f"batch-{i}.json", entry)
+    return items, errors
+
 # =====================================================
 # --- API route: upload ---
 # =====================================================
@@ -110,110 +499,432 @@ def upload():
         file = request.files["file"]
         filename = file.filename
 
-        # Read and parse workflow JSON
-        workflow_content = file.read().decode('utf-8')
-        workflow_json = json.loads(workflow_content)
-
-        # Select available node
-        node_result = comfyui_client.select_available_node()
-
-        if not node_result:
-            # No nodes available, queue the job
-            conn = sqlite3.connect(DB)
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO jobs(filename, status, node, user, workflow_data, node_url)
-                VALUES(?, ?, ?, ?, ?, ?)
-            """, (filename, "queued", None, username, workflow_content, None))
-            job_id = c.lastrowid
-            conn.commit()
-            conn.close()
-
-            socketio.emit("new_job", {
-                "id": job_id,
-                "file": filename,
-                "user": username,
-                "status": "queued"
-            })
-            return jsonify({"ok": True, "status": "queued", "message": "No nodes available, job queued"}), 202
-
-        node, queue_size = node_result
-
-        # Submit workflow to ComfyUI
-        prompt_id = comfyui_client.submit_workflow_to_comfyui(node.url, workflow_json)
-
-        if not prompt_id:
-            # Submission failed, queue the job
-            conn = sqlite3.connect(DB)
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO jobs(filename, status, node, user, workflow_data, node_url, error_message)
-                VALUES(?, ?, ?, ?, ?, ?, ?)
-            """, (filename, "queued", node.name, username, workflow_content, node.url, "Initial submission failed"))
-            job_id = c.lastrowid
-            conn.commit()
-            conn.close()
-
-            socketio.emit("new_job", {
-                "id": job_id,
-                "file": filename,
-                "user": username,
-                "status": "queued",
-                "error": "Submission failed"
-            })
-            return jsonify({"ok": False, "status": "queued", "message": "Failed to submit to node"}), 500
-
-        # Successfully submitted
-        conn = sqlite3.connect(DB)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO jobs(filename, status, node, user, workflow_data, comfyui_prompt_id, node_url)
-            VALUES(?, ?, ?, ?, ?, ?, ?)
-        """, (filename, "running", node.name, username, workflow_content, prompt_id, node.url))
-        job_id = c.lastrowid
-        conn.commit()
-        conn.close()
-
-        socketio.emit("new_job", {
-            "id": job_id,
+        # Parse straight from the spooled upload; this object is used for storage and scheduling
+        workflow_json = json_codec.load_upload(file.stream)
+        if not isinstance(workflow_json, dict):
+            return jsonify({"ok": False, "error": "Workflow must be a JSON object"}), 400
+
+        try:
+            priority = int(request.form.get("priority", 0))
+        except ValueError:
+            return jsonify({"ok": False, "error": "priority must be an integer"}), 400
+
+        job = create_jobs([(filename, workflow_json, priority)], username,
+                          memoize=memoize_requested())[0]
+
+        broadcast("new_job", {
+            "id": job["id"],
             "file": filename,
             "user": username,
-            "status": "running",
-            "node": node.name
+            "status": job["status"]
         })
 
-        return jsonify({
-            "ok": True,
-            "status": "running",
-            "job_id": job_id,
-            "node": node.name,
-            "prompt_id": prompt_id
-        })
+        return jsonify({"ok": True, "status": job["status"], "job_id": job["id"],
+                        "memo_of": job["memo_of"]}), 202
 
-    except json.JSONDecodeError as e:
+    except ValueError:
         return jsonify({"ok": False, "error": "Invalid JSON workflow"}), 400
     except Exception as e:
-        print(f"Upload error: {e}")
+        logger.error("Upload error: %s", e)
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+# =====================================================
+# --- API route: batch upload ---
+# =====================================================
+@app.route("/upload/batch", methods=["POST"])
+@jwt_required()
+def upload_batch():
+    """
+    Queue many workflows at once.
+
+    All jobs are inserted in one transaction: if any item is invalid nothing
+    is queued and the errors are returned.
+    """
+    username = get_jwt_identity()
+
+    try:
+        items, errors = parse_batch_request()
+        if errors:
+            return jsonify({"ok": False, "error": "Invalid batch", "details": errors}), 400
+        if not items:
+            return jsonify({"ok": False, "error": "No workflows in batch"}), 400
+        if len(items) > BATCH_MAX_JOBS:
+            return jsonify({"ok": False, "error": f"Batch exceeds {BATCH_MAX_JOBS} jobs"}), 413
+
+        jobs = create_jobs(items, username, memoize=memoize_requested())
+        job_ids = [job["id"] for job in jobs]
+        reused = sum(1 for job in jobs if job["memo_of"] is not None)
+
+        broadcast("new_jobs", {
+            "ranges": id_ranges(job_ids),
+            "user": username,
+            "count": len(job_ids),
+            "status": "queued"
+        })
+
+        return jsonify({"ok": True, "status": "queued", "job_ids": job_ids, "count": len(job_ids),
+                        "reused": reused}), 202
+
+    except Exception as e:
+        logger.error("Batch upload error: %s", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
 # =====================================================
-# --- API route: get jobs ---
+# --- API route: parameter sweep upload ---
 # =====================================================
+SWEEP_MAX_JOBS = CONFIG.get("sweep_max_jobs", 10000)
+
+def create_sweep(filename, template, sweep, spec, priority, username):
+    """
+    Store a sweep template once and queue one lightweight job per combination.
+
+    Job rows carry only sweep_id/sweep_index; dispatch_job() builds each
+    job's workflow from the template when it is submitted.
+
+    Returns:
+        Tuple of (sweep_id, job_ids)
+    """
+    blob = workflow_store.blob_row(template)
+    models = scheduler.extract_models(template)
+    fingerprint = scheduler.workflow_fingerprint(template)
+    per_job_models = sweep.sweeps_models()
+    queued_at = datetime.now()
+
+    def job_rows(sweep_id):
+        for index in range(sweep.total):
+            job_models, job_fingerprint = models, fingerprint
+            if per_job_models:
+                workflow_json = sweeps.expand(template, sweep, index)
+                job_models = scheduler.extract_models(workflow_json)
+                job_fingerprint = scheduler.workflow_fingerprint(workflow_json)
+            yield (f"{filename}#{index}", "queued", username, blob[0], priority,
+                   json.dumps(job_models), job_fingerprint, sweep_id, index, queued_at)
+
+    with store.transaction() as conn:
+        conn.execute(workflow_store.INSERT_SQL, blob)
+        sweep_id = conn.execute("""
+            INSERT INTO sweeps(user, filename, workflow_hash, spec, total, priority)
+            VALUES(?, ?, ?, ?, ?, ?)
+        """, (username, filename, blob[0], json.dumps(spec), sweep.total, priority)).lastrowid
+        conn.executemany("""
+            INSERT INTO jobs(filename, status, user, workflow_hash, priority, models, fingerprint,
+                             sweep_id, sweep_index, queued_at)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, job_rows(sweep_id))
+        rows = conn.execute("""
+            SELECT id, models, fingerprint FROM jobs WHERE sweep_id=? ORDER BY sweep_index
+        """, (sweep_id,)).fetchall()
+
+    # Drop anything cached under this id before its jobs can be dispatched
+    forget_sweep(sweep_id)
+    metrics.job_created("queued", count=len(rows))
+    enqueue([
+        (job_id, username, priority, job_meta(job_models, job_fingerprint, queued_at))
+        for job_id, job_models, job_fingerprint in rows
+    ])
+    return sweep_id, [row[0] for row in rows]
+
+@app.route("/upload/sweep", methods=["POST"])
+@jwt_required()
+def upload_sweep():
+    """
+    Queue a parameter sweep over one workflow.
+
+    Accepts a multipart `file` with a `sweep` form field (JSON spec), or a
+    JSON body {"filename", "workflow", "sweep", "priority"}. See sweeps.py
+    for the spec format.
+    """
+    username = get_jwt_identity()
+
+    try:
+        if request.files:
+            file = request.files["file"]
+            filename = file.filename
+            template = json_codec.load_upload(file.stream)
+            spec = json.loads(request.form.get("sweep", "null"))
+            priority = request.form.get("priority", 0)
+        else:
+            body = request.get_json(silent=True) or {}
+            filename = body.get("filename") or "sweep.json"
+            template = body.get("workflow")
+            spec = body.get("sweep")
+            priority = body.get("priority", 0)
+
+        try:
+            priority = int(priority)
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": "priority must be an integer"}), 400
+        if not isinstance(template, dict):
+            return jsonify({"ok": False, "error": "workflow must be a JSON object"}), 400
+
+        try:
+            sweep = sweeps.parse(spec, template)
+        except sweeps.SweepError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+        if sweep.total > SWEEP_MAX_JOBS:
+            return jsonify({"ok": False, "error": f"Sweep exceeds {SWEEP_MAX_JOBS} jobs"}), 413
+
+        sweep_id, job_ids = create_sweep(filename, template, sweep, spec, priority, username)
+
+        broadcast("new_jobs", {
+            "ranges": id_ranges(job_ids),
+            "user": username,
+            "count": len(job_ids),
+            "sweep_id": sweep_id,
+            "status": "queued"
+        })
+
+        return jsonify({"ok": True, "status": "queued", "sweep_id": sweep_id,
+                        "job_ids": job_ids, "count": len(job_ids)}), 202
+
+    except json.JSONDecodeError:
+        return jsonify({"ok": False, "error": "Invalid JSON workflow or sweep"}), 400
+    except Exception as e:
+        logger.error("Sweep upload error: %s", e)
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+# =====================================================
+# --- API route: sweep progress and results ---
+# =====================================================
+# sweep_id -> (template, Sweep), least recently used first. Misses are not
+# cached: a sweep looked up before it exists must be found once it does.
+SWEEP_CACHE_SIZE = 64
+sweep_cache = OrderedDict()
+sweep_cache_lock = threading.Lock()
+
+def load_sweep(sweep_id):
+    """(template, Sweep) for a sweep; both are immutable once created"""
+    with sweep_cache_lock:
+        loaded = sweep_cache.get(sweep_id)
+        if loaded is not None:
+            sweep_cache.move_to_end(sweep_id)
+            return loaded
+
+    row = store.read_one("SELECT workflow_hash, spec FROM sweeps WHERE id=?", (sweep_id,))
+    if not row:
+        return None
+    template = workflow_store.load(store, row["workflow_hash"])
+    if template is None:
+        return None
+    loaded = (template, sweeps.load(row["spec"], template))
+
+    with sweep_cache_lock:
+        sweep_cache[sweep_id] = loaded
+        while len(sweep_cache) > SWEEP_CACHE_SIZE:
+            sweep_cache.popitem(last=False)
+    return loaded
+
+def forget_sweep(sweep_id):
+    with sweep_cache_lock:
+        sweep_cache.pop(sweep_id, None)
+
+@app.route("/api/sweeps/<int:sweep_id>", methods=["GET"])
+@jwt_required()
+def get_sweep(sweep_id):
+    row = store.read_one("""
+        SELECT id, user, filename, spec, total, priority, created_at FROM sweeps WHERE id=?
+    """, (sweep_id,))
+    if not row:
+        return jsonify({"error": "Sweep not found"}), 404
+
+    counts = store.read("SELECT status, COUNT(*) AS n FROM jobs WHERE sweep_id=? GROUP BY status", (sweep_id,))
+    sweep = dict(row)
+    sweep["spec"] = json.loads(row["spec"])
+    sweep["progress"] = sweeps.progress({r["status"]: r["n"] for r in counts}, row["total"])
+    return jsonify(sweep)
+
+@app.route("/api/sweeps/<int:sweep_id>/results", methods=["GET"])
+@jwt_required()
+def get_sweep_results(sweep_id):
+    """
+    Per-job parameters, status and outputs of a sweep, in sweep order.
+
+    Query params:
+        after: last sweep_index already received (default -1)
+        limit: max jobs (default 100, max 1000)
+    """
+    loaded = load_sweep(sweep_id)
+    if not loaded:
+        return jsonify({"error": "Sweep not found"}), 404
+    _, sweep = loaded
+
+    try:
+        after = int(request.args.get("after", -1))
+        limit = min(max(int(request.args.get("limit", JOBS_PAGE_SIZE)), 1), JOBS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "after and limit must be integers"}), 400
+
+    rows = store.read("""
+        SELECT j.id, j.sweep_index, j.status, j.node, j.error_message, j.completed_at,
+               r.prompt_id, r.outputs, r.status AS result_status
+        FROM jobs j LEFT JOIN job_results r ON r.job_id = j.id
+        WHERE j.sweep_id=? AND j.sweep_index > ?
+        ORDER BY j.sweep_index
+        LIMIT ?
+    """, (sweep_id, after, limit + 1))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    jobs = []
+    for row in rows:
+        results = None
+        if row["outputs"] is not None:
+            results = with_cached_image_urls(row["id"], results_store.build(
+                row["prompt_id"], json.loads(row["outputs"]), json.loads(row["result_status"])))
+        jobs.append({
+            "id": row["id"],
+            "index": row["sweep_index"],
+            "params": sweeps.describe(sweep.overrides(row["sweep_index"])),
+            "status": row["status"],
+            "node": row["node"],
+            "error_message": row["error_message"],
+            "completed_at": row["completed_at"],
+            "results": results,
+        })
+
+    return jsonify({
+        "jobs": jobs,
+        "cursor": rows[-1]["sweep_index"] if rows else after,
+        "has_more": has_more
+    })
+
+JOB_COLUMNS = [
+    "id", "filename", "status", "node", "user", "created_at", "completed_at",
+    "error_message", "comfyui_prompt_id", "node_url", "version", "sweep_id", "sweep_index", "memo_of",
+    "queued_at", "dispatched_at", "started_at", "finished_at", "attempts"
+]
+DEFAULT_JOB_COLUMNS = [
+    "id", "filename", "status", "node", "user", "created_at", "completed_at",
+    "error_message", "comfyui_prompt_id", "version"
+]
+JOBS_PAGE_SIZE = 100
+JOBS_MAX_PAGE_SIZE = 1000
+
+def encode_jobs_cursor(created_at, job_id):
+    raw = json.dumps([created_at, job_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_jobs_cursor(cursor):
+    created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return created_at, int(job_id)
+
 @app.route("/api/jobs", methods=["GET"])
 @jwt_required()
 def get_jobs():
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, filename, status, node, user, created_at, completed_at, error_message, comfyui_prompt_id
+    """
+    List jobs newest first, one page at a time.
+
+    Query params:
+        limit: page size (default 100, max 1000)
+        cursor: next_cursor from the previous page
+        status, user, node: filters (comma-separated for several values)
+        since, until: created_at range ("YYYY-MM-DD HH:MM:SS", inclusive/exclusive)
+        fields: comma-separated columns to return
+    """
+    fields = request.args.get("fields")
+    if fields:
+        columns = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in columns if f not in JOB_COLUMNS]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    else:
+        columns = list(DEFAULT_JOB_COLUMNS)
+    # The cursor is built from these, so always select them
+    selected = list(dict.fromkeys(columns + ["created_at", "id"]))
+
+    try:
+        limit = min(max(int(request.args.get("limit", JOBS_PAGE_SIZE)), 1), JOBS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    where = []
+    params = []
+    for column in ("status", "user", "node"):
+        value = request.args.get(column)
+        if value:
+            values = [v for v in value.split(",") if v]
+            where.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    if request.args.get("since"):
+        where.append("created_at >= ?")
+        params.append(request.args["since"])
+    if request.args.get("until"):
+        where.append("created_at < ?")
+        params.append(request.args["until"])
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_jobs_cursor(cursor)
+        except Exception:
+            return jsonify({"error": "Invalid cursor"}), 400
+        where.append("(created_at, id) < (?, ?)")
+        params.extend([cursor_created_at, cursor_id])
+
+    query = f"SELECT {', '.join(selected)} FROM jobs"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+
+    rows = store.read(query, params)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_jobs_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    jobs = [{k: row[k] for k in columns} for row in rows]
+    return jsonify({"jobs": jobs, "next_cursor": next_cursor})
+
+# =====================================================
+# --- API route: job change feed ---
+# =====================================================
+@app.route("/api/jobs/changes", methods=["GET"])
+@jwt_required()
+def get_job_changes():
+    """
+    Return jobs written after a version cursor, oldest change first.
+
+    Query params:
+        since: last version the client has seen (default 0)
+        limit: max rows (default 100, max 1000)
+
+    Pass the returned `cursor` as `since` on the next call; keep calling while
+    `has_more` is true.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        limit = min(max(int(request.args.get("limit", JOBS_PAGE_SIZE)), 1), JOBS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+
+    rows = store.read(f"""
+        SELECT {', '.join(DEFAULT_JOB_COLUMNS)}
         FROM jobs
-        ORDER BY created_at DESC
-    """)
-    rows = c.fetchall()
-    conn.close()
-    jobs = [dict(row) for row in rows]
-    return jsonify(jobs)
+        WHERE version > ?
+        ORDER BY version ASC
+        LIMIT ?
+    """, (since, limit + 1))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1]["version"] if rows else since
+
+    return jsonify({
+        "changes": [dict(row) for row in rows],
+        "cursor": cursor,
+        "has_more": has_more
+    })
+
+# =====================================================
+# --- API route: job store write stats ---
+# =====================================================
+@app.route("/api/jobs/store-stats", methods=["GET"])
+@jwt_required()
+def get_store_stats():
+    return jsonify(store.stats())
 
 # =====================================================
 # --- API route: get job results ---
@@ -221,12 +932,7 @@ def get_jobs():
 @app.route("/api/jobs/<int:job_id>/results", methods=["GET"])
 @jwt_required()
 def get_job_results(job_id):
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT comfyui_prompt_id, node_url, status FROM jobs WHERE id=?", (job_id,))
-    job = c.fetchone()
-    conn.close()
+    job = store.read_one("SELECT comfyui_prompt_id, node_url, status FROM jobs WHERE id=?", (job_id,))
 
     if not job:
         return jsonify({"error": "Job not found"}), 404
@@ -234,31 +940,156 @@ def get_job_results(job_id):
     if job["status"] != "completed":
         return jsonify({"error": "Job not completed yet"}), 400
 
-    if not job["comfyui_prompt_id"] or not job["node_url"]:
-        return jsonify({"error": "No ComfyUI data available"}), 400
+    results = results_store.get(store, job_id)
+    if results is None:
+        # Jobs completed before results were persisted: fetch once and keep them
+        if not job["comfyui_prompt_id"] or not job["node_url"]:
+            return jsonify({"error": "No ComfyUI data available"}), 400
+
+        results = comfyui_client.get_job_results(job["node_url"], job["comfyui_prompt_id"])
+        if "error" in results:
+            return jsonify(results)
+        results_store.save(store, job_id, results)
+
+    return jsonify(with_cached_image_urls(job_id, results))
+
+def with_cached_image_urls(job_id, results):
+    """Copy of a results payload with backend image/thumbnail URLs added"""
+    token = image_token(job_id)
+    outputs = {}
+    for output_node, output_data in results.get("outputs", {}).items():
+        if "images" not in output_data:
+            outputs[output_node] = output_data
+            continue
+        images = []
+        for index, image in enumerate(output_data["images"]):
+            cached_url = f"/api/jobs/{job_id}/images/{output_node}/{index}?token={token}"
+            images.append(dict(
+                image,
+                cached_url=cached_url,
+                thumbnail_url=f"{cached_url}&size={THUMBNAIL_SIZES[1]}"
+            ))
+        outputs[output_node] = dict(output_data, images=images)
+    return dict(results, outputs=outputs)
 
-    results = comfyui_client.get_job_results(job["node_url"], job["comfyui_prompt_id"])
-    return jsonify(results)
+# =====================================================
+# --- API route: cached job output image ---
+# =====================================================
+IMAGE_MAX_AGE = 365 * 24 * 3600
+# Image URLs are signed for one window and stay valid through the next,
+# so a URL is stable (and browser-cacheable) for at least this long
+IMAGE_TOKEN_WINDOW = CONFIG.get("image_token_window_seconds", 3600)
+
+def _image_signature(job_id, expires):
+    key = app.config["JWT_SECRET_KEY"].encode("utf-8")
+    return hmac.new(key, f"image:{job_id}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def image_token(job_id):
+    """Signed query token granting <img> tags access to one job's images"""
+    expires = (int(time.time()) // IMAGE_TOKEN_WINDOW + 2) * IMAGE_TOKEN_WINDOW
+    return f"{expires}.{_image_signature(job_id, expires)}"
+
+def image_token_valid(job_id, token):
+    expires, _, signature = (token or "").partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _image_signature(job_id, int(expires)))
+
+@app.route("/api/jobs/<int:job_id>/images/<output_node>/<int:index>", methods=["GET"])
+def get_job_image(job_id, output_node, index):
+    """
+    Serve an output image (or ?size=128|256|512 thumbnail) from the local cache.
+
+    Authorized by either a JWT or the ?token= that get_job_results puts in
+    cached_url/thumbnail_url, since <img> tags cannot send the header.
+    The image is fetched from the node on first request only. Output files
+    never change, so responses carry a strong ETag and an immutable max-age.
+    """
+    if not image_token_valid(job_id, request.args.get("token")):
+        verify_jwt_in_request()
+
+    job = store.read_one("SELECT node_url FROM jobs WHERE id=?", (job_id,))
+    results = results_store.get(store, job_id)
+    if not job or not results:
+        return jsonify({"error": "No results for job"}), 404
+
+    try:
+        image = results["outputs"][output_node]["images"][index]
+    except (KeyError, IndexError):
+        return jsonify({"error": "Image not found"}), 404
+
+    size = request.args.get("size", type=int)
+    try:
+        file, etag, mimetype = image_cache.get(job["node_url"], image, size)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("Image fetch error for job %s: %s", job_id, e)
+        return jsonify({"error": "Image unavailable"}), 502
+
+    if request.if_none_match.contains(etag):
+        file.close()
+        response = app.response_class(status=304)
+    else:
+        response = send_file(file, mimetype=mimetype, conditional=False, etag=False)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+# =====================================================
+# --- API route: stage timing percentiles ---
+# =====================================================
+@app.route("/api/stats", methods=["GET"])
+@jwt_required()
+def get_stats():
+    """
+    p50/p95/p99 seconds per job stage (see stage_stats), from hourly rollups.
+
+    Query params:
+        window: how far back, e.g. 90m, 24h, 7d (default 24h)
+        group_by: node or user (default: no grouping)
+        node, user, stage: filters
+    """
+    try:
+        window = stage_stats.parse_window(request.args.get("window", "24h"))
+    except ValueError:
+        return jsonify({"error": "window must be seconds or a number with s/m/h/d"}), 400
+    group_by = request.args.get("group_by")
+    if group_by not in (None, "", "node", "user"):
+        return jsonify({"error": "group_by must be node or user"}), 400
+    stage = request.args.get("stage")
+    if stage and stage not in stage_stats.STAGES:
+        return jsonify({"error": f"stage must be one of {', '.join(stage_stats.STAGES)}"}), 400
+
+    since = time.time() - window
+    return jsonify({
+        "window_seconds": window,
+        "since": datetime.fromtimestamp(since).isoformat(),
+        "group_by": group_by or None,
+        "stages": stage_stats.query(store, since, group_by=group_by, node=request.args.get("node"),
+                                    user=request.args.get("user"), stage=stage)
+    })
+
+# =====================================================
+# --- Prometheus metrics ---
+# =====================================================
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return app.response_class(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
 
 # =====================================================
 # --- API route: retry failed job ---
 # =====================================================
 @app.route("/api/jobs/<int:job_id>/retry", methods=["POST"])
 @jwt_required()
+@admin_required(error="Admin access required")
 def retry_job(job_id):
-    username = get_jwt_identity()
-    from models import User
-    user = User.query.filter_by(username=username).first()
-
-    if not user or user.role != "admin":
-        return jsonify({"error": "Admin access required"}), 403
-
-    conn = sqlite3.connect(DB)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute("SELECT workflow_data, status FROM jobs WHERE id=?", (job_id,))
-    job = c.fetchone()
-    conn.close()
+    job = store.read_one("""
+        SELECT workflow_hash, workflow_data, status, node, user, priority, models, fingerprint
+        FROM jobs WHERE id=?
+    """, (job_id,))
 
     if not job:
         return jsonify({"error": "Job not found"}), 404
@@ -266,85 +1097,96 @@ def retry_job(job_id):
     if job["status"] not in ["failed", "queued"]:
         return jsonify({"error": "Can only retry failed or queued jobs"}), 400
 
-    if not job["workflow_data"]:
+    if not job["workflow_hash"] and not job["workflow_data"]:
         return jsonify({"error": "No workflow data available"}), 400
 
-    try:
-        # Select node and submit
-        node_result = comfyui_client.select_available_node()
-
-        if not node_result:
-            # No nodes available, requeue
-            conn = sqlite3.connect(DB)
-            c = conn.cursor()
-            c.execute("UPDATE jobs SET status=?, error_message=NULL WHERE id=?", ("queued", job_id))
-            conn.commit()
-            conn.close()
-            return jsonify({"ok": True, "status": "queued", "message": "No nodes available, job requeued"})
-
-        node, _ = node_result
-        workflow_json = json.loads(job["workflow_data"])
-        prompt_id = comfyui_client.submit_workflow_to_comfyui(node.url, workflow_json)
-
-        if not prompt_id:
-            return jsonify({"ok": False, "error": "Failed to submit to node"}), 500
-
-        # Update job
-        conn = sqlite3.connect(DB)
-        c = conn.cursor()
-        c.execute("""
-            UPDATE jobs
-            SET status=?, node=?, node_url=?, comfyui_prompt_id=?, error_message=NULL
-            WHERE id=?
-        """, ("running", node.name, node.url, prompt_id, job_id))
-        conn.commit()
-        conn.close()
-
-        socketio.emit("job_update", {
-            "id": job_id,
-            "status": "running",
-            "node": node.name
-        })
+    # A retry starts a new turnaround; attempts keep counting
+    queued_at = datetime.now()
+    store.write("""
+        UPDATE jobs
+        SET status=?, error_message=NULL, queued_at=?, dispatched_at=NULL, started_at=NULL, finished_at=NULL
+        WHERE id=?
+    """, ("queued", queued_at, job_id))
+    if job["status"] != "queued":
+        metrics.job_moved(job["status"], job["node"], "queued", None)
 
-        return jsonify({"ok": True, "status": "running", "node": node.name, "prompt_id": prompt_id})
+    broadcast("job_update", {"id": job_id, "status": "queued"})
+    enqueue([(job_id, job["user"], job["priority"] or 0,
+              job_meta(job["models"], job["fingerprint"], queued_at))])
 
-    except Exception as e:
-        print(f"Retry error: {e}")
-        return jsonify({"ok": False, "error": str(e)}), 500
+    return jsonify({"ok": True, "status": "queued", "message": "Job requeued"})
 
 # =====================================================
-# ✅ FRONTEND SERVING (SPA-safe with console tracing)
+# ✅ FRONTEND SERVING (SPA-safe, traced at DEBUG)
 # =====================================================
-from flask import send_from_directory
+# Frontend build index; see static_assets
+STATIC_MAX_AGE = 365 * 24 * 3600
+static_index = StaticIndex(DIST_DIR, check_interval=CONFIG.get("static_check_interval", 2))
 
 @app.before_request
 def log_request_info():
-    print(f"[REQ] {time.strftime('%H:%M:%S')} {request.method} {request.path}")
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def log_request_done(response):
+    if request_log.isEnabledFor(logging.INFO):
+        elapsed = time.perf_counter() - g.get("request_started", time.perf_counter())
+        request_log.info("%s %s %s", request.method, request.path, response.status_code,
+                         extra={"status": response.status_code, "ms": round(elapsed * 1000, 1)})
+    return response
 
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def serve_react_app(path):
     """
-    Serve React frontend for all non-API routes.
-    Includes console tracing to verify fallback.
+    Serve React frontend for all non-API routes from the in-memory build index.
+    Tracing goes to the comfyqueue.static logger at DEBUG.
     """
-    # --- Log every call for debug ---
-    print(f"[ROUTE] Checking path='{path}'")
-
     # 1️⃣ If path starts with an API or asset route — let Flask handle it
     if path.startswith("api/") or path.startswith("upload"):
-        print(f"[SKIP] '{path}' belongs to backend/api — returning 404 passthrough")
+        static_log.debug("'%s' belongs to backend/api — returning 404 passthrough", path)
         return "Not Found", 404
 
-    # 2️⃣ If it's an existing file (JS, CSS, image), serve directly
-    full_path = os.path.join(app.static_folder, path)
-    if os.path.exists(full_path) and not os.path.isdir(full_path):
-        print(f"[STATIC] Serving existing static file: {full_path}")
-        return send_from_directory(app.static_folder, path)
-
-    # 3️⃣ Otherwise — fallback to React index.html
-    print(f"[FALLBACK] No match. Serving index.html for React route -> {path}")
-    return send_from_directory(app.static_folder, "index.html")
+    accepted = [value for value, _ in request.accept_encodings]
+
+    # 2️⃣ If it's a file of the build (JS, CSS, image), serve it, precompressed if possible
+    asset = static_index.lookup(path)
+    if asset:
+        encoding, file_path = asset.choose(accepted)
+        static_log.debug("Serving static file %s (%s)", file_path, encoding or "identity")
+        etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = send_file(file_path, mimetype=asset.mimetype, conditional=False, etag=False)
+        if asset.immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return static_response(response, etag, encoding)
+
+    # 3️⃣ Otherwise — fallback to React index.html (held in memory)
+    static_log.debug("No match. Serving index.html for React route -> %s", path)
+    body, encoding, etag = static_index.index_html(accepted)
+    if body is None:
+        return "Not Found", 404
+    etag = f"{etag}-{encoding}" if encoding else etag
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="text/html")
+    response.cache_control.no_cache = True
+    return static_response(response, etag, encoding)
+
+def static_response(response, etag, encoding):
+    """Headers shared by every frontend response"""
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    if encoding and response.status_code != 304:
+        response.headers["Content-Encoding"] = encoding
+    return response
 
 # =====================================================
 # --- Debug endpoint to confirm static root ---
@@ -364,140 +1206,630 @@ print("Registered routes:")
 for rule in app.url_map.iter_rules():
     print(" •", rule)
 
+# =====================================================
+# --- Dispatcher ---
+# =====================================================
+def dispatch_job(job_id, node):
+    """
+    Dispatcher callback: submit one queued job to the selected node.
+
+    Returns:
+        True if submitted, False to retry later, None if the job should be
+        dropped (gone, failed, or rejected by the node)
+    """
+    if not is_leader():
+        # Lease lapsed; keep the job until leadership is confirmed again
+        return False
+
+    row = store.read_one("""
+        SELECT workflow_hash, workflow_data, status, sweep_id, sweep_index, queued_at FROM jobs WHERE id=?
+    """, (job_id,))
+
+    if not row or row["status"] != "queued":
+        # Deleted, or already handled elsewhere
+        return None
+
+    if row["sweep_id"] is not None:
+        # Sweep jobs are expanded from the shared template only now
+        loaded = load_sweep(row["sweep_id"])
+        workflow_json = sweeps.expand(loaded[0], loaded[1], row["sweep_index"]) if loaded else None
+    else:
+        workflow_json = workflow_store.load_for_job(store, row["workflow_hash"], row["workflow_data"])
+    if workflow_json is None:
+        apply_job_status(job_id, "failed", "No workflow data available", from_statuses=("queued",))
+        return None
+
+    # Taken before the POST: an idle node may start the prompt (started_at)
+    # before /prompt even returns
+    dispatched_at = datetime.now()
+    try:
+        if runtime:
+            prompt_id = runtime.call(aio_client.submit_workflow_to_comfyui(node.url, workflow_json))
+        else:
+            prompt_id = comfyui_client.submit_workflow_to_comfyui(node.url, workflow_json)
+    except comfyui_client.PromptRejectedError as e:
+        # Invalid workflow or similar: every node would refuse it the same way
+        store.defer("UPDATE jobs SET attempts=COALESCE(attempts, 0) + 1 WHERE id=?", (job_id,))
+        apply_job_status(job_id, "failed", f"Rejected by {node.name}: {e}", from_statuses=("queued",))
+        return None
+
+    if not prompt_id:
+        store.defer("UPDATE jobs SET attempts=COALESCE(attempts, 0) + 1 WHERE id=?", (job_id,))
+        store.transition(job_id, {"error_message": f"Submission to {node.name} failed"},
+                         from_statuses=("queued",))
+        return False
+
+    # Written immediately rather than batched: WebSocket events for this
+    # prompt are looked up by comfyui_prompt_id as soon as the node starts it.
+    # The lease fence keeps a worker that lost leadership during the POST
+    # from recording a dispatch the new leader may be making as well.
+    fence, fence_params = leader_fence()
+    c = store.write(f"""
+        UPDATE jobs
+        SET status=?, node=?, node_url=?, comfyui_prompt_id=?, error_message=NULL, dispatched_at=?,
+            attempts=COALESCE(attempts, 0) + 1
+        WHERE id=? AND status='queued' AND {fence}
+    """, ("running", node.name, node.url, prompt_id, dispatched_at, job_id, *fence_params))
+    if not c.rowcount:
+        # Lost the lease, or the job was deleted/handled meanwhile: take the prompt back
+        logger.warning("Dispatch of job %s not recorded; cancelling prompt %s on %s", job_id, prompt_id, node.name)
+        comfyui_client.cancel_prompt(node.url, prompt_id)
+        return None
+
+    # Counted against the node only now that it holds the job; failed or
+    # fenced-off submissions never inflate its queue
+    node_state.record_dispatch(node.name)
+    metrics.job_moved("queued", None, "running", node.name)
+    # From the latest (re)queue, so retried jobs don't report their whole age
+    queued_at = parse_timestamp(row["queued_at"])
+    if queued_at:
+        metrics.dispatch_latency.observe((dispatched_at - queued_at).total_seconds(), node.name)
+
+    broadcast("job_update", {
+        "id": job_id,
+        "status": "running",
+        "node": node.name
+    })
+    return True
+
+def job_meta(models, fingerprint, queued_at=None):
+    """
+    Scheduling hints for the dispatcher; `models` is a list or its JSON.
+
+    `queued_at` is the row's queued_at (datetime or stored string), so queue
+    age and affinity waits survive restarts, re-elections and requeues.
+    """
+    if isinstance(models, str):
+        models = json.loads(models)
+    queued_at = parse_timestamp(queued_at)
+    return {"models": models or [], "fingerprint": fingerprint,
+            "queued_at": queued_at.timestamp() if queued_at else time.time()}
+
+scheduler.configure(CONFIG)
+node_health.configure(CONFIG)
+memo.configure(CONFIG)
+
+dispatcher = Dispatcher(
+    dispatch_job,
+    scheduler.select_node,
+    user_weights=CONFIG.get("user_weights"),
+    idle_wait=CONFIG.get("node_refresh_interval", 3),
+    begin_pass=scheduler.enabled_node_names
+)
+
+def enqueue(jobs):
+    """
+    Hand (job_id, user, priority, meta) jobs to the dispatcher.
+
+    In multi-worker mode only the leader's dispatcher runs; other workers
+    just wake it, and it picks the rows up in sync_queued_jobs().
+    """
+    if is_leader():
+        dispatcher.submit_many(jobs)
+    else:
+        event_broker.publish({"type": "wake"})
+
+def seed_job_metrics():
+    """Initialize the per status/node job counts once; transitions keep them current"""
+    rows = store.read("""
+        SELECT status, CASE WHEN status IN ('queued', 'linked') THEN NULL ELSE node END AS node,
+               COUNT(*) AS n
+        FROM jobs GROUP BY 1, 2
+    """)
+    metrics.seed_job_counts((row["status"], row["node"], row["n"]) for row in rows)
+
+def oldest_queued_age():
+    queued_at = dispatcher.oldest_queued_at()
+    return time.time() - queued_at if queued_at else 0
+
+metrics.queue_depth.collect = dispatcher.pending
+metrics.oldest_queued_age.collect = oldest_queued_age
+metrics.log_records_dropped.collect = lambda: log_setup.dropped
+
+def load_queued_jobs():
+    """Seed the dispatcher with jobs left queued by a previous run"""
+    rows = store.read("""
+        SELECT id, user, priority, models, fingerprint, queued_at FROM jobs
+        WHERE status='queued'
+        ORDER BY created_at, id
+    """)
+    dispatcher.load([
+        (row["id"], row["user"], row["priority"], job_meta(row["models"], row["fingerprint"], row["queued_at"]))
+        for row in rows
+    ])
+    print(f"Loaded {len(rows)} queued jobs into dispatcher")
+
+    # Linked jobs whose source finished while the server was down
+    sources = store.read(f"""
+        SELECT DISTINCT f.memo_of AS id, s.status FROM jobs f LEFT JOIN jobs s ON s.id = f.memo_of
+        WHERE f.status=? AND (s.status IS NULL OR s.status NOT IN ({','.join('?' * len(memo.IN_FLIGHT))}))
+    """, (memo.LINKED, *memo.IN_FLIGHT))
+    for row in sources:
+        resolve_memo_followers(row["id"], row["status"])
+
+def record_job_duration(job_id):
+    """Feed a completed job into the scheduler's duration statistics"""
+    row = store.read_one("""
+        SELECT node, fingerprint, dispatched_at, completed_at FROM jobs WHERE id=?
+    """, (job_id,))
+    if not row or not row["node"]:
+        return
+    dispatched_at = parse_timestamp(row["dispatched_at"])
+    completed_at = parse_timestamp(row["completed_at"])
+    if dispatched_at and completed_at:
+        scheduler.durations.record(row["node"], row["fingerprint"], dispatched_at, completed_at)
+        metrics.execution_duration.observe((completed_at - dispatched_at).total_seconds(), row["node"])
+
+def seed_duration_stats(limit=2000):
+    """Warm the duration statistics from recent completions"""
+    rows = store.read("""
+        SELECT node, fingerprint, dispatched_at, completed_at FROM jobs
+        WHERE status='completed' AND dispatched_at IS NOT NULL
+        ORDER BY completed_at DESC
+        LIMIT ?
+    """, (limit,))
+    for row in reversed(rows):
+        dispatched_at = parse_timestamp(row["dispatched_at"])
+        completed_at = parse_timestamp(row["completed_at"])
+        if row["node"] and dispatched_at and completed_at:
+            scheduler.durations.record(row["node"], row["fingerprint"], dispatched_at, completed_at)
+
+# =====================================================
+# --- Job status transitions ---
+# =====================================================
+# Seconds between full /history reconciliation passes while WebSocket
+# listeners are connected. Jobs on nodes without a live listener are still
+# checked on every poller pass.
+POLL_INTERVAL = CONFIG.get("poll_interval", 10)
+RECONCILE_INTERVAL = CONFIG.get("reconcile_interval", 120)
+# Set to make the poller reconcile on its next pass (e.g. after a re-election)
+reconcile_requested = threading.Event()
+NODE_REFRESH_INTERVAL = CONFIG.get("node_refresh_interval", 3)
+
+# "threads" (default) or "asyncio": see aio_runtime
+runtime = None
+if CONFIG.get("runtime", "threads") == "asyncio":
+    if aio_client.available():
+        runtime = AsyncRuntime(app, max_concurrency=CONFIG.get("async_max_concurrency", 256))
+    else:
+        print("runtime=asyncio needs aiohttp; falling back to threads")
+
+def apply_job_status(job_id, new_status, error=None, from_statuses=("running", "submitted"),
+                     results=None, started_at=None, finished_at=None):
+    """
+    Move an in-flight job to a terminal status.
+
+    Safe to call from both the WebSocket listeners and the poller: the job
+    store only accepts the transition while the job is still in one of
+    `from_statuses`, so it is applied (and emitted) exactly once. The row is
+    written with the next batch; the socket event is sent after the commit.
+
+    `results` (see results_store) is committed together with a completion.
+    `started_at` / `finished_at` are the node's own execution times, when known.
+    """
+    if new_status == "completed":
+        fields = {"status": "completed", "completed_at": datetime.now(), "error_message": None}
+        event = {"id": job_id, "status": "completed"}
+    elif new_status == "failed":
+        fields = {"status": "failed", "error_message": error}
+        event = {"id": job_id, "status": "failed", "error": error}
+    else:
+        return False
+    fields["finished_at"] = finished_at or datetime.now()
+    if started_at:
+        fields["started_at"] = started_at
+
+    def on_commit():
+        if new_status == "completed":
+            job_log.info("Job %s completed", job_id)
+            record_job_duration(job_id)
+            # Covers nodes without a WebSocket, where the start is never seen
+            mark_models_warm(job_id)
+        else:
+            job_log.warning("Job %s failed: %s", job_id, error)
+        record_job_stages(job_id)
+        broadcast("job_update", event)
+        resolve_memo_followers(job_id, new_status)
+        # A node slot just freed up
+        dispatcher.notify()
+
+    statements = []
+    if new_status == "completed" and results:
+        statements.append(results_store.insert_statement(job_id, results))
+
+    old_status = store.transition(job_id, fields, from_statuses=from_statuses, on_commit=on_commit,
+                                  statements=statements)
+    if old_status:
+        row = store.read_one("SELECT node FROM jobs WHERE id=?", (job_id,))
+        node = row["node"] if row else None
+        metrics.job_moved(old_status, None if old_status == "queued" else node, new_status, node)
+    return bool(old_status)
+
+def record_job_stages(job_id):
+    """Add a finished job's stage timings to the percentile rollups"""
+    row = store.read_one("""
+        SELECT node, user, queued_at, dispatched_at, started_at, finished_at FROM jobs WHERE id=?
+    """, (job_id,))
+    if row:
+        stage_stats.record(store, dict(row))
+
+def find_job_by_prompt(prompt_id):
+    row = store.read_one("SELECT id FROM jobs WHERE comfyui_prompt_id=?", (prompt_id,))
+    return row[0] if row else None
+
+def handle_node_status(prompt_id, status, error=None):
+    """WebSocket listener callback for execution events"""
+    if status not in ("running", "completed", "failed") or not is_leader():
+        return
+    job = store.read_one("SELECT id, node_url, status FROM jobs WHERE comfyui_prompt_id=?", (prompt_id,))
+    if job is None:
+        return
+
+    if status == "running":
+        # The node took the prompt off its queue and is loading its models
+        if store.transition(job["id"], {"started_at": datetime.now()}, from_statuses=("running", "submitted")):
+            mark_models_warm(job["id"])
+        return
+
+    results = None
+    started_at = finished_at = None
+    if status == "completed" and job["status"] in ("running", "submitted"):
+        # Events carry no outputs; read them once while the node still has them
+        results = comfyui_client.get_job_results(job["node_url"], prompt_id)
+        if "error" in results:
+            results = None
+        else:
+            started_at, finished_at = stage_stats.history_times(results.get("status"))
+    apply_job_status(job["id"], status, error, results=results,
+                     started_at=started_at, finished_at=finished_at)
+
+def mark_models_warm(job_id):
+    """Affinity scoring: the job's node has its models loaded now"""
+    row = store.read_one("SELECT node, models FROM jobs WHERE id=?", (job_id,))
+    if row and row["node"] and row["models"]:
+        scheduler.record_loaded(row["node"], json.loads(row["models"]))
+
+def handle_node_progress(prompt_id, value, maximum):
+    """WebSocket listener callback for sampler progress (not persisted)"""
+    if not is_leader():
+        return
+    job_id = find_job_by_prompt(prompt_id)
+    if job_id is not None:
+        broadcast("job_progress", {"id": job_id, "value": value, "max": maximum})
+
+def check_running_jobs(node_url=None, skip_urls=()):
+    """
+    Reconcile running jobs against each node's /history.
+
+    Args:
+        node_url: Only check jobs on this node
+        skip_urls: Node URLs whose jobs are tracked by a live WebSocket
+    """
+    for job in running_jobs(node_url, skip_urls):
+        try:
+            result = comfyui_client.check_job_status(job["node_url"], job["comfyui_prompt_id"])
+            apply_status_result(job, result)
+        except Exception as e:
+            poller_log.error("Error checking status for job %s: %s", job["id"], e)
+
+async def check_running_jobs_async(skip_urls=()):
+    """check_running_jobs() for the async runtime: all jobs are checked concurrently"""
+    jobs = await asyncio.to_thread(running_jobs, None, skip_urls)
+    checks = await runtime.gather(
+        aio_client.check_job_status(job["node_url"], job["comfyui_prompt_id"]) for job in jobs
+    )
+    for job, result in zip(jobs, checks):
+        try:
+            if isinstance(result, Exception):
+                raise result
+            # SQLite writes and result processing block; keep them off the loop
+            await asyncio.to_thread(apply_status_result, job, result)
+        except Exception as e:
+            poller_log.error("Error checking status for job %s: %s", job["id"], e)
+
+def running_jobs(node_url=None, skip_urls=()):
+    """Submitted jobs to reconcile, optionally for one node or excluding some"""
+    query = """
+        SELECT id, comfyui_prompt_id, node_url
+        FROM jobs
+        WHERE status IN ('running', 'submitted')
+    """
+    params = ()
+    if node_url:
+        query += " AND node_url=?"
+        params = (node_url,)
+    return [
+        job for job in store.read(query, params)
+        if job["comfyui_prompt_id"] and job["node_url"] and job["node_url"] not in skip_urls
+    ]
+
+def apply_status_result(job, result):
+    """Apply a check_job_status() result to a running job"""
+    if not is_leader():
+        # Only the lease holder applies transitions
+        return
+    results = None
+    if result["status"] == "completed":
+        results = results_store.build(
+            job["comfyui_prompt_id"],
+            comfyui_client.process_outputs(job["node_url"], result["outputs"]),
+            result.get("history_status")
+        )
+    started_at, finished_at = stage_stats.history_times(result.get("history_status"))
+    apply_job_status(job["id"], result["status"], result.get("error"), results=results,
+                     started_at=started_at, finished_at=finished_at)
+
+def handle_node_reconnect(node_url):
+    """WebSocket listener callback: catch up on events missed while disconnected"""
+    if is_leader():
+        check_running_jobs(node_url=node_url)
+
 # =====================================================
 # --- Background Status Poller ---
 # =====================================================
 def poll_job_statuses():
-    """Background task to poll ComfyUI nodes for job status updates"""
+    """
+    Background task that, as a slow fallback, reconciles running jobs with
+    /history. Queued jobs are handled by the dispatcher.
+
+    Running jobs are normally tracked by the per-node WebSocket listeners;
+    only nodes without a live listener are polled on every pass.
+    """
     import threading
     import time as time_module
 
     def poller():
+        last_reconcile = 0
         while True:
             try:
                 with app.app_context():
-                    conn = sqlite3.connect(DB)
-                    conn.row_factory = sqlite3.Row
-                    c = conn.cursor()
-
-                    # Get all running or queued jobs
-                    c.execute("""
-                        SELECT id, filename, status, node, user, comfyui_prompt_id, node_url
-                        FROM jobs
-                        WHERE status IN ('running', 'submitted', 'queued')
-                    """)
-                    jobs = c.fetchall()
-                    conn.close()
-
-                    for job in jobs:
-                        job_id = job["id"]
-                        prompt_id = job["comfyui_prompt_id"]
-                        node_url = job["node_url"]
-                        current_status = job["status"]
-
-                        # Handle queued jobs (try to submit to nodes)
-                        if current_status == "queued":
-                            try:
-                                node_result = comfyui_client.select_available_node()
-                                if node_result:
-                                    node, _ = node_result
-
-                                    # Get workflow data
-                                    conn = sqlite3.connect(DB)
-                                    c = conn.cursor()
-                                    c.execute("SELECT workflow_data FROM jobs WHERE id=?", (job_id,))
-                                    row = c.fetchone()
-                                    conn.close()
-
-                                    if row and row[0]:
-                                        workflow_json = json.loads(row[0])
-                                        new_prompt_id = comfyui_client.submit_workflow_to_comfyui(node.url, workflow_json)
-
-                                        if new_prompt_id:
-                                            # Successfully submitted
-                                            conn = sqlite3.connect(DB)
-                                            c = conn.cursor()
-                                            c.execute("""
-                                                UPDATE jobs
-                                                SET status=?, node=?, node_url=?, comfyui_prompt_id=?, error_message=NULL
-                                                WHERE id=?
-                                            """, ("running", node.name, node.url, new_prompt_id, job_id))
-                                            conn.commit()
-                                            conn.close()
-
-                                            socketio.emit("job_update", {
-                                                "id": job_id,
-                                                "status": "running",
-                                                "node": node.name
-                                            })
-                            except Exception as e:
-                                print(f"Error resubmitting queued job {job_id}: {e}")
-                            continue
-
-                        # Check status for running jobs
-                        if prompt_id and node_url:
-                            try:
-                                result = comfyui_client.check_job_status(node_url, prompt_id)
-                                new_status = result["status"]
-                                error = result.get("error")
-
-                                # Update if status changed
-                                if new_status != current_status:
-                                    conn = sqlite3.connect(DB)
-                                    c = conn.cursor()
-
-                                    if new_status == "completed":
-                                        c.execute("""
-                                            UPDATE jobs
-                                            SET status=?, completed_at=?, error_message=NULL
-                                            WHERE id=?
-                                        """, ("completed", datetime.now(), job_id))
-                                        print(f"Job {job_id} completed")
-
-                                        socketio.emit("job_update", {
-                                            "id": job_id,
-                                            "status": "completed"
-                                        })
-
-                                    elif new_status == "failed":
-                                        c.execute("""
-                                            UPDATE jobs
-                                            SET status=?, error_message=?
-                                            WHERE id=?
-                                        """, ("failed", error, job_id))
-                                        print(f"Job {job_id} failed: {error}")
-
-                                        socketio.emit("job_update", {
-                                            "id": job_id,
-                                            "status": "failed",
-                                            "error": error
-                                        })
-
-                                    conn.commit()
-                                    conn.close()
-
-                            except Exception as e:
-                                print(f"Error checking status for job {job_id}: {e}")
+                    if not is_leader():
+                        time_module.sleep(POLL_INTERVAL)
+                        continue
+                    # Check status for running jobs
+                    now = time_module.time()
+                    if now - last_reconcile >= RECONCILE_INTERVAL or reconcile_requested.is_set():
+                        reconcile_requested.clear()
+                        check_running_jobs()
+                        last_reconcile = now
+                    else:
+                        check_running_jobs(skip_urls=ws_listener.connected_urls())
+                    metrics.poller_cycle.observe(time_module.time() - now)
 
             except Exception as e:
-                print(f"Error in status poller: {e}")
+                poller_log.exception("Error in status poller: %s", e)
+
+            time_module.sleep(POLL_INTERVAL)
+
+    last_reconcile = 0
+
+    async def poll_once():
+        nonlocal last_reconcile
+        if not is_leader():
+            return
+        now = time_module.time()
+        if now - last_reconcile >= RECONCILE_INTERVAL or reconcile_requested.is_set():
+            reconcile_requested.clear()
+            await check_running_jobs_async()
+            last_reconcile = now
+        else:
+            await check_running_jobs_async(skip_urls=ws_listener.connected_urls())
+        metrics.poller_cycle.observe(time_module.time() - now)
 
-            # Poll every 10 seconds
-            time_module.sleep(10)
+    if runtime:
+        runtime.every(POLL_INTERVAL, poll_once, "status-poller")
+        print("Async status poller started")
+    else:
+        # Start poller in background thread
+        thread = threading.Thread(target=poller, daemon=True)
+        thread.start()
+        print("Background status poller started")
 
-    # Start poller in background thread
-    thread = threading.Thread(target=poller, daemon=True)
-    thread.start()
-    print("Background status poller started")
+    start_ws_listeners()
+
+def start_ws_listeners():
+    if ws_listener.start_listeners(app, handle_node_status, handle_node_progress, handle_node_reconnect):
+        print("ComfyUI WebSocket listeners started")
 
 
 # =====================================================
-# --- Run the app ---
+# --- Node load refresher ---
 # =====================================================
-if __name__ == "__main__":
-    print(f"Launching backend on port {CONFIG['api_port']}...")
+def enabled_nodes():
+    with app.app_context():
+        return Node.query.filter_by(enabled=True).all()
+
+async def refresh_nodes_async():
+    """One async refresher pass: probe every enabled node at once"""
+    if not is_leader():
+        return
+    rows = await asyncio.to_thread(enabled_nodes)
+    comfyui_client.configure_clients(rows)
+    await aio_client.configure_clients(rows)
+    await node_state.refresh_async(
+        {n.name: n.url for n in rows},
+        lambda url: runtime.bounded(aio_client.get_node_queue_size(url)),
+        stats_probe=lambda url: runtime.bounded(aio_client.get_system_stats(url))
+    )
+
+def start_node_refresher():
+    if runtime:
+        runtime.every(NODE_REFRESH_INTERVAL, refresh_nodes_async, "node-state")
+        return
+    node_state.start_refresher(app, comfyui_client.get_node_queue_size, NODE_REFRESH_INTERVAL,
+                               on_nodes=comfyui_client.configure_clients,
+                               stats_probe=comfyui_client.get_system_stats,
+                               active=is_leader)
 
-    # Start background poller
+# =====================================================
+# --- Multi-worker coordination ---
+# =====================================================
+# With "multi_worker": true several processes (e.g. one per core, behind a
+# proxy with sticky sessions) serve the API. The lease holder runs the
+# dispatcher, poller and node listeners; Socket.IO events reach every
+# worker's clients through the local broker.
+MULTI_WORKER = CONFIG.get("multi_worker", False)
+WORKER_SYNC_INTERVAL = CONFIG.get("worker_sync_interval", 1)
+
+leader_lease = Lease(store, ttl=CONFIG.get("leader_lease_ttl", 15)) if MULTI_WORKER else None
+event_broker = LocalBroker(os.path.join(BASE_DIR, "../run/broker")) if MULTI_WORKER else None
+queued_cursor = {"version": 0}
+
+def is_leader():
+    return leader_lease is None or leader_lease.is_leader()
+
+def leader_fence():
+    """SQL condition (and params) that only holds while this worker owns the lease"""
+    return leader_lease.fence() if leader_lease else ("1", ())
+
+def broadcast(event, data):
+    """Emit a Socket.IO event to the clients of every worker"""
+    socketio.emit(event, data)
+    if event_broker:
+        event_broker.publish({"type": "emit", "event": event, "data": data})
+
+def id_ranges(ids):
+    """[[first, last], ...] runs of consecutive ids; a batch's ids are one run"""
+    ranges = []
+    for job_id in sorted(ids):
+        if ranges and job_id == ranges[-1][1] + 1:
+            ranges[-1][1] = job_id
+        else:
+            ranges.append([job_id, job_id])
+    return ranges
+
+def handle_broker_message(message):
+    if message.get("type") == "emit":
+        socketio.emit(message["event"], message["data"])
+    elif message.get("type") == "changed":
+        # A peer's event was too large to forward; clients re-read the change feed
+        socketio.emit("jobs_changed", {})
+    elif message.get("type") == "wake" and is_leader():
+        sync_queued_jobs()
+    elif message.get("type") == "user_changed":
+        access.forget(message["username"])
+
+def sync_queued_jobs():
+    """Leader: pick up jobs queued by other workers since the last call"""
+    while True:
+        rows = store.read("""
+            SELECT id, user, priority, models, fingerprint, queued_at, status, version FROM jobs
+            WHERE version > ?
+            ORDER BY version
+            LIMIT 1000
+        """, (queued_cursor["version"],))
+        if not rows:
+            return
+        queued_cursor["version"] = rows[-1]["version"]
+        dispatcher.submit_many([
+            (row["id"], row["user"], row["priority"] or 0,
+             job_meta(row["models"], row["fingerprint"], row["queued_at"]))
+            for row in rows if row["status"] == "queued"
+        ])
+
+def start_leader_tasks():
+    """Start the node refresher, prober, dispatcher and poller in this process"""
+    if runtime:
+        runtime.start()
+    start_node_refresher()
+    node_health.start(app, lambda url: comfyui_client.test_node_connection(url, bypass_breaker=True),
+                      active=is_leader)
+    seed_duration_stats()
+    load_queued_jobs()
+    dispatcher.start(app)
     poll_job_statuses()
 
-    socketio.run(app, host="0.0.0.0", port=CONFIG["api_port"])
+def start_coordination():
+    """Start the broker and compete for the dispatcher lease"""
+    started = []
+
+    def on_elected():
+        # Read the cursor first so nothing queued during the load is missed
+        row = store.read_one("SELECT COALESCE(MAX(version), 0) FROM jobs")
+        queued_cursor["version"] = row[0]
+        if started:
+            # Leader threads were idle while another worker held the lease;
+            # running jobs may have finished unseen meanwhile
+            reconcile_requested.set()
+            load_queued_jobs()
+            start_ws_listeners()
+            return
+        started.append(True)
+        start_leader_tasks()
+
+        def sync_loop():
+            while True:
+                time.sleep(WORKER_SYNC_INTERVAL)
+                try:
+                    if is_leader():
+                        sync_queued_jobs()
+                except Exception as e:
+                    logger.error("Error syncing queued jobs: %s", e)
+
+        threading.Thread(target=sync_loop, daemon=True, name="queue-sync").start()
+
+    event_broker.start(handle_broker_message)
+    access.set_publisher(lambda username: event_broker.publish({"type": "user_changed", "username": username}))
+    def on_lost():
+        # The refresher, prober and pollers idle on is_leader(); listeners
+        # hold connections and the dispatcher holds jobs, so drop those
+        ws_listener.stop_listeners()
+        dispatcher.clear()
+
+    leader_lease.start(on_elected, on_lost)
+    print(f"Worker {leader_lease.holder} started; current leader: {leader_lease.current_holder()}")
+
+# =====================================================
+# --- Run the app ---
+# =====================================================
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=CONFIG["api_port"],
+                        help="Port of this worker (multi-worker mode runs one process per port)")
+    args = parser.parse_args()
+
+    log_setup.configure(
+        "../logs",
+        # Workers must not rotate each other's file
+        filename=f"comfyqueue-{args.port}.log" if MULTI_WORKER else "comfyqueue.log",
+        level=CONFIG.get("log_level", "INFO"),
+        levels=CONFIG.get("log_levels"),
+        sample_rates=CONFIG.get("log_sample_rates", {"comfyqueue.requests": 0.1}),
+        console_level=CONFIG.get("log_console_level", "WARNING"),
+        max_bytes=CONFIG.get("log_max_mb", 10) * 1024 * 1024,
+        backups=CONFIG.get("log_backups", 5)
+    )
+    print(f"Launching backend on port {args.port}...")
+
+    static_index.refresh()
+
+    store.start()
+    seed_job_metrics()
+    if MULTI_WORKER:
+        start_coordination()
+    else:
+        # Start node load refresher, dispatcher and background poller
+        start_leader_tasks()
+
+    socketio.run(app, host="0.0.0.0", port=args.port)
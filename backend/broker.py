@@ -0,0 +1,98 @@
+# backend/broker.py
+"""
+Local message broker between API worker processes on one host.
+
+Each worker binds a Unix datagram socket in a shared directory; publishing
+sends the message to every other socket found there. No external service is
+involved, and sockets left behind by dead workers are removed on the first
+failed send. Messages are small JSON objects (Socket.IO events, wake-ups);
+callers send id ranges or "changed" pings rather than id lists. A message
+that still exceeds the datagram limit is replaced by a {"type": "changed"}
+ping, so peers resync from the database instead of missing it.
+
+Sends never block the caller: the socket is non-blocking, and a peer whose
+receive buffer is full misses that message (it catches up on the next one
+or its periodic sync).
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE = 65536
+
+
+class LocalBroker:
+    def __init__(self, directory: str, name: str = None):
+        """
+        Args:
+            directory: Where worker sockets live (created if missing)
+            name: This worker's socket name (default its pid)
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name or os.getpid()}.sock")
+        self._sock = None
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # publish() runs on request threads
+        self._send_sock.setblocking(False)
+        self._thread = None
+
+    def start(self, on_message: Callable[[Dict[str, Any]], None]):
+        """Bind this worker's socket and deliver peers' messages to `on_message`."""
+        if self._thread:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+
+        def loop():
+            while True:
+                try:
+                    message = json.loads(self._sock.recv(MAX_MESSAGE))
+                    on_message(message)
+                except Exception as e:
+                    logger.error(f"Error handling broker message: {e}")
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="broker")
+        self._thread.start()
+
+    def publish(self, message: Dict[str, Any]):
+        """Send a message to every other worker."""
+        data = json.dumps(message, default=str).encode("utf-8")
+        if len(data) > MAX_MESSAGE:
+            logger.warning(f"Broker message of {len(data)} bytes replaced by a change ping")
+            data = json.dumps({"type": "changed"}).encode("utf-8")
+        try:
+            peers = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for entry in peers:
+            path = os.path.join(self.directory, entry)
+            if not entry.endswith(".sock") or path == self.path:
+                continue
+            try:
+                self._send_sock.sendto(data, path)
+            except BlockingIOError:
+                logger.warning(f"Broker peer {entry} is not keeping up; message dropped")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker exited without cleaning up
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                logger.warning(f"Broker send to {entry} failed: {e}")
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -4,49 +4,228 @@ ComfyUI API client for job submission and status tracking
 """
 import requests
 import logging
+import json
+import random
+import threading
+import time
+import uuid
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from models import db, Node
-from typing import Optional, Dict, Any, Tuple
+import scheduler
+import node_health
+import metrics
+import json_codec
+from node_state import NodeState
+from typing import Optional, Dict, Any, Tuple, Iterable
 
 logger = logging.getLogger(__name__)
 
+# Identifies this backend to ComfyUI so execution events for our prompts are
+# routed to the /ws listeners opened with the same clientId. app.py replaces
+# it with an id shared by all workers, so a new leader's listeners also get
+# events for prompts an earlier leader submitted.
+CLIENT_ID = str(uuid.uuid4())
+
 # =====================================================
-# --- Node Selection ---
+# --- Per-node HTTP client ---
 # =====================================================
-def select_available_node() -> Optional[Tuple[Node, int]]:
-    """
-    Select the least-loaded enabled node.
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without any network I/O while a node's circuit breaker is open."""
 
-    Returns:
-        Tuple of (Node, queue_size) or None if no nodes available
-    """
-    enabled_nodes = Node.query.filter_by(enabled=True).all()
 
-    if not enabled_nodes:
-        logger.warning("No enabled nodes available")
-        return None
+class PromptRejectedError(Exception):
+    """The node refused a prompt with a 4xx (e.g. invalid workflow); resubmitting cannot help."""
 
-    best_node = None
-    min_queue_size = float('inf')
+    def __init__(self, status: int, detail: str = ""):
+        super().__init__(f"HTTP {status}" + (f": {detail}" if detail else ""))
+        self.status = status
+        self.detail = detail
 
-    for node in enabled_nodes:
+
+def rejection_detail(body: str) -> str:
+    """Short reason from a /prompt error body (ComfyUI sends {"error": {"message": ...}})."""
+    try:
+        error = json_codec.loads(body).get("error")
+        message = error.get("message") if isinstance(error, dict) else error
+    except (ValueError, AttributeError):
+        message = body
+    return str(message or "")[:200]
+
+
+class NodeClient:
+    """
+    Pooled keep-alive HTTP client for a single ComfyUI node.
+
+    Limits come from the node's row in the `nodes` table:
+        max_connections: size of the connection pool (callers block when full)
+        max_retries: extra attempts for connection errors / 502-504 responses
+        timeouts: JSON object overriding DEFAULT_TIMEOUTS per endpoint
+    """
+
+    DEFAULT_TIMEOUTS = {
+        "queue": 5,
+        "prompt": 10,
+        "history": 5,
+        "system_stats": 3,
+        "view": 30,
+    }
+    RETRY_STATUSES = (502, 503, 504)
+    BACKOFF_BASE = 0.25
+
+    def __init__(self, base_url: str, max_connections: int = 10, max_retries: int = 2,
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections,
+                              pool_block=True, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, endpoint: str, path: str, bypass_breaker: bool = False, **kwargs) -> requests.Response:
+        return self._request("GET", endpoint, path, idempotent=True,
+                             bypass_breaker=bypass_breaker, **kwargs)
+
+    def post(self, endpoint: str, path: str, **kwargs) -> requests.Response:
+        # A POST that timed out or lost its connection mid-response may already
+        # have been queued by the node, so it is only retried when the
+        # connection itself could not be established (see _not_sent).
+        return self._request("POST", endpoint, path, idempotent=False, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def _request(self, method: str, endpoint: str, path: str, idempotent: bool,
+                 bypass_breaker: bool = False, **kwargs) -> requests.Response:
+        if not bypass_breaker and not node_health.is_available(self.base_url):
+            raise CircuitOpenError(f"circuit open for {self.base_url}")
+
+        kwargs.setdefault("timeout", self.timeouts.get(endpoint, 5))
+        url = f"{self.base_url}{path}"
+
+        # Health is recorded once per call, on its final outcome
+        started = time.time()
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                if last_attempt or not (idempotent or self._not_sent(e)):
+                    self._record(endpoint, started, error=str(e))
+                    raise
+            except requests.Timeout as e:
+                if last_attempt or not idempotent:
+                    self._record(endpoint, started, error=str(e))
+                    raise
+            else:
+                if not idempotent or last_attempt or response.status_code not in self.RETRY_STATUSES:
+                    if response.status_code >= 500:
+                        self._record(endpoint, started, error=f"HTTP {response.status_code}")
+                    else:
+                        self._record(endpoint, started)
+                    return response
+                response.close()
+
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, self.BACKOFF_BASE * (2 ** attempt)))
+
+    @staticmethod
+    def _not_sent(error: requests.ConnectionError) -> bool:
+        """
+        Whether the request never reached the node. requests also reports a
+        connection dropped after the body was sent (RemoteDisconnected,
+        ProtocolError) as ConnectionError, so check the urllib3 cause.
+        """
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _record(self, endpoint: str, started: float, error: Optional[str] = None):
+        """Report a call's final outcome to node_health and metrics."""
+        elapsed = time.time() - started
+        if error is None:
+            node_health.record_success(self.base_url, elapsed)
+        else:
+            node_health.record_failure(self.base_url, error, elapsed)
+        metrics.observe_http(self.base_url, endpoint, elapsed, ok=error is None)
+
+
+_clients: Dict[str, NodeClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _client_settings(node: Node) -> Dict[str, Any]:
+    timeouts = None
+    if node.timeouts:
         try:
-            queue_size = get_node_queue_size(node.url)
-            logger.info(f"Node {node.name} ({node.url}) has {queue_size} jobs in queue")
+            timeouts = json.loads(node.timeouts)
+        except ValueError:
+            logger.warning(f"Ignoring invalid timeouts for node {node.name}")
+    return {
+        "max_connections": node.max_connections or 10,
+        "max_retries": node.max_retries if node.max_retries is not None else 2,
+        "timeouts": timeouts,
+    }
+
+
+def get_client(node_url: str) -> NodeClient:
+    """Return the pooled client for a node, creating one with defaults if needed."""
+    key = node_url.rstrip("/")
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = NodeClient(key)
+            _clients[key] = client
+        return client
+
+
+def configure_clients(nodes: Iterable[Node]):
+    """Create or rebuild clients whose limits differ from their node rows."""
+    for node in nodes:
+        key = node.url.rstrip("/")
+        settings = _client_settings(node)
+        with _clients_lock:
+            client = _clients.get(key)
+            if client and client.max_connections == settings["max_connections"] \
+                    and client.max_retries == settings["max_retries"] \
+                    and client.timeouts == dict(NodeClient.DEFAULT_TIMEOUTS, **(settings["timeouts"] or {})):
+                continue
+            _clients[key] = NodeClient(key, **settings)
+        if client:
+            client.close()
+
+
+def drop_client(node_url: str):
+    """Close and forget a node's client (after the node is edited or deleted)."""
+    with _clients_lock:
+        client = _clients.pop(node_url.rstrip("/"), None)
+    if client:
+        client.close()
+
 
-            if queue_size < min_queue_size:
-                min_queue_size = queue_size
-                best_node = node
+# =====================================================
+# --- Node Selection ---
+# =====================================================
+def select_available_node(job: Optional[Dict[str, Any]] = None) -> Optional[Tuple[NodeState, int]]:
+    """
+    Select a node for a job from the background load snapshot.
 
-        except Exception as e:
-            logger.error(f"Failed to check queue for node {node.name}: {e}")
-            continue
+    No node is contacted here; see node_state for how the snapshot is kept
+    current and scheduler for how nodes are scored.
 
-    if best_node:
-        logger.info(f"Selected node: {best_node.name} with {min_queue_size} jobs")
-        return (best_node, min_queue_size)
+    Args:
+        job: Scheduling hints ('models', 'queued_at'); None for least-loaded
 
-    logger.warning("No responsive nodes found")
-    return None
+    Returns:
+        Tuple of (NodeState, queue_size) or None if no node should take it now
+    """
+    return scheduler.select_node(job)
 
 
 def get_node_queue_size(node_url: str) -> int:
@@ -60,20 +239,20 @@ def get_node_queue_size(node_url: str) -> int:
         Number of jobs in queue (running + pending)
     """
     try:
-        response = requests.get(f"{node_url}/queue", timeout=5)
+        response = get_client(node_url).get("queue", "/queue")
         response.raise_for_status()
-        data = response.json()
-
-        queue_running = len(data.get("queue_running", []))
-        queue_pending = len(data.get("queue_pending", []))
-
-        return queue_running + queue_pending
+        return parse_queue_size(response.json())
 
     except Exception as e:
         logger.error(f"Error getting queue size from {node_url}: {e}")
         raise
 
 
+def parse_queue_size(data: Dict[str, Any]) -> int:
+    """Running + pending entries of a /queue payload."""
+    return len(data.get("queue_running", [])) + len(data.get("queue_pending", []))
+
+
 # =====================================================
 # --- ComfyUI API Functions ---
 # =====================================================
@@ -87,14 +266,16 @@ def submit_workflow_to_comfyui(node_url: str, workflow_json: Dict[str, Any]) ->
 
     Returns:
         ComfyUI prompt_id or None if failed
+
+    Raises:
+        PromptRejectedError: The node answered 4xx, so the prompt itself is bad
     """
     try:
-        payload = {"prompt": workflow_json}
-        response = requests.post(
-            f"{node_url}/prompt",
-            json=payload,
-            timeout=10
-        )
+        payload = {"prompt": workflow_json, "client_id": CLIENT_ID}
+        response = get_client(node_url).post("prompt", "/prompt", data=json_codec.dumps(payload),
+                                             headers={"Content-Type": "application/json"})
+        if 400 <= response.status_code < 500:
+            raise PromptRejectedError(response.status_code, rejection_detail(response.text))
         response.raise_for_status()
         data = response.json()
 
@@ -104,11 +285,31 @@ def submit_workflow_to_comfyui(node_url: str, workflow_json: Dict[str, Any]) ->
         logger.info(f"Workflow submitted to {node_url}. Prompt ID: {prompt_id}, Queue #: {queue_number}")
         return prompt_id
 
+    except PromptRejectedError as e:
+        logger.error(f"{node_url} rejected workflow: {e}")
+        raise
     except Exception as e:
         logger.error(f"Failed to submit workflow to {node_url}: {e}")
         return None
 
 
+def cancel_prompt(node_url: str, prompt_id: str) -> bool:
+    """
+    Remove a prompt from a node's pending queue (ComfyUI POST /queue
+    {"delete": [...]}). A prompt that already started is left running.
+
+    Returns:
+        True if the node accepted the request
+    """
+    try:
+        response = get_client(node_url).post("queue", "/queue", json={"delete": [prompt_id]})
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to cancel prompt {prompt_id} on {node_url}: {e}")
+        return False
+
+
 def check_job_status(node_url: str, prompt_id: str) -> Dict[str, Any]:
     """
     Check job status from ComfyUI /history endpoint.
@@ -118,35 +319,74 @@ def check_job_status(node_url: str, prompt_id: str) -> Dict[str, Any]:
         prompt_id: The ComfyUI prompt ID
 
     Returns:
-        Dictionary with 'status', 'outputs', 'error' keys
+        Dictionary with 'status', 'outputs', 'error' keys ('history_status'
+        holds ComfyUI's status object once the job completed)
     """
     try:
-        response = requests.get(f"{node_url}/history/{prompt_id}", timeout=5)
+        response = get_client(node_url).get("history", f"/history/{prompt_id}")
         response.raise_for_status()
-        data = response.json()
+        return parse_history_status(prompt_id, response.json())
 
-        if prompt_id not in data:
-            # Job not in history yet, still in queue
-            return {"status": "running", "outputs": None, "error": None}
+    except Exception as e:
+        logger.error(f"Failed to check status for {prompt_id} on {node_url}: {e}")
+        return {"status": "unknown", "outputs": None, "error": str(e)}
 
-        job_data = data[prompt_id]
 
-        # Check if there's an error
-        if "error" in job_data or job_data.get("status", {}).get("status_str") == "error":
-            error_msg = job_data.get("error", {}).get("message", "Unknown error")
-            return {"status": "failed", "outputs": None, "error": error_msg}
+def parse_history_status(prompt_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Job status from a /history/<prompt_id> payload, as check_job_status returns it."""
+    if prompt_id not in data:
+        # Job not in history yet, still in queue
+        return {"status": "running", "outputs": None, "error": None}
 
-        # Check if completed
-        if job_data.get("status", {}).get("completed", False):
-            outputs = job_data.get("outputs", {})
-            return {"status": "completed", "outputs": outputs, "error": None}
+    job_data = data[prompt_id]
 
-        # Still running
-        return {"status": "running", "outputs": None, "error": None}
+    # Check if there's an error
+    if "error" in job_data or job_data.get("status", {}).get("status_str") == "error":
+        error_msg = job_data.get("error", {}).get("message", "Unknown error")
+        return {"status": "failed", "outputs": None, "error": error_msg}
 
-    except Exception as e:
-        logger.error(f"Failed to check status for {prompt_id} on {node_url}: {e}")
-        return {"status": "unknown", "outputs": None, "error": str(e)}
+    # Check if completed
+    if job_data.get("status", {}).get("completed", False):
+        outputs = job_data.get("outputs", {})
+        return {"status": "completed", "outputs": outputs, "error": None,
+                "history_status": job_data.get("status", {})}
+
+    # Still running
+    return {"status": "running", "outputs": None, "error": None}
+
+
+def process_outputs(node_url: str, outputs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add /view URLs to the image entries of a ComfyUI outputs mapping.
+
+    Args:
+        node_url: Base URL of the ComfyUI node
+        outputs: The 'outputs' object of a /history entry
+
+    Returns:
+        Outputs keyed by node id, with images as filename/url/subfolder/type
+    """
+    processed_outputs = {}
+    for node_id, output_data in (outputs or {}).items():
+        if "images" in output_data:
+            images = []
+            for img in output_data["images"]:
+                filename = img.get("filename")
+                subfolder = img.get("subfolder", "")
+                img_type = img.get("type", "output")
+
+                # Build view URL
+                view_url = f"{node_url}/view?filename={filename}&subfolder={subfolder}&type={img_type}"
+                images.append({
+                    "filename": filename,
+                    "url": view_url,
+                    "subfolder": subfolder,
+                    "type": img_type
+                })
+            processed_outputs[node_id] = {"images": images}
+        else:
+            processed_outputs[node_id] = output_data
+    return processed_outputs
 
 
 def get_job_results(node_url: str, prompt_id: str) -> Dict[str, Any]:
@@ -161,7 +401,7 @@ def get_job_results(node_url: str, prompt_id: str) -> Dict[str, Any]:
         Dictionary with outputs and metadata
     """
     try:
-        response = requests.get(f"{node_url}/history/{prompt_id}", timeout=5)
+        response = get_client(node_url).get("history", f"/history/{prompt_id}")
         response.raise_for_status()
         data = response.json()
 
@@ -169,29 +409,7 @@ def get_job_results(node_url: str, prompt_id: str) -> Dict[str, Any]:
             return {"error": "Job not found in history"}
 
         job_data = data[prompt_id]
-        outputs = job_data.get("outputs", {})
-
-        # Process outputs to include full URLs
-        processed_outputs = {}
-        for node_id, output_data in outputs.items():
-            if "images" in output_data:
-                images = []
-                for img in output_data["images"]:
-                    filename = img.get("filename")
-                    subfolder = img.get("subfolder", "")
-                    img_type = img.get("type", "output")
-
-                    # Build view URL
-                    view_url = f"{node_url}/view?filename={filename}&subfolder={subfolder}&type={img_type}"
-                    images.append({
-                        "filename": filename,
-                        "url": view_url,
-                        "subfolder": subfolder,
-                        "type": img_type
-                    })
-                processed_outputs[node_id] = {"images": images}
-            else:
-                processed_outputs[node_id] = output_data
+        processed_outputs = process_outputs(node_url, job_data.get("outputs", {}))
 
         return {
             "prompt_id": prompt_id,
@@ -204,18 +422,55 @@ def get_job_results(node_url: str, prompt_id: str) -> Dict[str, Any]:
         return {"error": str(e)}
 
 
-def test_node_connection(node_url: str) -> bool:
+def get_system_stats(node_url: str) -> Dict[str, Any]:
+    """
+    Get a node's /system_stats (device names, VRAM totals and free memory).
+
+    Args:
+        node_url: Base URL of the ComfyUI node
+
+    Returns:
+        The parsed /system_stats payload (raises on errors)
+    """
+    response = get_client(node_url).get("system_stats", "/system_stats")
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_image(node_url: str, filename: str, subfolder: str = "", img_type: str = "output") -> bytes:
+    """
+    Download an output image from a ComfyUI node's /view endpoint.
+
+    Args:
+        node_url: Base URL of the ComfyUI node
+        filename, subfolder, img_type: As listed in the job's outputs
+
+    Returns:
+        Raw image bytes (raises on HTTP errors)
+    """
+    response = get_client(node_url).get("view", "/view", params={
+        "filename": filename,
+        "subfolder": subfolder,
+        "type": img_type
+    })
+    response.raise_for_status()
+    return response.content
+
+
+def test_node_connection(node_url: str, bypass_breaker: bool = False) -> bool:
     """
     Test if a ComfyUI node is reachable.
 
     Args:
         node_url: Base URL of the ComfyUI node
+        bypass_breaker: Contact the node even if its circuit is open (health probes)
 
     Returns:
         True if node is reachable, False otherwise
     """
     try:
-        response = requests.get(f"{node_url}/system_stats", timeout=3)
+        response = get_client(node_url).get("system_stats", "/system_stats",
+                                            bypass_breaker=bypass_breaker)
         return response.status_code == 200
     except:
         return False
@@ -0,0 +1,232 @@
+# backend/dispatcher.py
+"""
+In-memory priority dispatcher for queued jobs.
+
+Queued jobs are held per user in priority heaps. The next job is taken from
+the highest priority present; among users with a job at that priority the
+one with the lowest virtual time goes first (stride scheduling), so users
+share dispatch slots in proportion to their weights. Jobs are FIFO within a
+user and priority.
+
+The dispatch loop sleeps until a job is submitted or a node frees up rather
+than rescanning the database on a timer. Node choice is per job: when no
+node suits the next job (e.g. it is waiting for a node with its models
+loaded), up to `lookahead` further jobs are tried before sleeping. A job
+whose dispatch fails goes to the back of its user's queue and its turn stays
+charged, so a node that keeps refusing it cannot starve the jobs behind it.
+"""
+import heapq
+import itertools
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# dispatch(job_id, node) -> True: sent to node, False: retry later, None: drop job
+DispatchCallback = Callable[[int, Any], Optional[bool]]
+# select_node(meta, pass_state) -> (node, queue_size) or None; meta is what
+# submit() got, pass_state what begin_pass() returned for the current pass
+SelectNodeCallback = Callable[[Dict[str, Any], Any], Optional[Tuple[Any, int]]]
+
+
+class Dispatcher:
+    def __init__(self, dispatch: DispatchCallback, select_node: SelectNodeCallback,
+                 user_weights: Optional[Dict[str, float]] = None, idle_wait: float = 3,
+                 lookahead: int = 16, begin_pass: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            dispatch: Sends one job to the chosen node
+            select_node: Returns (node, queue_size) or None when no node is free
+            user_weights: Fair-share weight per user (default 1)
+            idle_wait: Seconds to wait before re-checking nodes when none is free
+            lookahead: Jobs to try per pass when earlier ones find no node
+            begin_pass: Loads what every selection in a pass shares (e.g. the
+                        enabled nodes), once per pass
+        """
+        self._dispatch = dispatch
+        self._select_node = select_node
+        self._begin_pass = begin_pass
+        self.user_weights = user_weights or {}
+        self.idle_wait = idle_wait
+        self.lookahead = lookahead
+
+        self._cond = threading.Condition()
+        self._queues: Dict[str, List[Tuple[int, int, int]]] = {}
+        self._pass: Dict[str, float] = {}
+        self._vtime = 0.0
+        self._job_ids = set()
+        self._meta: Dict[int, Dict[str, Any]] = {}
+        self._seq = itertools.count()
+        self._thread = None
+
+    # =====================================================
+    # --- Queue ---
+    # =====================================================
+    def submit(self, job_id: int, user: Optional[str], priority: int = 0,
+               meta: Optional[Dict[str, Any]] = None):
+        """
+        Add a queued job and wake the dispatch loop.
+
+        Args:
+            meta: Scheduling hints handed to select_node for this job
+        """
+        with self._cond:
+            self._push(job_id, user or "", priority, meta=meta)
+            self._cond.notify()
+
+    def submit_many(self, jobs: List[Tuple[int, Optional[str], int, Optional[Dict[str, Any]]]]):
+        """Add several (job_id, user, priority, meta) jobs with a single wake-up."""
+        with self._cond:
+            for job_id, user, priority, meta in jobs:
+                self._push(job_id, user or "", priority, meta=meta)
+            self._cond.notify()
+
+    def load(self, rows: List[Tuple[int, Optional[str], Optional[int], Optional[Dict[str, Any]]]]):
+        """Seed the queue with (job_id, user, priority, meta) rows, oldest first."""
+        with self._cond:
+            for job_id, user, priority, meta in rows:
+                self._push(job_id, user or "", priority or 0, meta=meta)
+            self._cond.notify()
+
+    def clear(self):
+        """Forget every waiting job (e.g. after losing leadership); they stay queued in the database."""
+        with self._cond:
+            self._queues.clear()
+            self._job_ids.clear()
+            self._meta.clear()
+
+    def notify(self):
+        """Wake the dispatch loop, e.g. when a node finished a job."""
+        with self._cond:
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._job_ids)
+
+    def oldest_queued_at(self) -> Optional[float]:
+        """Earliest `queued_at` (epoch seconds) among waiting jobs, if any."""
+        with self._cond:
+            times = [self._meta[j]["queued_at"] for j in self._job_ids
+                     if "queued_at" in self._meta.get(j, {})]
+        return min(times) if times else None
+
+    def snapshot(self) -> Dict[str, int]:
+        """Number of queued jobs per user."""
+        with self._cond:
+            return {user: len(q) for user, q in self._queues.items() if q}
+
+    def _weight(self, user: str) -> float:
+        return float(self.user_weights.get(user, 1)) or 1.0
+
+    def _push(self, job_id: int, user: str, priority: int, seq: Optional[int] = None,
+              meta: Optional[Dict[str, Any]] = None):
+        if job_id in self._job_ids:
+            return
+        if meta is not None:
+            self._meta[job_id] = meta
+        queue = self._queues.setdefault(user, [])
+        if not queue:
+            # A user returning from idle starts at the current virtual time
+            # instead of cashing in the time they were away
+            self._pass[user] = max(self._pass.get(user, 0.0), self._vtime)
+        heapq.heappush(queue, (-priority, next(self._seq) if seq is None else seq, job_id))
+        self._job_ids.add(job_id)
+
+    def _pop(self) -> Optional[Tuple[str, Tuple[int, int, int]]]:
+        heads = {user: q[0] for user, q in self._queues.items() if q}
+        if not heads:
+            return None
+        top = min(head[0] for head in heads.values())
+        user = min(
+            (u for u, head in heads.items() if head[0] == top),
+            key=lambda u: (self._pass[u], heads[u][1])
+        )
+        entry = heapq.heappop(self._queues[user])
+        self._job_ids.discard(entry[2])
+        self._vtime = self._pass[user]
+        self._pass[user] += 1.0 / self._weight(user)
+        return user, entry
+
+    def _requeue(self, user: str, entry: Tuple[int, int, int]):
+        # Keep the original sequence number so the job keeps its place
+        self._pass[user] -= 1.0 / self._weight(user)
+        self._push(entry[2], user, -entry[0], seq=entry[1])
+
+    def _demote(self, user: str, entry: Tuple[int, int, int]):
+        # Failed dispatch: new sequence number and no refund of the user's turn
+        self._push(entry[2], user, -entry[0])
+
+    def _release(self, job_id: int):
+        self._meta.pop(job_id, None)
+
+    # =====================================================
+    # --- Dispatch loop ---
+    # =====================================================
+    def start(self, app):
+        """Run the dispatch loop in a background thread inside the app context."""
+        if self._thread:
+            return
+
+        def loop():
+            while True:
+                try:
+                    with app.app_context():
+                        self._run_once()
+                except Exception as e:
+                    logger.error(f"Error in dispatcher: {e}")
+                    with self._cond:
+                        self._cond.wait(self.idle_wait)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="dispatcher")
+        self._thread.start()
+
+    def _run_once(self):
+        with self._cond:
+            while not self._job_ids:
+                self._cond.wait()
+
+        skipped = []
+        failed = []
+        placed = False
+        pass_state = self._begin_pass() if self._begin_pass else None
+        try:
+            for _ in range(self.lookahead):
+                with self._cond:
+                    popped = self._pop()
+                    meta = self._meta.get(popped[1][2], {}) if popped else None
+                if not popped:
+                    break
+                user, entry = popped
+
+                node_result = self._select_node(meta, pass_state)
+                if not node_result:
+                    skipped.append(popped)
+                    continue
+
+                job_id = entry[2]
+                try:
+                    result = self._dispatch(job_id, node_result[0])
+                except Exception as e:
+                    logger.error(f"Error dispatching job {job_id}: {e}")
+                    result = False
+
+                if result is False:
+                    # Try the jobs behind it instead of stalling on this one
+                    failed.append(popped)
+                    continue
+                with self._cond:
+                    self._release(job_id)
+                placed = True
+                break
+        finally:
+            with self._cond:
+                for user, entry in reversed(skipped):
+                    self._requeue(user, entry)
+                for user, entry in failed:
+                    self._demote(user, entry)
+
+        if not placed:
+            with self._cond:
+                self._cond.wait(self.idle_wait)
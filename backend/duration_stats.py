@@ -0,0 +1,109 @@
+# backend/duration_stats.py
+"""
+Running job duration statistics for the scheduler.
+
+Durations are exponentially weighted moving averages kept per node, per
+workflow fingerprint and per (node, fingerprint). Each completion is
+attributed to the node's service time: from dispatch, or from the node's
+previous completion if it was still busy, to completion. Time spent
+waiting in the node's own queue therefore does not inflate the estimate.
+"""
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+ALPHA = 0.2
+
+
+class Ewma:
+    __slots__ = ("value", "count")
+
+    def __init__(self):
+        self.value: Optional[float] = None
+        self.count = 0
+
+    def add(self, sample: float):
+        self.value = sample if self.value is None else ALPHA * sample + (1 - ALPHA) * self.value
+        self.count += 1
+
+
+class DurationStats:
+    def __init__(self, default_seconds: float = 30):
+        self.default_seconds = default_seconds
+        self._lock = threading.Lock()
+        self._by_node: Dict[str, Ewma] = {}
+        self._by_fingerprint: Dict[str, Ewma] = {}
+        self._by_pair: Dict[Tuple[str, str], Ewma] = {}
+        # How much slower (>1) or faster (<1) a node runs the same workflows
+        self._node_ratio: Dict[str, Ewma] = {}
+        self._last_completion: Dict[str, datetime] = {}
+
+    def record(self, node: str, fingerprint: Optional[str],
+               dispatched_at: datetime, completed_at: datetime):
+        """Add one completed job."""
+        with self._lock:
+            started = dispatched_at
+            previous = self._last_completion.get(node)
+            if previous and previous > started:
+                started = previous
+            if previous is None or completed_at > previous:
+                self._last_completion[node] = completed_at
+
+            seconds = (completed_at - started).total_seconds()
+            if seconds <= 0:
+                return
+
+            self._by_node.setdefault(node, Ewma()).add(seconds)
+            if fingerprint:
+                overall = self._by_fingerprint.get(fingerprint)
+                if overall and overall.value:
+                    self._node_ratio.setdefault(node, Ewma()).add(seconds / overall.value)
+                self._by_fingerprint.setdefault(fingerprint, Ewma()).add(seconds)
+                self._by_pair.setdefault((node, fingerprint), Ewma()).add(seconds)
+
+    def node_mean(self, node: str, capacity_weight: float = 1.0) -> float:
+        """Typical run time of any job on this node."""
+        with self._lock:
+            stat = self._by_node.get(node)
+            if stat and stat.value is not None:
+                return stat.value
+        return self.default_seconds / max(capacity_weight, 0.1)
+
+    def estimate(self, node: str, fingerprint: Optional[str], capacity_weight: float = 1.0) -> float:
+        """
+        Expected run time of a workflow on a node.
+
+        Falls back from the (node, fingerprint) average, to the fingerprint
+        average scaled by the node's speed ratio, to the node's average, to
+        the default scaled by the node's capacity weight.
+        """
+        with self._lock:
+            if fingerprint:
+                pair = self._by_pair.get((node, fingerprint))
+                if pair and pair.value is not None:
+                    return pair.value
+                overall = self._by_fingerprint.get(fingerprint)
+                if overall and overall.value is not None:
+                    ratio = self._node_ratio.get(node)
+                    if ratio and ratio.value is not None:
+                        return overall.value * ratio.value
+                    return overall.value / max(capacity_weight, 0.1)
+        return self.node_mean(node, capacity_weight)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                "nodes": {n: round(s.value, 2) for n, s in self._by_node.items() if s.value is not None},
+                "node_speed_ratio": {n: round(s.value, 3) for n, s in self._node_ratio.items() if s.value is not None},
+                "fingerprints": len(self._by_fingerprint),
+            }
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Parse a TIMESTAMP column as stored by sqlite3 (str) or a datetime."""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
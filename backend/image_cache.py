@@ -0,0 +1,167 @@
+# backend/image_cache.py
+"""
+On-disk cache of job output images and their thumbnails.
+
+Each output image is fetched from its node once and stored under the cache
+directory together with any thumbnails generated from it. Files are evicted
+least-recently-used first once the cache grows past `max_bytes`. Every file
+gets a strong ETag (SHA-256 of its bytes) so browsers can revalidate cheaply.
+
+Work on one image is serialized by a striped lock over its key. get() opens
+the file before releasing that lock and eviction skips keys whose lock is
+held, so a file is never unlinked between lookup and open.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+from io import BytesIO
+from typing import IO, Any, Callable, Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_FORMAT = ("WEBP", "image/webp", ".webp")
+LOCK_STRIPES = 64
+
+# fetch(node_url, filename, subfolder, type) -> image bytes
+FetchCallback = Callable[[str, str, str, str], bytes]
+
+
+class ImageCache:
+    def __init__(self, root: str, fetch: FetchCallback, max_bytes: int = 2 * 1024 ** 3):
+        self.root = root
+        self.fetch = fetch
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._etags: Dict[str, str] = {}
+        self._sizes: Dict[str, int] = {}
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and not name.endswith(".tmp"):
+                self._sizes[path] = os.path.getsize(path)
+        self._total = sum(self._sizes.values())
+
+    # =====================================================
+    # --- Public API ---
+    # =====================================================
+    def get(self, node_url: str, image: Dict[str, Any],
+            size: Optional[int] = None) -> Tuple[IO[bytes], str, str]:
+        """
+        Return a cached original (size=None) or thumbnail for an output image.
+
+        Args:
+            image: An entry from a results payload (filename/subfolder/type)
+            size: Thumbnail bounding box; one of THUMBNAIL_SIZES
+
+        Returns:
+            Tuple of (open binary file, etag, mimetype); the caller closes the file
+        """
+        if size is not None and size not in THUMBNAIL_SIZES:
+            raise ValueError(f"size must be one of {THUMBNAIL_SIZES}")
+
+        filename = image.get("filename") or ""
+        subfolder = image.get("subfolder") or ""
+        img_type = image.get("type") or "output"
+        key = hashlib.sha256(f"{node_url}|{img_type}|{subfolder}|{filename}".encode("utf-8")).hexdigest()
+        ext = os.path.splitext(filename)[1].lower() or ".bin"
+
+        # Without Pillow thumbnails fall back to the original image
+        want_thumb = size is not None and Image is not None
+
+        with self._key_lock(key):
+            thumb = os.path.join(self.root, f"{key}-{size}{THUMBNAIL_FORMAT[2]}")
+            if want_thumb and os.path.exists(thumb):
+                return self._hit(thumb, THUMBNAIL_FORMAT[1])
+
+            original = os.path.join(self.root, key + ext)
+            if not os.path.exists(original):
+                data = self.fetch(node_url, filename, subfolder, img_type)
+                self._store(original, data)
+
+            if not want_thumb:
+                return self._hit(original, mimetypes.guess_type(filename)[0] or "application/octet-stream")
+
+            self._store(thumb, self._thumbnail(original, size))
+            return self._hit(thumb, THUMBNAIL_FORMAT[1])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"files": len(self._sizes), "bytes": self._total, "max_bytes": self.max_bytes}
+
+    # =====================================================
+    # --- Internals ---
+    # =====================================================
+    def _key_lock(self, key: str) -> threading.Lock:
+        return self._key_locks[int(key[:8], 16) % LOCK_STRIPES]
+
+    @staticmethod
+    def _thumbnail(original: str, size: int) -> bytes:
+        with Image.open(original) as img:
+            img.thumbnail((size, size))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            out = BytesIO()
+            img.save(out, THUMBNAIL_FORMAT[0], quality=80)
+            return out.getvalue()
+
+    def _store(self, path: str, data: bytes):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._etags[path] = hashlib.sha256(data).hexdigest()
+            self._total += len(data) - self._sizes.get(path, 0)
+            self._sizes[path] = len(data)
+        self._evict(keep=path)
+
+    def _hit(self, path: str, mimetype: str) -> Tuple[IO[bytes], str, str]:
+        # mtime doubles as the LRU timestamp
+        os.utime(path)
+        f = open(path, "rb")
+        with self._lock:
+            etag = self._etags.get(path)
+        if etag is None:
+            etag = hashlib.sha256(f.read()).hexdigest()
+            f.seek(0)
+            with self._lock:
+                self._etags[path] = etag
+        return f, etag, mimetype
+
+    def _evict(self, keep: str):
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            paths = list(self._sizes)
+
+        # Oldest first; trim to 90% so eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        for path in sorted(paths, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0):
+            with self._lock:
+                if self._total <= target:
+                    return
+            if path == keep:
+                continue
+            # Busy keys are being served or regenerated; leave them for next time
+            key_lock = self._key_lock(os.path.basename(path))
+            if not key_lock.acquire(blocking=False):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            finally:
+                key_lock.release()
+            with self._lock:
+                self._total -= self._sizes.pop(path, 0)
+                self._etags.pop(path, None)
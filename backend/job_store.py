@@ -0,0 +1,267 @@
+# backend/job_store.py
+"""
+Job table access through long-lived SQLite connections in WAL mode.
+
+Writes go through a single shared connection. Status transitions are
+write-behind: they are validated and merged in memory, then flushed in one
+transaction every `flush_interval` seconds or once `batch_size` jobs are
+pending. Several transitions of the same job between flushes collapse into
+one UPDATE. Reads use one connection per thread and never wait on writers.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 200):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+        # job_id -> merged column updates awaiting flush
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        # Other statements to run in the next flush, before the job updates
+        self._deferred: List[tuple] = []
+        self._callbacks: List[Callable[[], None]] = []
+        self._wake = threading.Event()
+        self._thread = None
+
+        self._stats = {
+            "transitions": 0,        # transitions accepted
+            "rows_written": 0,       # UPDATE rows actually executed
+            "deferred_written": 0,   # defer()red statements executed
+            "transactions": 0,       # batched commits
+            "immediate_writes": 0,   # write() calls
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # =====================================================
+    # --- Reads ---
+    # =====================================================
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def read(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        """Run a SELECT on this thread's read connection."""
+        return self._reader().execute(sql, tuple(params)).fetchall()
+
+    def read_one(self, sql: str, params: Iterable = ()) -> Optional[sqlite3.Row]:
+        return self._reader().execute(sql, tuple(params)).fetchone()
+
+    # =====================================================
+    # --- Writes ---
+    # =====================================================
+    def write(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        """
+        Execute and commit a statement immediately.
+
+        Pending transitions are flushed first so writes land in order; their
+        callbacks run even if this statement fails.
+        """
+        callbacks = []
+        try:
+            with self._lock:
+                callbacks = self._flush_locked()
+                cursor = self._conn.execute(sql, tuple(params))
+                self._conn.commit()
+                self._stats["immediate_writes"] += 1
+        finally:
+            self._run_callbacks(callbacks)
+        return cursor
+
+    def write_many(self, sql: str, rows: Iterable[Iterable]) -> sqlite3.Cursor:
+        """executemany() in a single transaction."""
+        callbacks = []
+        try:
+            with self._lock:
+                callbacks = self._flush_locked()
+                cursor = self._conn.executemany(sql, [tuple(r) for r in rows])
+                self._conn.commit()
+                self._stats["immediate_writes"] += 1
+        finally:
+            self._run_callbacks(callbacks)
+        return cursor
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several statements on the write connection as one transaction.
+
+        Yields the connection; commits on success, rolls back on error.
+        Pending transitions are flushed first, in their own commit, and their
+        callbacks run whether or not the body succeeds.
+        """
+        callbacks = []
+        try:
+            with self._lock:
+                callbacks = self._flush_locked()
+                try:
+                    yield self._conn
+                    self._conn.commit()
+                except Exception:
+                    self._conn.rollback()
+                    raise
+                finally:
+                    self._stats["immediate_writes"] += 1
+        finally:
+            self._run_callbacks(callbacks)
+
+    def transition(self, job_id: int, fields: Dict[str, Any],
+                   from_statuses: Optional[Iterable[str]] = None,
+                   on_commit: Optional[Callable[[], None]] = None,
+                   statements: Iterable[tuple] = ()) -> Union[str, bool]:
+        """
+        Queue a write-behind update for one job.
+
+        Args:
+            fields: Columns to set
+            from_statuses: Only apply if the job's current status (including
+                           pending, unflushed transitions) is one of these
+            on_commit: Called once the update has been committed
+            statements: (sql, params) pairs to commit in the same batch,
+                        only if the transition is accepted
+
+        Returns:
+            False if the job was not in one of `from_statuses`; otherwise the
+            status it was accepted from (True when from_statuses is None)
+        """
+        status = True
+        with self._lock:
+            pending = self._pending.get(job_id)
+            if from_statuses is not None:
+                if pending and "status" in pending:
+                    status = pending["status"]
+                else:
+                    row = self._conn.execute("SELECT status FROM jobs WHERE id=?", (job_id,)).fetchone()
+                    status = row["status"] if row else None
+                if status not in from_statuses:
+                    return False
+
+            for sql, params in statements:
+                self._deferred.append((sql, tuple(params)))
+            if pending is None:
+                self._pending[job_id] = dict(fields)
+            else:
+                pending.update(fields)
+            if on_commit:
+                self._callbacks.append(on_commit)
+            self._stats["transitions"] += 1
+
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+        return status
+
+    def defer(self, sql: str, params: Iterable = ()):
+        """
+        Queue a statement for the next flush.
+
+        Deferred statements commit in the same transaction as, and ahead of,
+        the pending transitions, so rows that belong to a status change
+        become visible together with it.
+        """
+        with self._lock:
+            self._deferred.append((sql, tuple(params)))
+            if len(self._deferred) >= self.batch_size:
+                self._wake.set()
+
+    def flush(self):
+        """Commit all pending transitions now."""
+        with self._lock:
+            callbacks = self._flush_locked()
+        self._run_callbacks(callbacks)
+
+    def _flush_locked(self) -> List[Callable[[], None]]:
+        """Commit pending transitions; returns their on_commit callbacks."""
+        if not self._pending and not self._deferred:
+            return []
+        pending, self._pending = self._pending, {}
+        deferred, self._deferred = self._deferred, []
+        callbacks, self._callbacks = self._callbacks, []
+
+        # One executemany per distinct set of columns
+        groups: Dict[tuple, List[tuple]] = {}
+        for job_id, fields in pending.items():
+            columns = tuple(sorted(fields))
+            groups.setdefault(columns, []).append(tuple(fields[c] for c in columns) + (job_id,))
+
+        try:
+            for sql, params in deferred:
+                self._conn.execute(sql, params)
+            for columns, rows in groups.items():
+                assignments = ", ".join(f"{c}=?" for c in columns)
+                self._conn.executemany(f"UPDATE jobs SET {assignments} WHERE id=?", rows)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            # Put the batch back so it is retried on the next flush
+            for job_id, fields in pending.items():
+                self._pending[job_id] = dict(fields, **self._pending.get(job_id, {}))
+            self._deferred = deferred + self._deferred
+            self._callbacks = callbacks + self._callbacks
+            raise
+
+        self._stats["rows_written"] += len(pending)
+        self._stats["deferred_written"] += len(deferred)
+        self._stats["transactions"] += 1
+        return callbacks
+
+    @staticmethod
+    def _run_callbacks(callbacks: List[Callable[[], None]]):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in job store commit callback: {e}")
+
+    # =====================================================
+    # --- Background flusher ---
+    # =====================================================
+    def start(self):
+        if self._thread:
+            return
+
+        def flusher():
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Error flushing job updates: {e}")
+                    time.sleep(self.flush_interval)
+
+        self._thread = threading.Thread(target=flusher, daemon=True, name="job-store")
+        self._thread.start()
+
+    def stats(self) -> Dict[str, int]:
+        """Write counters, including how many writes batching saved."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["deferred"] = len(self._deferred)
+        # Without batching every flushed transition and deferred statement
+        # would have been its own commit
+        flushed = stats["transitions"] - stats["pending"]
+        stats["rows_saved"] = max(0, flushed - stats["rows_written"])
+        stats["commits_saved"] = max(0, flushed + stats["deferred_written"] - stats["transactions"])
+        return stats
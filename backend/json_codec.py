@@ -0,0 +1,70 @@
+# backend/json_codec.py
+"""
+JSON parsing and serialization with orjson when it is installed.
+
+orjson parses and serializes large workflows (embedded base64 images)
+several times faster than the json module, straight from and to bytes
+without an intermediate str copy.
+It is stricter than the json module: integers beyond 64 bits, NaN and
+Infinity are rejected. Such documents are re-parsed with the json module, so
+the accepted input is the same either way.
+"""
+import json
+import threading
+from typing import IO, Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Spooled uploads below this are parsed without taking a slot
+SMALL_UPLOAD_BYTES = 1024 * 1024
+
+_parse_slots = threading.BoundedSemaphore(4)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse a JSON document; raises ValueError if it is invalid."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes (e.g. a request body)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def set_parse_concurrency(limit: int):
+    """How many large uploads may be read into memory and parsed at once."""
+    global _parse_slots
+    _parse_slots = threading.BoundedSemaphore(max(1, limit))
+
+
+def load_upload(stream: IO[bytes]) -> Any:
+    """
+    Parse an uploaded file from its (spooled) stream.
+
+    The body is read once as bytes and parsed without decoding it to a str.
+    Large bodies wait for one of a limited number of parse slots, so
+    concurrent big uploads cannot hold unbounded memory at the same time.
+    """
+    try:
+        stream.seek(0, 2)
+        size = stream.tell()
+        stream.seek(0)
+    except (AttributeError, OSError):
+        size = None
+    if size is not None and size < SMALL_UPLOAD_BYTES:
+        return loads(stream.read())
+    with _parse_slots:
+        return loads(stream.read())
@@ -0,0 +1,124 @@
+# backend/lease.py
+"""
+Leader election between API worker processes through a lease row.
+
+Every worker tries to take or renew the row named `name` in the `leases`
+table every ttl/3 seconds. The write only succeeds if the worker already
+holds the lease or the previous holder let it expire, so at most one
+worker holds it at a time. The holder runs the dispatcher, poller and node
+listeners; the others only serve the API.
+
+A worker considers itself leader until `ttl - margin` after its last
+successful renewal, so a stalled leader stops dispatching before anyone
+else can take over. Writes that must not land after a takeover (e.g.
+recording a dispatch whose HTTP call outlived the margin) add fence() to
+their WHERE clause, which checks the lease row in the same statement.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS leases(
+        name TEXT PRIMARY KEY,
+        holder TEXT,
+        expires_at REAL
+    )
+"""
+
+
+class Lease:
+    def __init__(self, store, name: str = "dispatcher", ttl: float = 15,
+                 holder: Optional[str] = None):
+        """
+        Args:
+            store: JobStore whose database holds the `leases` table
+            name: Lease row to compete for
+            ttl: Seconds a lease stays valid without renewal
+            holder: Identity of this worker (default host:pid)
+        """
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.margin = ttl / 3
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self._valid_until = 0.0
+        self._thread = None
+
+    def is_leader(self) -> bool:
+        return time.time() < self._valid_until
+
+    def try_acquire(self) -> bool:
+        """Take or renew the lease. Returns whether this worker holds it."""
+        now = time.time()
+        try:
+            c = self.store.write("""
+                INSERT INTO leases(name, holder, expires_at) VALUES(?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at
+                WHERE leases.holder=excluded.holder OR leases.expires_at < ?
+            """, (self.name, self.holder, now + self.ttl, now))
+        except Exception as e:
+            logger.error(f"Lease {self.name}: renewal failed: {e}")
+            return self.is_leader()
+        if c.rowcount:
+            self._valid_until = now + self.ttl - self.margin
+        return bool(c.rowcount)
+
+    def release(self):
+        """Give up the lease so another worker can take over immediately."""
+        self._valid_until = 0.0
+        self.store.write("DELETE FROM leases WHERE name=? AND holder=?", (self.name, self.holder))
+
+    def fence(self) -> Tuple[str, tuple]:
+        """
+        SQL condition and params that hold only while the database still
+        shows this worker as the unexpired holder.
+        """
+        return ("EXISTS(SELECT 1 FROM leases WHERE name=? AND holder=? AND expires_at > ?)",
+                (self.name, self.holder, time.time()))
+
+    def current_holder(self) -> Optional[str]:
+        row = self.store.read_one("SELECT holder, expires_at FROM leases WHERE name=?", (self.name,))
+        if not row or row["expires_at"] < time.time():
+            return None
+        return row["holder"]
+
+    def start(self, on_elected: Callable[[], None], on_lost: Optional[Callable[[], None]] = None):
+        """
+        Compete for the lease in a background thread.
+
+        Args:
+            on_elected: Called each time this worker becomes leader
+            on_lost: Called when it stops being leader
+        """
+        if self._thread:
+            return
+
+        def loop():
+            leading = False
+            while True:
+                held = self.try_acquire()
+                if held and not leading:
+                    logger.info(f"{self.holder} acquired lease '{self.name}'")
+                    leading = True
+                    try:
+                        on_elected()
+                    except Exception as e:
+                        logger.error(f"Error starting leader tasks: {e}")
+                elif not held and leading:
+                    logger.warning(f"{self.holder} lost lease '{self.name}'")
+                    leading = False
+                    if on_lost:
+                        try:
+                            on_lost()
+                        except Exception as e:
+                            logger.error(f"Error stopping leader tasks: {e}")
+                time.sleep(self.ttl / 3)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="lease")
+        self._thread.start()
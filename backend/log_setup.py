@@ -0,0 +1,133 @@
+# backend/log_setup.py
+"""
+Structured, non-blocking logging.
+
+Loggers only put records on an in-memory queue; a QueueListener thread
+formats them as JSON lines into a rotating file (and, above a threshold, to
+the console). Request threads therefore never wait on disk or stdout. If the
+queue is full records are dropped and counted rather than blocking.
+
+Levels are set per component (logger name, e.g. "comfyqueue.requests" or
+"comfyui_client"), and high-volume components can be sampled: with a rate of
+0.1 one in ten INFO/DEBUG records is kept, warnings and errors always are.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime
+from typing import Dict, Optional
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+dropped = 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, component, msg, extras, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "component": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of records below WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and keeps exceptions structured."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render everything that may reference caller state now, in the caller's thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1
+
+
+def configure(directory: str, filename: str = "comfyqueue.log", level: str = "INFO",
+              levels: Optional[Dict[str, str]] = None, sample_rates: Optional[Dict[str, float]] = None,
+              console_level: str = "WARNING", max_bytes: int = 10 * 1024 * 1024, backups: int = 5,
+              queue_size: int = 10000):
+    """
+    Route all logging through a background thread. Safe to call once per process.
+
+    Args:
+        directory: Where the rotating log files go (created if missing)
+        level: Root level for components without their own
+        levels: {component: level}, e.g. {"comfyqueue.requests": "WARNING"}
+        sample_rates: {component: fraction of sub-WARNING records to keep}
+        console_level: Records at or above this also go to stderr
+        queue_size: Records buffered before new ones are dropped
+    """
+    global _listener
+    if _listener:
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(directory, filename), maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                               respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    for component, component_level in (levels or {}).items():
+        logging.getLogger(component).setLevel(component_level)
+    for component, rate in (sample_rates or {}).items():
+        if rate < 1:
+            logging.getLogger(component).addFilter(SamplingFilter(rate))
+
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,62 @@
+# backend/memo.py
+"""
+Result memoization for identical workflows.
+
+Every job records a memo key: the SHA-256 of its workflow with non-semantic
+fields (node `_meta` titles) removed and keys sorted. When memoization is
+on for a submission, a job whose key matches one that completed within
+`memoize_ttl` seconds is completed straight away with a copy of those
+results, and one that matches a queued or running job is linked to it and
+resolved when that job finishes. Nothing is sent to a node in either case.
+
+Only deterministic workflows benefit: a workflow with a fixed seed produces
+the same key on every submit, while clients that randomize seeds naturally
+produce new keys.
+"""
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+# Overridden from config.json by configure()
+settings = {
+    "memoize_results": False,   # memoize submissions that don't say otherwise
+    "memoize_ttl": 86400,       # how long a completed result may be reused, seconds
+}
+
+# Status of a job waiting on an identical in-flight job
+LINKED = "linked"
+IN_FLIGHT = ("queued", "running", "submitted")
+
+
+def configure(config: Dict[str, Any]):
+    for key in settings:
+        if key in config:
+            settings[key] = config[key]
+
+
+def normalize(workflow_json: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop fields that do not affect what ComfyUI computes."""
+    return {
+        node_id: {k: v for k, v in node.items() if k != "_meta"} if isinstance(node, dict) else node
+        for node_id, node in workflow_json.items()
+    }
+
+
+def memo_key(workflow_json: Dict[str, Any]) -> str:
+    canonical = json.dumps(normalize(workflow_json), sort_keys=True, separators=(",", ":"),
+                           ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(canonical).hexdigest()
+
+
+def parse_flag(value: Optional[str]) -> Optional[bool]:
+    """'1'/'true'/'yes' -> True, '0'/'false'/'no' -> False, missing -> None."""
+    if value is None or value == "":
+        return None
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def wanted(memoize: Optional[bool], force: Optional[bool]) -> bool:
+    """Whether a submission should reuse results, from its request flags."""
+    if force:
+        return False
+    return settings["memoize_results"] if memoize is None else memoize
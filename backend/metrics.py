@@ -0,0 +1,189 @@
+# backend/metrics.py
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Values are updated where the events happen (job creation, dispatch, status
+transitions, node HTTP calls, poller passes) and /metrics only formats what
+is in memory. Job counts per status and node are seeded once from the
+database at startup (seed_job_counts) and then adjusted on every transition.
+
+In multi-worker mode each process exports its own view; job counts and
+queue figures are authoritative on the dispatcher leader.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_SECONDS_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+_registry: List["_Metric"] = []
+_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple, object] = {}
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with _lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 collect: Optional[Callable[[], float]] = None):
+        """
+        Args:
+            collect: Reads the current value at scrape time (unlabelled gauges)
+        """
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with _lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        if self.collect:
+            self.set(value=self.collect())
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        with _lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with _lock:
+            items = sorted((labels, (list(c), t, n)) for labels, (c, t, n) in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+def render() -> str:
+    """All metrics in the text exposition format."""
+    with _lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# =====================================================
+# --- Metrics ---
+# =====================================================
+jobs = Gauge("comfyqueue_jobs", "Jobs by status and node", ("status", "node"))
+jobs_created = Counter("comfyqueue_jobs_created_total", "Jobs created", ("status",))
+job_transitions = Counter("comfyqueue_job_transitions_total", "Job status changes", ("status",))
+queue_depth = Gauge("comfyqueue_queue_depth", "Jobs waiting in the dispatcher")
+oldest_queued_age = Gauge("comfyqueue_oldest_queued_age_seconds",
+                          "Seconds the oldest job in the dispatcher has been waiting")
+dispatch_latency = Histogram("comfyqueue_dispatch_latency_seconds",
+                             "Time from (re)queueing to submission to a node", ("node",),
+                             buckets=JOB_SECONDS_BUCKETS)
+execution_duration = Histogram("comfyqueue_execution_duration_seconds",
+                               "Time from submission to completion", ("node",),
+                               buckets=JOB_SECONDS_BUCKETS)
+poller_cycle = Histogram("comfyqueue_poller_cycle_seconds", "Duration of one status poller pass",
+                         buckets=LATENCY_BUCKETS + (60, 120))
+node_http_latency = Histogram("comfyqueue_node_http_seconds", "ComfyUI HTTP call latency",
+                              ("node_url", "endpoint"))
+log_records_dropped = Gauge("comfyqueue_log_records_dropped",
+                            "Log records dropped because the log queue was full")
+node_http_errors = Counter("comfyqueue_node_http_errors_total", "Failed ComfyUI HTTP calls",
+                           ("node_url", "endpoint"))
+
+
+def seed_job_counts(rows: Iterable[Tuple[str, Optional[str], int]]):
+    """Initialize the jobs gauge from (status, node, count) rows."""
+    with _lock:
+        jobs._values.clear()
+        for status, node, count in rows:
+            jobs._values[(status or "", node or "")] = count
+
+
+def job_created(status: str, node: Optional[str] = None, count: int = 1):
+    jobs.inc(status, node or "", amount=count)
+    jobs_created.inc(status, amount=count)
+
+
+def job_moved(old_status: str, old_node: Optional[str], new_status: str, new_node: Optional[str]):
+    """Move one job between (status, node) buckets."""
+    jobs.dec(old_status or "", old_node or "")
+    jobs.inc(new_status, new_node or "")
+    job_transitions.inc(new_status)
+
+
+def observe_http(node_url: str, endpoint: str, seconds: float, ok: bool):
+    node_http_latency.observe(seconds, node_url, endpoint)
+    if not ok:
+        node_http_errors.inc(node_url, endpoint)
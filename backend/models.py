@@ -13,6 +13,8 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), default="editor")  # 'admin' or 'editor'
+    # Bumped to revoke issued tokens (see access.py)
+    token_version = db.Column(db.Integer, default=0)
 
     def set_password(self, password: str):
         self.password_hash = bcrypt.generate_password_hash(password).decode("utf-8")
@@ -27,3 +29,7 @@ class Node(db.Model):
     url = db.Column(db.String(255), nullable=False)
     enabled = db.Column(db.Boolean, default=True)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    # HTTP client limits (see comfyui_client.NodeClient)
+    max_connections = db.Column(db.Integer, default=10)
+    max_retries = db.Column(db.Integer, default=2)
+    timeouts = db.Column(db.Text)  # JSON, e.g. {"prompt": 30}
@@ -0,0 +1,190 @@
+# backend/node_health.py
+"""
+Per-node health tracking with circuit breaking.
+
+Every HTTP call made through comfyui_client reports its outcome and latency
+here. After `failure_threshold` consecutive failures a node's circuit opens:
+calls to it fail immediately without touching the network, and the
+scheduler skips it. A background prober calls test_node_connection() with
+exponential backoff and closes the circuit on the first success.
+
+Successful calls also advance the node's last_seen, which is written back
+to the `nodes` table periodically.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from models import db, Node
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+
+settings = {
+    "failure_threshold": 3,     # consecutive failures that open the circuit
+    "probe_backoff": 5,         # first probe delay after opening, seconds
+    "probe_backoff_max": 300,   # longest delay between probes
+    "last_seen_interval": 30,   # how often last_seen is written to the DB
+}
+
+
+class NodeHealth:
+    def __init__(self, url: str):
+        self.url = url
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.latency_ms: Optional[float] = None
+        self.last_success: Optional[float] = None
+        self.last_failure: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.opened_at: Optional[float] = None
+        self.next_probe_at = 0.0
+        self.backoff = settings["probe_backoff"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "last_error": self.last_error,
+            "opened_at": self.opened_at,
+            "next_probe_at": self.next_probe_at if self.state == OPEN else None,
+        }
+
+
+_health: Dict[str, NodeHealth] = {}
+_lock = threading.Lock()
+_seen_dirty = set()
+
+
+def configure(config: Dict[str, Any]):
+    for key in settings:
+        if key in config:
+            settings[key] = config[key]
+
+
+def _key(url: str) -> str:
+    return url.rstrip("/")
+
+
+def _get(url: str) -> NodeHealth:
+    key = _key(url)
+    health = _health.get(key)
+    if health is None:
+        health = _health[key] = NodeHealth(key)
+    return health
+
+
+# =====================================================
+# --- Recording ---
+# =====================================================
+def record_success(url: str, latency: float):
+    with _lock:
+        health = _get(url)
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.latency_ms = latency * 1000 if health.latency_ms is None \
+            else 0.8 * health.latency_ms + 0.2 * latency * 1000
+        health.last_success = time.time()
+        _seen_dirty.add(health.url)
+        if health.state == OPEN:
+            logger.info(f"Node {health.url} recovered, closing circuit")
+            health.state = CLOSED
+            health.opened_at = None
+            health.backoff = settings["probe_backoff"]
+
+
+def record_failure(url: str, error: str, latency: Optional[float] = None):
+    with _lock:
+        health = _get(url)
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.last_failure = time.time()
+        health.last_error = error
+        if health.state == OPEN:
+            # A failed probe: wait longer before the next one
+            health.backoff = min(health.backoff * 2, settings["probe_backoff_max"])
+            health.next_probe_at = time.time() + health.backoff
+        elif health.consecutive_failures >= settings["failure_threshold"]:
+            logger.warning(f"Node {health.url} failed {health.consecutive_failures} times, opening circuit")
+            health.state = OPEN
+            health.opened_at = time.time()
+            health.backoff = settings["probe_backoff"]
+            health.next_probe_at = time.time() + health.backoff
+
+
+# =====================================================
+# --- Queries ---
+# =====================================================
+def is_available(url: str) -> bool:
+    """False while the node's circuit is open. Never touches the network."""
+    with _lock:
+        health = _health.get(_key(url))
+        return health is None or health.state != OPEN
+
+
+def status(url: str) -> Dict[str, Any]:
+    with _lock:
+        health = _health.get(_key(url))
+        return health.to_dict() if health else NodeHealth(_key(url)).to_dict()
+
+
+# =====================================================
+# --- Background prober ---
+# =====================================================
+def start(app, probe: Callable[[str], bool], active: Optional[Callable[[], bool]] = None):
+    """
+    Start the prober / last_seen writer.
+
+    Args:
+        probe: Connection test that bypasses the circuit breaker
+        active: Probing and flushing are skipped while this returns False
+    """
+
+    def loop():
+        last_flush = 0.0
+        while True:
+            if active and not active():
+                time.sleep(1)
+                continue
+            try:
+                now = time.time()
+                with _lock:
+                    due = [h.url for h in _health.values() if h.state == OPEN and h.next_probe_at <= now]
+                for url in due:
+                    # Outcome is recorded by the client call itself
+                    probe(url)
+
+                if now - last_flush >= settings["last_seen_interval"]:
+                    flush_last_seen(app)
+                    last_flush = now
+            except Exception as e:
+                logger.error(f"Error in node health loop: {e}")
+            time.sleep(1)
+
+    threading.Thread(target=loop, daemon=True, name="node-health").start()
+
+
+def flush_last_seen(app):
+    """Write last_seen for nodes that answered since the previous flush."""
+    with _lock:
+        dirty = {url: _health[url].last_success for url in _seen_dirty if url in _health}
+        _seen_dirty.clear()
+    if not dirty:
+        return
+    with app.app_context():
+        for node in Node.query.all():
+            seen = dirty.get(_key(node.url))
+            if seen:
+                node.last_seen = datetime.utcfromtimestamp(seen)
+        db.session.commit()
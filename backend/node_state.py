@@ -0,0 +1,213 @@
+# backend/node_state.py
+"""
+In-memory snapshot of node load, refreshed in the background.
+
+Node selection reads this snapshot instead of probing every node inline, so
+picking a node never waits on the network. Dispatches bump the local count
+immediately; the next refresh replaces it with the node's real queue size.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from models import Node
+
+logger = logging.getLogger(__name__)
+
+
+class NodeState:
+    """Last known load of a single node."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.queue_size = 0
+        self.reachable = False
+        self.updated_at = 0.0
+        self.error: Optional[str] = None
+        # From /system_stats, refreshed less often than the queue size
+        self.device: Optional[str] = None
+        self.vram_total: Optional[int] = None
+        self.vram_free: Optional[int] = None
+        self.stats_at = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "queue_size": self.queue_size,
+            "reachable": self.reachable,
+            "updated_at": self.updated_at,
+            "error": self.error,
+            "device": self.device,
+            "vram_total": self.vram_total,
+            "vram_free": self.vram_free,
+        }
+
+
+_states: Dict[str, NodeState] = {}
+_lock = threading.Lock()
+
+# Snapshots older than this are treated as unreachable
+STALE_AFTER = 30
+
+
+def snapshot(names: Optional[Set[str]] = None) -> List[NodeState]:
+    """
+    Return fresh, reachable node states.
+
+    Args:
+        names: Restrict to these node names (e.g. currently enabled nodes)
+    """
+    cutoff = time.time() - STALE_AFTER
+    with _lock:
+        states = list(_states.values())
+    return [
+        s for s in states
+        if s.reachable and s.updated_at >= cutoff and (names is None or s.name in names)
+    ]
+
+
+def all_states() -> List[NodeState]:
+    with _lock:
+        return list(_states.values())
+
+
+def capacity_weight(state: NodeState, states: List[NodeState]) -> float:
+    """
+    Relative capacity of a node: its VRAM over the largest VRAM in `states`.
+
+    Nodes without device info count as 1.0.
+    """
+    if not state.vram_total:
+        return 1.0
+    largest = max((s.vram_total or 0) for s in states)
+    return state.vram_total / largest if largest else 1.0
+
+
+def record_dispatch(name: str, count: int = 1):
+    """Account for a job we just sent to a node, ahead of the next refresh."""
+    with _lock:
+        state = _states.get(name)
+        if state:
+            state.queue_size += count
+
+
+def _carry_over(name: str, url: str, previous: Dict[str, NodeState]) -> NodeState:
+    """New state for a node, keeping its last /system_stats reading."""
+    state = NodeState(name, url)
+    old = previous.get(name)
+    if old and old.url == url:
+        state.device, state.vram_total, state.vram_free, state.stats_at = \
+            old.device, old.vram_total, old.vram_free, old.stats_at
+    return state
+
+
+def _apply_stats(state: NodeState, stats: Dict):
+    devices = stats.get("devices") or [{}]
+    state.device = devices[0].get("name")
+    state.vram_total = devices[0].get("vram_total")
+    state.vram_free = devices[0].get("vram_free")
+    state.stats_at = time.time()
+
+
+def _replace(results: List[NodeState]):
+    with _lock:
+        _states.clear()
+        for state in results:
+            _states[state.name] = state
+
+
+def refresh(nodes: Dict[str, str], probe: Callable[[str], int], max_workers: int = 16,
+            stats_probe: Optional[Callable[[str], Dict]] = None, stats_interval: float = 60):
+    """
+    Probe every node concurrently and replace the snapshot.
+
+    Args:
+        nodes: Mapping of node name -> base URL
+        probe: Function returning the queue size for a node URL
+        stats_probe: Function returning a node's /system_stats payload
+        stats_interval: Seconds between /system_stats probes per node
+    """
+    with _lock:
+        previous = dict(_states)
+
+    def check(item):
+        name, url = item
+        state = _carry_over(name, url, previous)
+        try:
+            state.queue_size = probe(url)
+            state.reachable = True
+            if stats_probe and time.time() - state.stats_at >= stats_interval:
+                _apply_stats(state, stats_probe(url))
+        except Exception as e:
+            state.error = str(e)
+        state.updated_at = time.time()
+        return state
+
+    results = []
+    if nodes:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(nodes))) as pool:
+            results = list(pool.map(check, nodes.items()))
+    _replace(results)
+
+
+async def refresh_async(nodes: Dict[str, str], probe: Callable[[str], Awaitable[int]],
+                        stats_probe: Optional[Callable[[str], Awaitable[Dict]]] = None,
+                        stats_interval: float = 60):
+    """
+    Same as refresh(), with coroutine probes gathered on the running loop.
+    """
+    with _lock:
+        previous = dict(_states)
+
+    async def check(name, url):
+        state = _carry_over(name, url, previous)
+        try:
+            state.queue_size = await probe(url)
+            state.reachable = True
+            if stats_probe and time.time() - state.stats_at >= stats_interval:
+                _apply_stats(state, await stats_probe(url))
+        except Exception as e:
+            state.error = str(e)
+        state.updated_at = time.time()
+        return state
+
+    _replace(list(await asyncio.gather(*(check(name, url) for name, url in nodes.items()))))
+
+
+def start_refresher(app, probe: Callable[[str], int], interval: float = 3,
+                    on_nodes: Optional[Callable[[List[Node]], None]] = None,
+                    stats_probe: Optional[Callable[[str], Dict]] = None,
+                    active: Optional[Callable[[], bool]] = None):
+    """
+    Start the background thread that keeps the snapshot current.
+
+    Args:
+        on_nodes: Called with the enabled Node rows (inside the app context)
+                  before each refresh
+        stats_probe: See refresh()
+        active: Refreshes are skipped while this returns False
+    """
+
+    def refresher():
+        while True:
+            started = time.time()
+            if active and not active():
+                time.sleep(interval)
+                continue
+            try:
+                with app.app_context():
+                    rows = Node.query.filter_by(enabled=True).all()
+                    if on_nodes:
+                        on_nodes(rows)
+                    nodes = {n.name: n.url for n in rows}
+                refresh(nodes, probe, stats_probe=stats_probe)
+            except Exception as e:
+                logger.error(f"Error refreshing node state: {e}")
+            time.sleep(max(0, interval - (time.time() - started)))
+
+    threading.Thread(target=refresher, daemon=True, name="node-state").start()
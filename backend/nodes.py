@@ -1,6 +1,10 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Node, User
+from flask_jwt_extended import jwt_required
+from models import db, Node
+from access import admin_required
+import json
+import comfyui_client
+import node_health
 
 nodes_bp = Blueprint("nodes", __name__)
 
@@ -8,17 +12,38 @@ nodes_bp = Blueprint("nodes", __name__)
 @jwt_required()
 def list_nodes():
     nodes = Node.query.order_by(Node.name.asc()).all()
-    return jsonify([{"id": n.id, "name": n.name, "url": n.url, "enabled": n.enabled} for n in nodes])
+    return jsonify([{
+        "id": n.id,
+        "name": n.name,
+        "url": n.url,
+        "enabled": n.enabled,
+        "max_connections": n.max_connections,
+        "max_retries": n.max_retries,
+        "timeouts": json.loads(n.timeouts) if n.timeouts else None,
+        "last_seen": n.last_seen.isoformat() if n.last_seen else None,
+        "health": node_health.status(n.url)
+    } for n in nodes])
+
+def apply_client_limits(node, data):
+    """Copy HTTP client limits from a request body onto a node. Returns an error string or None."""
+    try:
+        if "max_connections" in data:
+            node.max_connections = max(1, int(data["max_connections"]))
+        if "max_retries" in data:
+            node.max_retries = max(0, int(data["max_retries"]))
+    except (TypeError, ValueError):
+        return "max_connections and max_retries must be integers"
+    if "timeouts" in data:
+        timeouts = data["timeouts"]
+        if timeouts is not None and not isinstance(timeouts, dict):
+            return "timeouts must be an object"
+        node.timeouts = json.dumps(timeouts) if timeouts else None
+    return None
 
 @nodes_bp.post("/api/nodes/toggle")
 @jwt_required()
+@admin_required(error="Unauthorized")
 def toggle_node():
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or current_user.role != "admin":
-        return jsonify({"error": "Unauthorized"}), 403
-
     data = request.get_json(force=True)
     name = data.get("name")
     enabled = bool(data.get("enabled"))
@@ -31,13 +56,8 @@ def toggle_node():
 
 @nodes_bp.post("/api/nodes/add")
 @jwt_required()
+@admin_required(error="Unauthorized")
 def add_node():
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or current_user.role != "admin":
-        return jsonify({"error": "Unauthorized"}), 403
-
     data = request.get_json(force=True)
     name = (data.get("name") or "").strip()
     url = (data.get("url") or "").strip()
@@ -47,47 +67,46 @@ def add_node():
         return jsonify({"error": "node exists"}), 409
 
     n = Node(name=name, url=url, enabled=True)
+    error = apply_client_limits(n, data)
+    if error:
+        return jsonify({"error": error}), 400
     db.session.add(n)
     db.session.commit()
     return jsonify({"message": "node added", "id": n.id})
 
 @nodes_bp.put("/api/nodes/<int:node_id>")
 @jwt_required()
+@admin_required(error="Unauthorized")
 def update_node(node_id):
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or current_user.role != "admin":
-        return jsonify({"error": "Unauthorized"}), 403
-
     node = Node.query.get(node_id)
     if not node:
         return jsonify({"error": "node not found"}), 404
 
     data = request.get_json(force=True)
+    old_url = node.url
     if "name" in data:
         node.name = data["name"].strip()
     if "url" in data:
         node.url = data["url"].strip()
     if "enabled" in data:
         node.enabled = bool(data["enabled"])
+    error = apply_client_limits(node, data)
+    if error:
+        return jsonify({"error": error}), 400
 
     db.session.commit()
+    comfyui_client.drop_client(old_url)
     return jsonify({"message": "node updated", "id": node.id})
 
 @nodes_bp.delete("/api/nodes/<int:node_id>")
 @jwt_required()
+@admin_required(error="Unauthorized")
 def delete_node(node_id):
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or current_user.role != "admin":
-        return jsonify({"error": "Unauthorized"}), 403
-
     node = Node.query.get(node_id)
     if not node:
         return jsonify({"error": "node not found"}), 404
 
     db.session.delete(node)
     db.session.commit()
+    comfyui_client.drop_client(node.url)
     return jsonify({"message": "node deleted"})
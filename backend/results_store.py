@@ -0,0 +1,77 @@
+# backend/results_store.py
+"""
+Persisted ComfyUI outputs for completed jobs.
+
+Outputs are captured once, when a job completes, and kept in the
+`job_results` table in the same shape `comfyui_client.get_job_results()`
+returns. The results endpoint reads from here (through a small in-process
+LRU) so it keeps working after a node restarts and clears its history.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ResultsCache:
+    """Thread-safe LRU of job_id -> results payload."""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._items.get(job_id)
+            if item is not None:
+                self._items.move_to_end(job_id)
+            return item
+
+    def put(self, job_id: int, results: Dict[str, Any]):
+        with self._lock:
+            self._items[job_id] = results
+            self._items.move_to_end(job_id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, job_id: int):
+        with self._lock:
+            self._items.pop(job_id, None)
+
+
+cache = ResultsCache()
+
+
+def build(prompt_id: str, outputs: Dict[str, Any], status: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Results payload for processed outputs (see comfyui_client.process_outputs)."""
+    return {"prompt_id": prompt_id, "outputs": outputs, "status": status or {}}
+
+
+def insert_statement(job_id: int, results: Dict[str, Any]) -> Tuple[str, tuple]:
+    """(sql, params) that persists a job's results."""
+    cache.discard(job_id)
+    return ("""
+        INSERT OR REPLACE INTO job_results(job_id, prompt_id, outputs, status)
+        VALUES(?, ?, ?, ?)
+    """, (job_id, results.get("prompt_id"), json.dumps(results.get("outputs") or {}),
+          json.dumps(results.get("status") or {})))
+
+
+def save(store, job_id: int, results: Dict[str, Any]):
+    """Persist a job's results immediately."""
+    store.write(*insert_statement(job_id, results))
+
+
+def get(store, job_id: int) -> Optional[Dict[str, Any]]:
+    """Stored results for a job, or None if none were captured."""
+    results = cache.get(job_id)
+    if results is not None:
+        return results
+
+    row = store.read_one("SELECT prompt_id, outputs, status FROM job_results WHERE job_id=?", (job_id,))
+    if not row:
+        return None
+    results = build(row["prompt_id"], json.loads(row["outputs"]), json.loads(row["status"]))
+    cache.put(job_id, results)
+    return results
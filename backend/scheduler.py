@@ -0,0 +1,189 @@
+# backend/scheduler.py
+"""
+Node scoring for job placement.
+
+Each enabled, reachable node with room in its ComfyUI queue is scored by the
+estimated time until the job would finish there:
+
+    score = queue_size * node_mean + run_estimate + cold_load_seconds * missing_models
+
+node_mean and run_estimate come from running duration statistics per node
+and per workflow fingerprint (see duration_stats). Nodes without history are
+weighted by their VRAM relative to the largest node. missing_models is the
+share of the job's models (checkpoints, LoRAs, VAEs, ControlNets, ...) that
+the node has not used recently. If a node that
+is full right now would still score better than every open node, the job
+stays queued for it, up to `affinity_max_wait` seconds after it was queued.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import node_health
+import node_state
+from duration_stats import DurationStats
+from models import Node
+from node_state import NodeState
+
+logger = logging.getLogger(__name__)
+
+MODEL_EXTENSIONS = (".safetensors", ".ckpt", ".pt", ".pth", ".bin", ".gguf", ".sft", ".onnx")
+
+# Tunables, overridden from config.json by configure()
+settings = {
+    "max_node_queue": 4,          # jobs we keep queued on a node at most
+    "avg_job_seconds": 30,        # run time assumed before a node has history
+    "cold_load_seconds": 20,      # cost of loading a model not in VRAM
+    "affinity_max_wait": 60,      # longest a job waits for a warm node
+    "warm_models_per_node": 8,    # recently used models remembered per node
+}
+
+_recent_models: Dict[str, "OrderedDict[str, float]"] = {}
+_lock = threading.Lock()
+
+durations = DurationStats(settings["avg_job_seconds"])
+
+
+def configure(config: Dict[str, Any]):
+    for key in settings:
+        if key in config:
+            settings[key] = config[key]
+    durations.default_seconds = settings["avg_job_seconds"]
+
+
+# =====================================================
+# --- Workflow inspection ---
+# =====================================================
+def extract_models(workflow_json: Dict[str, Any]) -> List[str]:
+    """
+    List the model files a workflow loads.
+
+    Looks at every node's `*_name` inputs (ckpt_name, lora_name, vae_name,
+    control_net_name, unet_name, clip_name1, ...) whose value is a model
+    file name.
+    """
+    models = set()
+    if not isinstance(workflow_json, dict):
+        return []
+    for node in workflow_json.values():
+        if not isinstance(node, dict):
+            continue
+        for key, value in (node.get("inputs") or {}).items():
+            if "_name" in key and isinstance(value, str) and value.lower().endswith(MODEL_EXTENSIONS):
+                models.add(value)
+    return sorted(models)
+
+
+def workflow_fingerprint(workflow_json: Dict[str, Any]) -> str:
+    """
+    Identify a workflow's shape for duration statistics.
+
+    Built from node ids, class types and models; prompts, seeds and other
+    literal inputs are ignored so parameter variations share a fingerprint.
+    """
+    shape = []
+    if isinstance(workflow_json, dict):
+        for node_id, node in sorted(workflow_json.items()):
+            if isinstance(node, dict):
+                shape.append([node_id, node.get("class_type")])
+    shape.append(extract_models(workflow_json))
+    return hashlib.sha256(json.dumps(shape).encode("utf-8")).hexdigest()[:16]
+
+
+# =====================================================
+# --- Warm model tracking ---
+# =====================================================
+def record_loaded(node_name: str, models: Iterable[str]):
+    """Remember that a node has loaded these models (it started or finished a job using them)."""
+    now = time.time()
+    with _lock:
+        recent = _recent_models.setdefault(node_name, OrderedDict())
+        for model in models:
+            recent[model] = now
+            recent.move_to_end(model)
+        while len(recent) > settings["warm_models_per_node"]:
+            recent.popitem(last=False)
+
+
+def warm_models(node_name: str) -> Set[str]:
+    with _lock:
+        return set(_recent_models.get(node_name, ()))
+
+
+def missing_share(node_name: str, models: List[str]) -> float:
+    """Fraction of `models` that would be a cold load on this node."""
+    if not models:
+        return 0.0
+    warm = warm_models(node_name)
+    return sum(1 for m in models if m not in warm) / len(models)
+
+
+# =====================================================
+# --- Selection ---
+# =====================================================
+def score(state: NodeState, job: Dict[str, Any], states: List[NodeState]) -> float:
+    """Estimated seconds until `job` would finish on this node."""
+    weight = node_state.capacity_weight(state, states)
+    backlog = state.queue_size * durations.node_mean(state.name, weight)
+    run = durations.estimate(state.name, job.get("fingerprint"), weight)
+    cold = settings["cold_load_seconds"] * missing_share(state.name, job.get("models") or [])
+    return backlog + run + cold
+
+
+def enabled_node_names() -> Set[str]:
+    """Names of enabled nodes; the dispatcher loads them once per pass."""
+    return {n.name for n in Node.query.filter_by(enabled=True).all()}
+
+
+def select_node(job: Optional[Dict[str, Any]] = None,
+                enabled_names: Optional[Set[str]] = None) -> Optional[Tuple[NodeState, int]]:
+    """
+    Choose a node for a job, or None if it should stay queued for now.
+
+    Nothing is recorded here: the caller accounts for the job with
+    node_state.record_dispatch() once the node has accepted it.
+
+    Args:
+        job: Dispatcher metadata: 'models' (list of model files),
+             'fingerprint' and 'queued_at' (epoch seconds)
+        enabled_names: Enabled node names, if already loaded
+
+    Returns:
+        Tuple of (NodeState, queue_size)
+    """
+    job = job or {}
+    models = job.get("models") or []
+
+    if enabled_names is None:
+        enabled_names = enabled_node_names()
+    if not enabled_names:
+        logger.warning("No enabled nodes available")
+        return None
+
+    # Nodes with an open circuit are skipped without any network call
+    reachable = [s for s in node_state.snapshot(enabled_names) if node_health.is_available(s.url)]
+    if not reachable:
+        logger.warning("No responsive nodes found")
+        return None
+
+    open_nodes = [s for s in reachable if s.queue_size < settings["max_node_queue"]]
+    if not open_nodes:
+        return None
+
+    best = min(open_nodes, key=lambda s: score(s, job, reachable))
+
+    # A full node that already has the models may still be the cheaper
+    # option once a slot frees up; keep the job queued for it a while.
+    waited = time.time() - job.get("queued_at", time.time())
+    if models and waited < settings["affinity_max_wait"]:
+        full_nodes = [s for s in reachable if s.queue_size >= settings["max_node_queue"]]
+        if full_nodes and min(score(s, job, reachable) for s in full_nodes) < score(best, job, reachable):
+            return None
+
+    queue_size = best.queue_size
+    logger.info(f"Selected node: {best.name} with {queue_size} jobs")
+    return (best, queue_size)
@@ -0,0 +1,169 @@
+# backend/stage_stats.py
+"""
+Per-stage job timings, pre-aggregated for percentile queries.
+
+Each finished job contributes one sample per stage:
+
+    queue_wait  queued_at     -> dispatched_at   (waiting in our queue)
+    node_wait   dispatched_at -> started_at      (waiting in the node's queue)
+    execution   started_at    -> finished_at     (running on the node)
+    turnaround  queued_at     -> finished_at
+
+Samples are not stored individually. They are counted into log-spaced bins
+(10% wide) per hour, node, user and stage in `job_stage_rollups`, so a
+percentile over any window is a merge of a few hundred rows at most and
+accurate to about 5%.
+"""
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from duration_stats import parse_timestamp
+
+STAGES = {
+    "queue_wait": ("queued_at", "dispatched_at"),
+    "node_wait": ("dispatched_at", "started_at"),
+    "execution": ("started_at", "finished_at"),
+    "turnaround": ("queued_at", "finished_at"),
+}
+PERCENTILES = (50, 95, 99)
+
+BUCKET_SECONDS = 3600
+MIN_SECONDS = 0.1
+GROWTH = 1.1
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS job_stage_rollups(
+        bucket_start INTEGER,
+        stage TEXT,
+        node TEXT,
+        user TEXT,
+        bin INTEGER,
+        count INTEGER,
+        PRIMARY KEY(bucket_start, stage, node, user, bin)
+    )
+"""
+
+UPSERT_SQL = """
+    INSERT INTO job_stage_rollups(bucket_start, stage, node, user, bin, count)
+    VALUES(?, ?, ?, ?, ?, 1)
+    ON CONFLICT(bucket_start, stage, node, user, bin) DO UPDATE SET count = count + 1
+"""
+
+
+def to_bin(seconds: float) -> int:
+    if seconds <= MIN_SECONDS:
+        return 0
+    return int(math.log(seconds / MIN_SECONDS, GROWTH)) + 1
+
+
+def bin_value(index: int) -> float:
+    """Representative duration of a bin (its geometric midpoint)."""
+    if index == 0:
+        return MIN_SECONDS
+    return MIN_SECONDS * GROWTH ** (index - 0.5)
+
+
+def history_times(history_status: Optional[Dict[str, Any]]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    (started, finished) from the `messages` of a ComfyUI /history status.
+
+    Message timestamps are epoch milliseconds; results are naive local
+    datetimes like the other job timestamps.
+    """
+    started = finished = None
+    for message in (history_status or {}).get("messages") or []:
+        if not isinstance(message, (list, tuple)) or len(message) < 2 or not isinstance(message[1], dict):
+            continue
+        kind, data = message[0], message[1]
+        timestamp = data.get("timestamp")
+        if not isinstance(timestamp, (int, float)):
+            continue
+        if kind == "execution_start":
+            started = datetime.fromtimestamp(timestamp / 1000)
+        elif kind in ("execution_success", "execution_error", "execution_interrupted"):
+            finished = datetime.fromtimestamp(timestamp / 1000)
+    return started, finished
+
+
+def samples(job: Dict[str, Any]) -> List[Tuple[str, float]]:
+    """(stage, seconds) for every stage whose two timestamps are known."""
+    times = {key: parse_timestamp(job.get(key)) for key in ("queued_at", "dispatched_at", "started_at", "finished_at")}
+    result = []
+    for stage, (start, end) in STAGES.items():
+        if times[start] and times[end]:
+            seconds = (times[end] - times[start]).total_seconds()
+            if seconds >= 0:
+                result.append((stage, seconds))
+    return result
+
+
+def record(store, job: Dict[str, Any]):
+    """
+    Count a finished job into the rollups with the store's next batch.
+
+    Args:
+        job: Row with node, user and the four stage timestamps
+    """
+    finished = parse_timestamp(job.get("finished_at")) or datetime.now()
+    bucket = int(finished.timestamp()) // BUCKET_SECONDS * BUCKET_SECONDS
+    for stage, seconds in samples(job):
+        store.defer(UPSERT_SQL, (bucket, stage, job.get("node") or "", job.get("user") or "", to_bin(seconds)))
+
+
+def percentiles(bins: Iterable[Tuple[int, int]]) -> Dict[str, Any]:
+    """count and p50/p95/p99 seconds from (bin, count) pairs."""
+    bins = sorted(bins)
+    total = sum(count for _, count in bins)
+    result: Dict[str, Any] = {"count": total}
+    for p in PERCENTILES:
+        result[f"p{p}"] = None
+        if not total:
+            continue
+        rank = math.ceil(total * p / 100)
+        seen = 0
+        for index, count in bins:
+            seen += count
+            if seen >= rank:
+                result[f"p{p}"] = round(bin_value(index), 3)
+                break
+    return result
+
+
+def query(store, since: float, group_by: Optional[str] = None, node: Optional[str] = None,
+          user: Optional[str] = None, stage: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Percentiles per stage (and per node or user) since an epoch time.
+
+    Returns:
+        {stage: {group: {"count", "p50", "p95", "p99"}}}; the group is "all"
+        unless group_by is "node" or "user"
+    """
+    group_column = group_by if group_by in ("node", "user") else "'all'"
+    where = ["bucket_start >= ?"]
+    params: List[Any] = [int(since) // BUCKET_SECONDS * BUCKET_SECONDS]
+    for column, value in (("node", node), ("user", user), ("stage", stage)):
+        if value:
+            where.append(f"{column} = ?")
+            params.append(value)
+
+    rows = store.read(f"""
+        SELECT stage, {group_column} AS grp, bin, SUM(count) AS n
+        FROM job_stage_rollups
+        WHERE {' AND '.join(where)}
+        GROUP BY stage, grp, bin
+    """, params)
+
+    grouped: Dict[str, Dict[str, List[Tuple[int, int]]]] = {}
+    for row in rows:
+        grouped.setdefault(row["stage"], {}).setdefault(row["grp"], []).append((row["bin"], row["n"]))
+    return {s: {g: percentiles(b) for g, b in groups.items()} for s, groups in grouped.items()}
+
+
+def parse_window(value: str) -> int:
+    """'90m', '24h', '7d' or plain seconds -> seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
@@ -0,0 +1,184 @@
+# backend/static_assets.py
+"""
+Index of the built frontend (frontend/dist) for cheap, cacheable serving.
+
+The directory is scanned once, and again only when a periodic stat of the
+directory and index.html shows a new build. Requests are then answered from
+the in-memory index without touching the filesystem. For each compressible
+file, gzip and (when the optional brotli module is installed) brotli variants
+are used if the build shipped them (`app.js.gz`, `app.js.br`) or created next
+to the file otherwise. index.html is held in memory in every encoding.
+
+Vite's content-hashed assets (`assets/index-3f9a1c2b.js`) never change under
+the same name and may be cached forever. Everything else is revalidated via
+its ETag.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.html"
+COMPRESSIBLE = {".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml", ".wasm", ".ico"}
+MIN_COMPRESS_BYTES = 1024
+HASHED_NAME = re.compile(r"[-.][A-Za-z0-9_]{8,}\.[A-Za-z0-9]+$")
+
+# Preference order when the client accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compress(encoding: str, data: bytes) -> Optional[bytes]:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli:
+        return brotli.compress(data)
+    return None
+
+
+class Asset:
+    __slots__ = ("path", "mimetype", "etag", "immutable", "variants")
+
+    def __init__(self, path: str, mimetype: str, etag: str, immutable: bool):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.immutable = immutable
+        # encoding -> file path of the precompressed copy
+        self.variants: Dict[str, str] = {}
+
+    def choose(self, accepted: Iterable[str]) -> Tuple[Optional[str], str]:
+        """(encoding or None, file path) for the client's accepted encodings."""
+        accepted = set(accepted)
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return None, self.path
+
+
+class StaticIndex:
+    def __init__(self, root: str, check_interval: float = 2.0):
+        """
+        Args:
+            root: The built frontend directory
+            check_interval: Seconds between checks for a new build
+        """
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._assets: Dict[str, Asset] = {}
+        self._index: Optional[Dict[Optional[str], bytes]] = None
+        self._index_etag = ""
+        self._signature = None
+        self._checked_at = 0.0
+
+    # -------------------------------------------------
+    # Lookups
+    # -------------------------------------------------
+    def lookup(self, path: str) -> Optional[Asset]:
+        self.refresh()
+        return self._assets.get(path)
+
+    def index_html(self, accepted: Iterable[str]) -> Tuple[Optional[bytes], Optional[str], str]:
+        """(body, encoding, etag) of index.html; body is None if there is no build."""
+        self.refresh()
+        index = self._index
+        if index is None:
+            return None, None, ""
+        accepted = set(accepted)
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in index:
+                return index[encoding], encoding, self._index_etag
+        return index[None], None, self._index_etag
+
+    # -------------------------------------------------
+    # Indexing
+    # -------------------------------------------------
+    def _build_signature(self):
+        try:
+            return (os.stat(self.root).st_mtime_ns, os.stat(os.path.join(self.root, INDEX_FILE)).st_mtime_ns)
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Re-index if a new build appeared (checked at most every check_interval)."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            if self._build_signature() != self._signature:
+                self._reload()
+                # Taken after writing compressed copies, which touch the directory
+                self._signature = self._build_signature()
+
+    def _reload(self):
+        started = time.time()
+        assets: Dict[str, Asset] = {}
+        index = None
+        index_etag = ""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                full_path = os.path.join(directory, name)
+                relative = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                if any(name.endswith(suffix) and os.path.exists(full_path[:-len(suffix)])
+                       for _, suffix in ENCODINGS):
+                    continue
+                try:
+                    asset, data = self._index_file(relative, full_path)
+                except OSError as e:
+                    logger.warning(f"Skipping static file {relative}: {e}")
+                    continue
+                assets[relative] = asset
+                if relative == INDEX_FILE:
+                    index = {None: data}
+                    for encoding, _ in ENCODINGS:
+                        compressed = _compress(encoding, data)
+                        if compressed:
+                            index[encoding] = compressed
+                    index_etag = asset.etag
+
+        self._assets = assets
+        self._index = index
+        self._index_etag = index_etag
+        logger.info(f"Indexed {len(assets)} static files in {self.root} ({time.time() - started:.2f}s)")
+
+    def _index_file(self, relative: str, full_path: str) -> Tuple[Asset, bytes]:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        immutable = relative.startswith("assets/") and bool(HASHED_NAME.search(relative))
+        asset = Asset(full_path, mimetype, hashlib.sha256(data).hexdigest()[:32], immutable)
+
+        if os.path.splitext(full_path)[1].lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+            mtime = os.path.getmtime(full_path)
+            for encoding, suffix in ENCODINGS:
+                variant = full_path + suffix
+                if not os.path.exists(variant) or os.path.getmtime(variant) < mtime:
+                    compressed = _compress(encoding, data)
+                    if not compressed or len(compressed) >= len(data):
+                        continue
+                    tmp = f"{variant}.tmp{os.getpid()}"
+                    try:
+                        with open(tmp, "wb") as f:
+                            f.write(compressed)
+                        os.replace(tmp, variant)
+                    except OSError as e:
+                        # Read-only build directory: serve this file uncompressed
+                        logger.warning(f"Cannot write {variant}: {e}")
+                        continue
+                asset.variants[encoding] = variant
+        return asset, data
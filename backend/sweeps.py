@@ -0,0 +1,161 @@
+# backend/sweeps.py
+"""
+Parameter sweeps over a single workflow template.
+
+A sweep spec maps "node_id/input_name" paths to the values to try:
+
+    {
+        "mode": "product",            # or "zip"
+        "params": {
+            "3/seed": {"start": 1, "stop": 101},          # range, stop exclusive
+            "6/text": ["a red fox", "a blue fox"],        # explicit list
+            "3/cfg": {"start": 4.0, "stop": 8.0, "step": 0.5}
+        }
+    }
+
+"product" runs every combination (the last parameter varies fastest, as in
+itertools.product); "zip" runs the i-th value of every parameter together
+and needs lists of equal length.
+
+The template is stored once in workflow_blobs. Each sweep job only records
+its index; the workflow for that index is built when the dispatcher submits
+the job, by patching the template's affected nodes.
+"""
+import json
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PRODUCT = "product"
+ZIP = "zip"
+
+
+class SweepError(ValueError):
+    """Raised for a sweep spec that does not fit its template."""
+
+
+class ValueRange(Sequence):
+    """Arithmetic range of ints or floats, indexed without building a list."""
+
+    def __init__(self, start, stop, step=1):
+        if not step:
+            raise SweepError("range step must not be zero")
+        self.start, self.stop, self.step = start, stop, step
+        self._len = max(0, math.ceil((stop - start) / step))
+        self._int = all(isinstance(v, int) and not isinstance(v, bool) for v in (start, stop, step))
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        value = self.start + index * self.step
+        return value if self._int else round(value, 10)
+
+
+class Sweep:
+    def __init__(self, params: List[Tuple[str, str, Sequence]], mode: str):
+        self.params = params
+        self.mode = mode
+        lengths = [len(values) for _, _, values in params]
+        if mode == ZIP:
+            self.total = lengths[0]
+        else:
+            self.total = math.prod(lengths)
+
+    def overrides(self, index: int) -> List[Tuple[str, str, Any]]:
+        """(node_id, input_name, value) for the sweep job at `index`."""
+        if not 0 <= index < self.total:
+            raise IndexError(index)
+        if self.mode == ZIP:
+            return [(node_id, name, values[index]) for node_id, name, values in self.params]
+
+        result = []
+        for node_id, name, values in reversed(self.params):
+            index, i = divmod(index, len(values))
+            result.append((node_id, name, values[i]))
+        result.reverse()
+        return result
+
+    def sweeps_models(self) -> bool:
+        """True if a swept input can change which models the workflow loads."""
+        return any("_name" in name for _, name, _ in self.params)
+
+
+def parse(spec: Dict[str, Any], template: Dict[str, Any]) -> Sweep:
+    """
+    Validate a sweep spec against its template.
+
+    Raises:
+        SweepError: Unknown node or input, bad values, or mismatched zip lengths
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get("params"), dict) or not spec["params"]:
+        raise SweepError("sweep needs a non-empty 'params' object")
+    mode = spec.get("mode", PRODUCT)
+    if mode not in (PRODUCT, ZIP):
+        raise SweepError(f"Unknown sweep mode '{mode}'")
+
+    params = []
+    for path, values in spec["params"].items():
+        node_id, _, name = str(path).partition("/")
+        node = template.get(node_id)
+        if not isinstance(node, dict) or not name:
+            raise SweepError(f"{path}: expected 'node_id/input_name' of an existing node")
+        if name not in (node.get("inputs") or {}):
+            raise SweepError(f"{path}: node {node_id} has no input '{name}'")
+
+        if isinstance(values, dict):
+            try:
+                values = ValueRange(values["start"], values["stop"], values.get("step", 1))
+            except (KeyError, TypeError):
+                raise SweepError(f"{path}: range needs numeric 'start' and 'stop'")
+        elif not isinstance(values, list):
+            raise SweepError(f"{path}: values must be a list or a range object")
+        if not len(values):
+            raise SweepError(f"{path}: no values")
+        params.append((node_id, name, values))
+
+    if mode == ZIP and len({len(v) for _, _, v in params}) > 1:
+        raise SweepError("zip sweeps need the same number of values for every parameter")
+    return Sweep(params, mode)
+
+
+def load(spec_json: str, template: Dict[str, Any]) -> Sweep:
+    return parse(json.loads(spec_json), template)
+
+
+def apply(template: Dict[str, Any], overrides: List[Tuple[str, str, Any]]) -> Dict[str, Any]:
+    """
+    Workflow for one sweep job.
+
+    Only the patched nodes and their inputs are copied; the rest is shared
+    with the template, which must not be mutated afterwards.
+    """
+    workflow = dict(template)
+    for node_id, name, value in overrides:
+        node = dict(workflow[node_id])
+        node["inputs"] = dict(node.get("inputs") or {})
+        node["inputs"][name] = value
+        workflow[node_id] = node
+    return workflow
+
+
+def expand(template: Dict[str, Any], sweep: Sweep, index: int) -> Dict[str, Any]:
+    return apply(template, sweep.overrides(index))
+
+
+def describe(overrides: List[Tuple[str, str, Any]]) -> Dict[str, Any]:
+    """{"node_id/input": value} for reporting a job's sweep parameters."""
+    return {f"{node_id}/{name}": value for node_id, name, value in overrides}
+
+
+def progress(counts: Dict[Optional[str], int], total: int) -> Dict[str, Any]:
+    """Aggregate job status counts into sweep progress."""
+    done = sum(counts.get(s, 0) for s in ("completed", "failed", "cancelled"))
+    return {
+        "total": total,
+        "counts": {k: v for k, v in counts.items() if k},
+        "done": done,
+        "percent": round(100.0 * done / total, 1) if total else 100.0,
+        "finished": done >= total,
+    }
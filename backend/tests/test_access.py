@@ -0,0 +1,64 @@
+# backend/tests/test_access.py
+import pytest
+
+pytest.importorskip("flask_jwt_extended")
+pytest.importorskip("flask_sqlalchemy")
+
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+import access
+from models import db, bcrypt, User
+from users import users_bp
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["JWT_SECRET_KEY"] = "test-secret-key-long-enough-for-hs256"
+    db.init_app(app)
+    bcrypt.init_app(app)
+    jwt = JWTManager(app)
+    jwt.token_in_blocklist_loader(lambda header, payload: access.is_revoked(payload))
+    app.register_blueprint(users_bp)
+
+    with app.app_context():
+        db.create_all()
+        admin = User(username="admin", role="admin", token_version=access.initial_version())
+        admin.set_password("admin")
+        db.session.add(admin)
+        db.session.commit()
+        yield app.test_client(), app
+        db.session.remove()
+        db.drop_all()
+    access._versions.clear()
+
+
+def token_for(app, username):
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        return create_access_token(identity=user.username, additional_claims=access.claims_for(user))
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_old_token_rejected_after_delete_and_recreate(client):
+    client, app = client
+    admin = auth(token_for(app, "admin"))
+
+    r = client.post("/api/users/", json={"username": "bob", "password": "pw", "role": "admin"}, headers=admin)
+    assert r.status_code == 201
+    old_token = token_for(app, "bob")
+    assert client.get("/api/users/", headers=auth(old_token)).status_code == 200
+
+    with app.app_context():
+        bob_id = User.query.filter_by(username="bob").first().id
+    assert client.delete(f"/api/users/{bob_id}", headers=admin).status_code == 200
+    r = client.post("/api/users/", json={"username": "bob", "password": "pw", "role": "editor"}, headers=admin)
+    assert r.status_code == 201
+
+    assert client.get("/api/users/", headers=auth(old_token)).status_code == 401
+    assert client.get("/api/users/", headers=auth(token_for(app, "bob"))).status_code == 200
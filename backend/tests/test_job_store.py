@@ -0,0 +1,38 @@
+# backend/tests/test_job_store.py
+import sqlite3
+
+import pytest
+
+from job_store import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.write("CREATE TABLE jobs(id INTEGER PRIMARY KEY, status TEXT)")
+    store.write("INSERT INTO jobs(id, status) VALUES(1, 'running')")
+    return store
+
+
+def test_callbacks_of_flushed_transitions_run_when_transaction_fails(store):
+    called = []
+    store.transition(1, {"status": "completed"}, from_statuses=("running",),
+                     on_commit=lambda: called.append(1))
+
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            raise RuntimeError("boom")
+
+    assert store.read_one("SELECT status FROM jobs WHERE id=1")["status"] == "completed"
+    assert called == [1]
+
+
+def test_callbacks_of_flushed_transitions_run_when_write_fails(store):
+    called = []
+    store.transition(1, {"status": "completed"}, on_commit=lambda: called.append(1))
+
+    with pytest.raises(sqlite3.OperationalError):
+        store.write("UPDATE no_such_table SET x=1")
+
+    assert store.read_one("SELECT status FROM jobs WHERE id=1")["status"] == "completed"
+    assert called == [1]
@@ -1,8 +1,10 @@
 # backend/users.py
 
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import db, User
+import access
+from access import admin_required
 
 users_bp = Blueprint("users", __name__, url_prefix="/api/users")
 
@@ -18,13 +20,8 @@ def list_users():
 # --- Create a new user ---
 @users_bp.route("/", methods=["POST"])
 @jwt_required()
+@admin_required(msg="Only admin can create users")
 def create_user():
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or current_user.role != "admin":
-        return jsonify({"msg": "Only admin can create users"}), 403
-
     data = request.get_json()
     if not data or "username" not in data or "password" not in data or "role" not in data:
         return jsonify({"msg": "Missing fields"}), 400
@@ -32,10 +29,11 @@ def create_user():
     if User.query.filter_by(username=data["username"]).first():
         return jsonify({"msg": "Username already exists"}), 400
 
-    new_user = User(username=data["username"], role=data["role"])
+    new_user = User(username=data["username"], role=data["role"], token_version=access.initial_version())
     new_user.set_password(data["password"])
     db.session.add(new_user)
     db.session.commit()
+    access.invalidate(new_user.username)
 
     return jsonify({"msg": "User created successfully"}), 201
 
@@ -43,18 +41,14 @@ def create_user():
 # --- Edit (update) a user ---
 @users_bp.route("/<int:user_id>", methods=["PUT"])
 @jwt_required()
+@admin_required(msg="Only admin can update users")
 def update_user(user_id):
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or current_user.role != "admin":
-        return jsonify({"msg": "Only admin can update users"}), 403
-
     data = request.get_json()
     user = User.query.get(user_id)
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
+    old_username, old_role = user.username, user.role
     if "username" in data:
         user.username = data["username"]
     if "password" in data and data["password"]:
@@ -62,24 +56,24 @@ def update_user(user_id):
     if "role" in data:
         user.role = data["role"]
 
+    # Tokens carry the name and role, so changing either (or the password) revokes them
+    if user.username != old_username or user.role != old_role or "password" in data and data["password"]:
+        access.revoke_tokens(user)
     db.session.commit()
+    access.invalidate(old_username, user.username)
     return jsonify({"msg": "User updated successfully"}), 200
 
 
 # --- Delete a user ---
 @users_bp.route("/<int:user_id>", methods=["DELETE"])
 @jwt_required()
+@admin_required(msg="Only admin can delete users")
 def delete_user(user_id):
-    current_username = get_jwt_identity()
-    current_user = User.query.filter_by(username=current_username).first()
-
-    if not current_user or current_user.role != "admin":
-        return jsonify({"msg": "Only admin can delete users"}), 403
-
     user = User.query.get(user_id)
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
     db.session.delete(user)
     db.session.commit()
+    access.invalidate(user.username)
     return jsonify({"msg": "User deleted successfully"}), 200
@@ -0,0 +1,184 @@
+# backend/workflow_store.py
+"""
+Content-addressed, compressed storage for workflow JSON.
+
+Workflows are canonicalized (sorted keys, no whitespace), hashed with
+SHA-256 and stored once, zlib-compressed, in the `workflow_blobs` table.
+Jobs reference their workflow by `workflow_hash`, so re-uploads of the same
+workflow cost one row lookup instead of another copy of the JSON.
+"""
+import hashlib
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_LEVEL = 6
+# workflow_hash of legacy jobs whose inline JSON could not be parsed
+INVALID_HASH = ""
+
+
+def canonicalize(workflow_json: Dict[str, Any]) -> bytes:
+    """Serialize a workflow so equal workflows produce identical bytes."""
+    return json.dumps(workflow_json, sort_keys=True, separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
+
+
+def workflow_hash(canonical: bytes) -> str:
+    return hashlib.sha256(canonical).hexdigest()
+
+
+INSERT_SQL = """
+    INSERT OR IGNORE INTO workflow_blobs(hash, data, size, compressed_size)
+    VALUES(?, ?, ?, ?)
+"""
+
+
+def blob_row(workflow_json: Dict[str, Any]) -> Tuple[str, bytes, int, int]:
+    """(hash, compressed data, size, compressed size) for INSERT_SQL."""
+    canonical = canonicalize(workflow_json)
+    compressed = zlib.compress(canonical, COMPRESSION_LEVEL)
+    return workflow_hash(canonical), compressed, len(canonical), len(compressed)
+
+
+def save(store, workflow_json: Dict[str, Any]) -> str:
+    """
+    Store a workflow if it is not already present.
+
+    Returns:
+        The workflow hash to put in jobs.workflow_hash
+    """
+    row = blob_row(workflow_json)
+    store.write(INSERT_SQL, row)
+    return row[0]
+
+
+class BlobCache:
+    """
+    Compressed blobs by hash, least recently used first, bounded by total
+    bytes rather than entries (one workflow can be tens of MB). Misses are
+    not cached.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._blobs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._blobs.get(digest)
+            if data is not None:
+                self._blobs.move_to_end(digest)
+            return data
+
+    def put(self, digest: str, data: bytes):
+        # A single huge blob would flush everything else
+        if len(data) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if digest in self._blobs:
+                return
+            self._blobs[digest] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+cache = BlobCache(64 * 1024 * 1024)
+
+
+def _load_canonical(store, digest: str) -> Optional[bytes]:
+    data = cache.get(digest)
+    if data is None:
+        row = store.read_one("SELECT data FROM workflow_blobs WHERE hash=?", (digest,))
+        if not row:
+            return None
+        data = row["data"]
+        cache.put(digest, data)
+    return zlib.decompress(data)
+
+
+def load(store, digest: str) -> Optional[Dict[str, Any]]:
+    """Return a fresh copy of the workflow with this hash, or None."""
+    canonical = _load_canonical(store, digest)
+    if canonical is None:
+        return None
+    return json_codec.loads(canonical)
+
+
+def load_for_job(store, workflow_hash_value: Optional[str],
+                 workflow_data: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Load a job's workflow from the blob table, or its legacy inline copy.
+
+    Returns None if there is none, including legacy rows whose JSON could not
+    be parsed (marked with an empty workflow_hash by the migration).
+    """
+    if workflow_hash_value == INVALID_HASH:
+        return None
+    if workflow_hash_value:
+        return load(store, workflow_hash_value)
+    if workflow_data:
+        return json_codec.loads(workflow_data)
+    return None
+
+
+def migrate_inline_workflows(store, batch_size: int = 500) -> int:
+    """
+    Move workflow_data TEXT from jobs rows into workflow_blobs.
+
+    Runs in batches and can be interrupted; rows already migrated have a
+    workflow_hash and NULL workflow_data. Space is only returned to the
+    filesystem after a manual VACUUM.
+
+    Returns:
+        Number of jobs migrated
+    """
+    migrated = 0
+    while True:
+        rows = store.read("""
+            SELECT id, workflow_data FROM jobs
+            WHERE workflow_hash IS NULL AND workflow_data IS NOT NULL
+            LIMIT ?
+        """, (batch_size,))
+        if not rows:
+            break
+
+        blobs = {}
+        updates = []
+        invalid = []
+        for row in rows:
+            try:
+                blob = blob_row(json.loads(row["workflow_data"]))
+            except ValueError:
+                logger.warning(f"Job {row['id']} has invalid workflow JSON, not migrated")
+                invalid.append((row["id"],))
+                continue
+            blobs[blob[0]] = blob
+            updates.append((blob[0], None, row["id"]))
+
+        store.write_many(INSERT_SQL, blobs.values())
+        store.write_many("UPDATE jobs SET workflow_hash=?, workflow_data=? WHERE id=?", updates)
+        # Keep the text for inspection, stop selecting the row, and fail the
+        # job now rather than letting the dispatcher retry it forever
+        store.write_many(f"""
+            UPDATE jobs SET workflow_hash='{INVALID_HASH}',
+                status=CASE WHEN status IN ('queued', 'running', 'submitted') THEN 'failed' ELSE status END,
+                error_message=CASE WHEN status IN ('queued', 'running', 'submitted')
+                                   THEN 'Invalid workflow JSON' ELSE error_message END
+            WHERE id=?
+        """, invalid)
+        migrated += len(updates)
+
+    if migrated:
+        logger.info(f"Migrated {migrated} inline workflows to workflow_blobs")
+    return migrated
@@ -0,0 +1,241 @@
+# backend/ws_listener.py
+"""
+Push-based job tracking over the ComfyUI /ws event stream.
+
+One long-lived listener thread is kept per enabled node. Execution events
+are translated into status callbacks so job rows are updated as soon as the
+node reports them, instead of waiting for the next /history poll.
+"""
+import json
+import logging
+import threading
+from typing import Callable, Dict, Optional, Set
+
+import comfyui_client
+from models import Node
+
+try:
+    import websocket  # websocket-client
+except ImportError:  # pragma: no cover - optional dependency
+    websocket = None
+
+logger = logging.getLogger(__name__)
+
+# Callback signatures:
+#   on_status(prompt_id, status, error)   status: 'running' | 'completed' | 'failed'
+#   on_progress(prompt_id, value, max)
+#   on_reconnect(node_url)                 events may have been missed, reconcile
+StatusCallback = Callable[[str, str, Optional[str]], None]
+ProgressCallback = Callable[[str, int, int], None]
+ReconnectCallback = Callable[[str], None]
+
+_listeners: Dict[str, "NodeListener"] = {}
+_lock = threading.Lock()
+# Set to stop the current supervisor (see stop_listeners)
+_supervisor_stop: Optional[threading.Event] = None
+
+
+def available() -> bool:
+    """Return True if the websocket-client package is installed."""
+    return websocket is not None
+
+
+def to_ws_url(node_url: str) -> str:
+    """Convert a node's HTTP base URL into its /ws endpoint."""
+    base = node_url.rstrip("/")
+    if base.startswith("https://"):
+        base = "wss://" + base[len("https://"):]
+    elif base.startswith("http://"):
+        base = "ws://" + base[len("http://"):]
+    return f"{base}/ws?clientId={comfyui_client.CLIENT_ID}"
+
+
+# =====================================================
+# --- Per-node listener ---
+# =====================================================
+class NodeListener(threading.Thread):
+    """Keeps one WebSocket open to a node and dispatches its events."""
+
+    def __init__(self, name: str, url: str, on_status: StatusCallback,
+                 on_progress: ProgressCallback, on_reconnect: ReconnectCallback):
+        super().__init__(daemon=True, name=f"ws-{name}")
+        self.node_name = name
+        self.node_url = url
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self.on_reconnect = on_reconnect
+        self.connected = False
+        self._stop_event = threading.Event()
+        self._ws = None
+        # prompt_ids that already got a terminal event, so the trailing
+        # 'executing' {node: None} message does not trigger a /history check
+        self._finished = set()
+
+    def stop(self):
+        self._stop_event.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def run(self):
+        backoff = 1
+        while not self._stop_event.is_set():
+            try:
+                self._ws = websocket.create_connection(to_ws_url(self.node_url), timeout=30)
+                self.connected = True
+                backoff = 1
+                logger.info(f"WebSocket connected to node {self.node_name}")
+                # Anything that finished while we were disconnected is only
+                # visible through /history, so ask for a reconcile pass.
+                self.on_reconnect(self.node_url)
+                self._read_loop()
+            except Exception as e:
+                if not self._stop_event.is_set():
+                    logger.warning(f"WebSocket to node {self.node_name} lost: {e}")
+            finally:
+                self.connected = False
+                if self._ws is not None:
+                    try:
+                        self._ws.close()
+                    except Exception:
+                        pass
+                    self._ws = None
+
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _read_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                message = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                # Idle node; keep the connection alive
+                self._ws.ping()
+                continue
+
+            if not message:
+                raise ConnectionError("connection closed by node")
+            if isinstance(message, bytes):
+                # Binary frames are latent previews, not status events
+                continue
+            try:
+                event = json.loads(message)
+            except ValueError:
+                continue
+            self.handle_event(event.get("type"), event.get("data") or {})
+
+    def handle_event(self, event_type: Optional[str], data: dict):
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+
+        if event_type == "execution_start":
+            self.on_status(prompt_id, "running", None)
+
+        elif event_type == "execution_success":
+            self._finished.add(prompt_id)
+            self.on_status(prompt_id, "completed", None)
+
+        elif event_type == "execution_error":
+            self._finished.add(prompt_id)
+            error = data.get("exception_message") or "Unknown error"
+            node_type = data.get("node_type")
+            if node_type:
+                error = f"{node_type}: {error}"
+            self.on_status(prompt_id, "failed", error)
+
+        elif event_type == "execution_interrupted":
+            self._finished.add(prompt_id)
+            self.on_status(prompt_id, "failed", "Execution interrupted")
+
+        elif event_type == "executing":
+            if data.get("node") is not None:
+                return
+            # Older ComfyUI builds only signal completion this way, and newer
+            # ones send it after execution_success/error as well.
+            if prompt_id in self._finished:
+                self._finished.discard(prompt_id)
+                return
+            result = comfyui_client.check_job_status(self.node_url, prompt_id)
+            if result["status"] in ("completed", "failed"):
+                self.on_status(prompt_id, result["status"], result.get("error"))
+
+        elif event_type == "progress":
+            self.on_progress(prompt_id, data.get("value", 0), data.get("max", 0))
+
+
+# =====================================================
+# --- Supervisor ---
+# =====================================================
+def sync_listeners(nodes: Dict[str, str], on_status: StatusCallback,
+                   on_progress: ProgressCallback, on_reconnect: ReconnectCallback):
+    """
+    Start listeners for new nodes and stop listeners for removed ones.
+
+    Args:
+        nodes: Mapping of node name -> base URL for every enabled node
+    """
+    with _lock:
+        for name in list(_listeners):
+            listener = _listeners[name]
+            if nodes.get(name) != listener.node_url:
+                listener.stop()
+                del _listeners[name]
+
+        for name, url in nodes.items():
+            if name not in _listeners:
+                listener = NodeListener(name, url, on_status, on_progress, on_reconnect)
+                _listeners[name] = listener
+                listener.start()
+
+
+def connected_urls() -> Set[str]:
+    """Base URLs of nodes that currently have a live WebSocket."""
+    with _lock:
+        return {l.node_url for l in _listeners.values() if l.connected}
+
+
+def start_listeners(app, on_status: StatusCallback, on_progress: ProgressCallback,
+                    on_reconnect: ReconnectCallback, refresh_interval: int = 30) -> bool:
+    """
+    Start the background supervisor that keeps one listener per enabled node.
+
+    Returns:
+        False if websocket-client is not installed (caller should keep polling)
+    """
+    global _supervisor_stop
+    if not available():
+        logger.warning("websocket-client not installed, falling back to /history polling")
+        return False
+
+    with _lock:
+        if _supervisor_stop and not _supervisor_stop.is_set():
+            return True
+        stop = _supervisor_stop = threading.Event()
+
+    def supervisor():
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    nodes = {n.name: n.url for n in Node.query.filter_by(enabled=True).all()}
+                if not stop.is_set():
+                    sync_listeners(nodes, on_status, on_progress, on_reconnect)
+            except Exception as e:
+                logger.error(f"Error syncing node listeners: {e}")
+            stop.wait(refresh_interval)
+
+    threading.Thread(target=supervisor, daemon=True, name="ws-supervisor").start()
+    return True
+
+
+def stop_listeners():
+    """Stop the supervisor and close every listener; start_listeners() may be called again."""
+    with _lock:
+        if _supervisor_stop:
+            _supervisor_stop.set()
+        for listener in _listeners.values():
+            listener.stop()
+        _listeners.clear()
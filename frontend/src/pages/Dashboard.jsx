@@ -1,13 +1,20 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import axios from "../api/axiosConfig";
 import { io } from "socket.io-client";
 import DashboardUI from "../DashboardUI";
 
+// Newest jobs shown on the dashboard (one /api/jobs page)
+const PAGE_SIZE = 100;
+
 export default function Dashboard() {
   const [jobs, setJobs] = useState([]);
   const [nodes, setNodes] = useState([]);
   const [uploading, setUploading] = useState(false);
   const [selectedFile, setSelectedFile] = useState(null);
+  // Highest job version seen; /api/jobs/changes returns rows written after it
+  const versionRef = useRef(0);
+  // Current page, readable from socket handlers without stale closures
+  const jobsRef = useRef([]);
 
   const api = window.location.origin;
 
@@ -21,16 +28,68 @@ export default function Dashboard() {
     }
   };
 
+  const showJobs = (list) => {
+    jobsRef.current = list;
+    setJobs(list);
+  };
+
+  // Fetch the newest page of jobs
+  const loadPage = async () => {
+    const res = await axios.get(`${api}/api/jobs`, { params: { limit: PAGE_SIZE } });
+    showJobs(res.data.jobs);
+    return res.data.jobs;
+  };
+
   // Fetch jobs
   const loadJobs = async () => {
     try {
-      const res = await axios.get(`${api}/api/jobs`);
-      setJobs(res.data);
+      const page = await loadPage();
+      versionRef.current = Math.max(0, ...page.map((j) => j.version || 0));
     } catch (err) {
       console.error("Failed to load jobs:", err);
     }
   };
 
+  // A changed job missing from the page belongs on it if it sorts above the
+  // page's last row (i.e. it is new), or if the page is not full yet
+  const belongsOnPage = (job) => {
+    const page = jobsRef.current;
+    if (page.length < PAGE_SIZE) return true;
+    const last = page[page.length - 1];
+    return job.created_at === last.created_at ? job.id > last.id : job.created_at > last.created_at;
+  };
+
+  // Fetch only jobs that changed since the last load. Rows already on the
+  // page are updated in place; new ones are paged in through /api/jobs, so
+  // the list stays one page long during large sweeps.
+  const loadJobChanges = async () => {
+    try {
+      let hasMore = true;
+      let pageStale = false;
+      while (hasMore) {
+        const res = await axios.get(`${api}/api/jobs/changes`, {
+          params: { since: versionRef.current },
+        });
+        const { changes, cursor } = res.data;
+        hasMore = res.data.has_more;
+        versionRef.current = cursor;
+        if (changes.length === 0) break;
+
+        const byId = new Map(changes.map((j) => [j.id, j]));
+        const onPage = new Set(jobsRef.current.map((j) => j.id));
+        if (changes.some((j) => !onPage.has(j.id) && belongsOnPage(j))) {
+          // The page is reloaded below; skip merging into it
+          pageStale = true;
+        } else {
+          showJobs(jobsRef.current.map((j) => byId.get(j.id) || j));
+        }
+      }
+      if (pageStale) await loadPage();
+    } catch (err) {
+      console.error("Failed to load job changes:", err);
+    }
+  };
+
   useEffect(() => {
     loadNodes();
     loadJobs();
@@ -40,12 +99,21 @@ export default function Dashboard() {
 
     socket.on("new_job", (data) => {
       console.log("New job received:", data);
-      loadJobs(); // Reload jobs when a new one arrives
+      loadJobChanges();
+    });
+
+    socket.on("new_jobs", (data) => {
+      console.log(`Batch of ${data.count} jobs received`);
+      loadJobChanges();
+    });
+
+    socket.on("jobs_changed", () => {
+      loadJobChanges();
     });
 
     socket.on("job_update", (data) => {
       console.log("Job status update:", data);
-      loadJobs(); // Reload jobs when status changes
+      loadJobChanges();
     });
 
     return () => {
@@ -73,7 +141,7 @@ export default function Dashboard() {
       setSelectedFile(null);
       // Clear the file input
       e.target.reset();
-      loadJobs();
+      loadJobChanges();
     } catch (err) {
       console.error("Upload failed:", err);
       alert("Upload failed: " + (err.response?.data?.msg || err.message));
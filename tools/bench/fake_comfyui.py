@@ -0,0 +1,376 @@
+# tools/bench/fake_comfyui.py
+"""
+Simulated ComfyUI nodes for load testing comfyqueue without GPUs.
+
+Implements the parts of the ComfyUI API that comfyqueue uses:
+
+    POST /prompt            queue a workflow, returns prompt_id
+    GET  /queue             running and pending prompts
+    GET  /history/<id>      status, outputs and timestamped status messages
+    GET  /view              a small PNG for any output image
+    GET  /system_stats      one fake device with VRAM figures
+    GET  /ws?clientId=...   execution_start, executing, progress,
+                            execution_success / execution_error events
+
+Each node runs one prompt at a time. Execution time is drawn from a
+configurable distribution; prompts fail with --fail-rate; every HTTP
+response can be delayed (--slow-rate / --slow-ms); and a node can go dead
+for a while (--dead-after / --dead-for), either hanging requests or
+dropping connections.
+
+Standard library only. Example, four nodes on ports 8201-8204:
+
+    python tools/bench/fake_comfyui.py --nodes 4 --port 8201 --exec-mean 5 --fail-rate 0.02
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import math
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def tiny_png(width=8, height=8, rgb=(90, 140, 200)) -> bytes:
+    """A valid solid-colour PNG, so thumbnailing code has something to decode."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    raw = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+PNG = tiny_png()
+
+
+# =====================================================
+# --- Behaviour ---
+# =====================================================
+class Behaviour:
+    def __init__(self, args):
+        self.dist = args.exec_dist
+        self.mean = args.exec_mean
+        self.sigma = args.exec_sigma
+        self.fail_rate = args.fail_rate
+        self.slow_rate = args.slow_rate
+        self.slow_ms = args.slow_ms
+        self.dead_after = args.dead_after
+        self.dead_for = args.dead_for
+        self.dead_mode = args.dead_mode
+        self.steps = args.steps
+        self.vram_gb = args.vram_gb
+
+    def exec_seconds(self) -> float:
+        if self.dist == "const":
+            return self.mean
+        if self.dist == "uniform":
+            return random.uniform(max(0.0, self.mean - self.sigma), self.mean + self.sigma)
+        if self.dist == "exp":
+            return random.expovariate(1.0 / self.mean)
+        # lognormal with the given mean; sigma is the shape parameter
+        mu = math.log(self.mean) - self.sigma ** 2 / 2
+        return random.lognormvariate(mu, self.sigma)
+
+
+# =====================================================
+# --- Simulated node ---
+# =====================================================
+class FakeNode:
+    def __init__(self, name: str, behaviour: Behaviour):
+        self.name = name
+        self.behaviour = behaviour
+        self.started = time.time()
+        self.lock = threading.Condition()
+        self.pending = []           # [(number, prompt_id, prompt, client_id)]
+        self.running = None
+        self.history = {}
+        self.numbers = itertools.count()
+        self.sockets = {}           # ws socket -> client_id
+        self.send_locks = {}        # ws socket -> lock keeping frames whole
+        self.stats = {"prompts": 0, "completed": 0, "failed": 0}
+        threading.Thread(target=self._worker, daemon=True, name=f"{name}-worker").start()
+
+    def is_dead(self) -> bool:
+        b = self.behaviour
+        if b.dead_after is None:
+            return False
+        elapsed = time.time() - self.started - b.dead_after
+        return 0 <= elapsed < b.dead_for
+
+    # --- API ---
+    def submit(self, prompt, client_id):
+        prompt_id = str(uuid.uuid4())
+        with self.lock:
+            number = next(self.numbers)
+            self.pending.append((number, prompt_id, prompt, client_id))
+            self.stats["prompts"] += 1
+            self.lock.notify()
+        return {"prompt_id": prompt_id, "number": number, "node_errors": {}}
+
+    def queue(self):
+        with self.lock:
+            running = [list(self.running[:3]) + [{}, []]] if self.running else []
+            pending = [[n, p, prompt, {}, []] for n, p, prompt, _ in self.pending]
+        return {"queue_running": running, "queue_pending": pending}
+
+    def get_history(self, prompt_id):
+        with self.lock:
+            entry = self.history.get(prompt_id)
+        return {prompt_id: entry} if entry else {}
+
+    def system_stats(self):
+        total = int(self.behaviour.vram_gb * 1024 ** 3)
+        busy = self.running is not None
+        return {
+            "system": {"os": "posix", "comfyui_version": "fake", "python_version": "3"},
+            "devices": [{
+                "name": f"cuda:0 Fake GPU ({self.name})",
+                "type": "cuda",
+                "vram_total": total,
+                "vram_free": int(total * (0.3 if busy else 0.9)),
+            }],
+        }
+
+    # --- Execution ---
+    def _worker(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.lock.wait()
+                self.running = self.pending.pop(0)
+            number, prompt_id, prompt, client_id = self.running
+            self._execute(prompt_id, prompt, client_id)
+            with self.lock:
+                self.running = None
+
+    def _execute(self, prompt_id, prompt, client_id):
+        b = self.behaviour
+        messages = []
+
+        def event(kind, data, record=True):
+            data = dict(data, prompt_id=prompt_id, timestamp=int(time.time() * 1000))
+            if record:
+                messages.append([kind, data])
+            self.broadcast({"type": kind, "data": data}, client_id)
+
+        event("execution_start", {})
+        duration = b.exec_seconds()
+        node_ids = [k for k in (prompt or {}) if isinstance(prompt.get(k), dict)] or ["1"]
+        fail = random.random() < b.fail_rate
+        fail_at = random.randint(1, b.steps) if fail else None
+
+        step_time = duration / b.steps
+        for step in range(1, b.steps + 1):
+            if step == 1:
+                self.broadcast({"type": "executing", "data": {"node": node_ids[0], "prompt_id": prompt_id}}, client_id)
+            time.sleep(step_time)
+            if fail_at == step:
+                break
+            self.broadcast({"type": "progress", "data": {"value": step, "max": b.steps, "prompt_id": prompt_id}},
+                           client_id)
+
+        if fail:
+            event("execution_error", {"node_id": node_ids[-1], "node_type": "KSampler",
+                                      "exception_message": "Simulated failure"})
+            status = {"status_str": "error", "completed": False, "messages": messages}
+            outputs = {}
+            self.stats["failed"] += 1
+        else:
+            event("execution_success", {})
+            status = {"status_str": "success", "completed": True, "messages": messages}
+            outputs = {
+                node_id: {"images": [{"filename": f"{prompt_id[:8]}_{node_id}.png", "subfolder": "", "type": "output"}]}
+                for node_id in node_ids
+                if (prompt.get(node_id) or {}).get("class_type") in ("SaveImage", "PreviewImage")
+            } or {node_ids[-1]: {"images": [{"filename": f"{prompt_id[:8]}.png", "subfolder": "", "type": "output"}]}}
+            self.stats["completed"] += 1
+
+        with self.lock:
+            self.history[prompt_id] = {"prompt": [0, prompt_id, prompt, {}, []], "outputs": outputs, "status": status}
+        self.broadcast({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}}, client_id)
+
+    # --- WebSocket ---
+    def broadcast(self, message, client_id=None):
+        frame = ws_frame(json.dumps(message).encode("utf-8"))
+        with self.lock:
+            targets = [(s, self.send_locks[s]) for s, cid in self.sockets.items()
+                       if client_id is None or cid in (client_id, None)]
+        for sock, send_lock in targets:
+            try:
+                # Concurrent sendall calls on one socket can interleave frames
+                with send_lock:
+                    sock.sendall(frame)
+            except OSError:
+                with self.lock:
+                    self.sockets.pop(sock, None)
+                    self.send_locks.pop(sock, None)
+
+
+def ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack(">H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack(">Q", len(payload))
+    return header + payload
+
+
+# =====================================================
+# --- HTTP ---
+# =====================================================
+def make_handler(node: FakeNode):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _misbehave(self) -> bool:
+            b = node.behaviour
+            if node.is_dead():
+                if b.dead_mode == "hang":
+                    time.sleep(3600)
+                self.close_connection = True
+                try:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return True
+            if b.slow_rate and random.random() < b.slow_rate:
+                time.sleep(b.slow_ms / 1000)
+            return False
+
+        def _send(self, status, body, content_type="application/json"):
+            data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self._misbehave():
+                return
+            url = urlparse(self.path)
+            if url.path == "/ws":
+                return self._websocket(parse_qs(url.query).get("clientId", [None])[0])
+            if url.path == "/queue":
+                return self._send(200, node.queue())
+            if url.path.startswith("/history/"):
+                return self._send(200, node.get_history(url.path[len("/history/"):]))
+            if url.path == "/history":
+                with node.lock:
+                    return self._send(200, dict(list(node.history.items())[-200:]))
+            if url.path == "/system_stats":
+                return self._send(200, node.system_stats())
+            if url.path == "/view":
+                return self._send(200, PNG, "image/png")
+            if url.path == "/fake/stats":
+                return self._send(200, node.stats)
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self._misbehave():
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if urlparse(self.path).path != "/prompt":
+                return self._send(404, {"error": "not found"})
+            try:
+                data = json.loads(body)
+            except ValueError:
+                return self._send(400, {"error": "invalid json"})
+            if not isinstance(data.get("prompt"), dict):
+                return self._send(400, {"error": {"type": "invalid_prompt", "message": "no prompt"}})
+            self._send(200, node.submit(data["prompt"], data.get("client_id")))
+
+        def _websocket(self, client_id):
+            key = self.headers.get("Sec-WebSocket-Key")
+            if not key:
+                return self._send(400, {"error": "websocket upgrade required"})
+            accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept)
+            self.end_headers()
+            self.wfile.flush()
+
+            sock = self.connection
+            send_lock = threading.Lock()
+            with node.lock:
+                node.sockets[sock] = client_id
+                node.send_locks[sock] = send_lock
+                queue_remaining = len(node.pending) + (1 if node.running else 0)
+            with send_lock:
+                sock.sendall(ws_frame(json.dumps({"type": "status", "data": {
+                    "status": {"exec_info": {"queue_remaining": queue_remaining}}, "sid": client_id}}).encode()))
+            # Hold the connection until the client closes it; client frames are ignored
+            try:
+                while sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+            with node.lock:
+                node.sockets.pop(sock, None)
+                node.send_locks.pop(sock, None)
+            self.close_connection = True
+
+    return Handler
+
+
+def serve(name, port, behaviour):
+    node = FakeNode(name, behaviour)
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(node))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name=f"{name}-http").start()
+    return node, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=1, help="number of simulated nodes")
+    parser.add_argument("--port", type=int, default=8188, help="port of the first node")
+    parser.add_argument("--exec-dist", choices=("const", "uniform", "exp", "lognormal"), default="lognormal")
+    parser.add_argument("--exec-mean", type=float, default=5.0, help="mean execution seconds")
+    parser.add_argument("--exec-sigma", type=float, default=0.4,
+                        help="lognormal shape, or +/- seconds for uniform")
+    parser.add_argument("--steps", type=int, default=10, help="progress events per prompt")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of prompts that fail")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of HTTP responses delayed")
+    parser.add_argument("--slow-ms", type=float, default=2000, help="delay of a slow response")
+    parser.add_argument("--dead-after", type=float, default=None, help="seconds until the node goes dead")
+    parser.add_argument("--dead-for", type=float, default=30, help="how long it stays dead")
+    parser.add_argument("--dead-mode", choices=("hang", "drop"), default="drop",
+                        help="hang requests or drop connections while dead")
+    parser.add_argument("--dead-nodes", type=int, default=1, help="how many of the nodes go dead")
+    parser.add_argument("--vram-gb", type=float, default=24)
+    args = parser.parse_args()
+
+    for i in range(args.nodes):
+        behaviour = Behaviour(args)
+        if i >= args.dead_nodes:
+            behaviour.dead_after = None
+        serve(f"fake{i + 1}", args.port + i, behaviour)
+        print(f"fake{i + 1}: http://127.0.0.1:{args.port + i}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# tools/bench/loadbench.py
+"""
+End-to-end load benchmark for comfyqueue.
+
+Drives a running backend with M concurrent users uploading workflows while
+their dashboards poll /api/jobs and /api/jobs/changes, against N nodes
+(typically fake_comfyui.py). When every job has finished it reports:
+
+    submit      /upload throughput and latency percentiles
+    dispatch    queued_at -> dispatched_at percentiles
+    detection   node finish time (from /history) -> completed_at, i.e. how
+                late comfyqueue notices a finished job
+    dashboard   /api/jobs and /api/jobs/changes latency percentiles
+    db          growth of queue.db (+ WAL) in total and per job
+
+Results can be saved with --out and compared with a previous run with
+--baseline; the exit status is 1 if a metric regressed beyond --tolerance.
+
+Example (backend on :5000, four fake nodes started and registered):
+
+    python tools/bench/loadbench.py --admin admin:admin --start-sim --nodes 4 \\
+        --users 8 --jobs 25 --db backend/queue.db --out bench.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# metric -> True if larger is better
+DIRECTIONS = {
+    "submit.throughput_per_s": True,
+    "completed.throughput_per_s": True,
+}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, math.ceil(len(values) * p / 100) - 1)], 4)
+
+
+def summary(values):
+    return {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "max": round(max(values), 4) if values else None}
+
+
+def parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("GMT", "").strip())
+    except ValueError:
+        return None
+
+
+def make_workflow(seed):
+    return {
+        "3": {"class_type": "KSampler", "inputs": {"seed": seed, "steps": 20, "cfg": 7,
+                                                    "model": ["4", 0], "positive": ["6", 0]}},
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "bench.safetensors"}},
+        "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "benchmark", "clip": ["4", 1]}},
+        "9": {"class_type": "SaveImage", "inputs": {"images": ["3", 0], "filename_prefix": "bench"}},
+    }
+
+
+def db_size(path):
+    if not path:
+        return None
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+class Api:
+    def __init__(self, base, token=None):
+        self.base = base.rstrip("/")
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    @classmethod
+    def login(cls, base, username, password):
+        r = requests.post(f"{base.rstrip('/')}/api/auth/login",
+                          json={"username": username, "password": password}, timeout=10)
+        r.raise_for_status()
+        return cls(base, r.json()["access_token"])
+
+    def get(self, path, **params):
+        r = self.session.get(f"{self.base}{path}", params=params, timeout=30)
+        r.raise_for_status()
+        return r.json()
+
+    def post(self, path, **kwargs):
+        return self.session.post(f"{self.base}{path}", timeout=30, **kwargs)
+
+
+# =====================================================
+# --- Setup ---
+# =====================================================
+def register_nodes(admin, count, host, port):
+    for i in range(count):
+        r = admin.post("/api/nodes/add", json={"name": f"bench-fake{i + 1}", "url": f"http://{host}:{port + i}"})
+        if r.status_code not in (200, 409):
+            print(f"Registering bench-fake{i + 1} failed: {r.status_code} {r.text}")
+
+
+def create_users(admin, base, count, password):
+    apis = []
+    for i in range(count):
+        name = f"bench-user-{i}"
+        r = admin.post("/api/users/", json={"username": name, "password": password, "role": "editor"})
+        if r.status_code not in (201, 400):
+            raise RuntimeError(f"Creating {name} failed: {r.status_code} {r.text}")
+        apis.append((name, Api.login(base, name, password)))
+    return apis
+
+
+# =====================================================
+# --- Load ---
+# =====================================================
+def run_user(api, jobs, rate, results, lock):
+    for _ in range(jobs):
+        workflow = make_workflow(random.randint(0, 2 ** 31))
+        started = time.time()
+        r = api.post("/upload", files={"file": ("bench.json", json.dumps(workflow), "application/json")})
+        elapsed = time.time() - started
+        with lock:
+            if r.status_code in (200, 202):
+                results["submit_latency"].append(elapsed)
+                results["job_ids"].append(r.json()["job_id"])
+            else:
+                results["submit_errors"] += 1
+        if rate:
+            time.sleep(max(0.0, 1.0 / rate - elapsed))
+
+
+def run_dashboard(api, interval, stop, results, lock):
+    cursor = 0
+    while not stop.is_set():
+        for path, params in (("/api/jobs", {"limit": 100}), ("/api/jobs/changes", {"since": cursor})):
+            started = time.time()
+            try:
+                data = api.get(path, **params)
+            except requests.RequestException:
+                with lock:
+                    results["dashboard_errors"] += 1
+                continue
+            with lock:
+                results["dashboard_latency"].append(time.time() - started)
+            if path == "/api/jobs/changes":
+                cursor = data.get("cursor", cursor)
+        stop.wait(interval)
+
+
+def wait_for_jobs(admin, job_ids, timeout):
+    """Follow the change feed until every job is completed or failed."""
+    pending = set(job_ids)
+    cursor = 0
+    deadline = time.time() + timeout
+    while pending and time.time() < deadline:
+        data = admin.get("/api/jobs/changes", since=cursor, limit=1000)
+        for row in data["changes"]:
+            if row["status"] in ("completed", "failed"):
+                pending.discard(row["id"])
+        cursor = data["cursor"]
+        if not data["has_more"]:
+            time.sleep(0.5)
+    return pending
+
+
+def fetch_timings(admin, users):
+    rows, cursor = [], None
+    fields = "id,status,queued_at,dispatched_at,started_at,finished_at,completed_at,attempts"
+    while True:
+        params = {"fields": fields, "user": ",".join(users), "limit": 1000}
+        if cursor:
+            params["cursor"] = cursor
+        data = admin.get("/api/jobs", **params)
+        rows.extend(data["jobs"])
+        cursor = data.get("next_cursor")
+        if not cursor:
+            return rows
+
+
+# =====================================================
+# --- Report ---
+# =====================================================
+def flatten(report, prefix=""):
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(report, baseline, tolerance):
+    """List of (metric, baseline, current) that got worse by more than `tolerance`."""
+    current = dict(flatten(report))
+    regressions = []
+    for name, old in flatten(baseline):
+        new = current.get(name)
+        if new is None or not old or name.endswith(".count") or name.split(".")[0] in ("config", "jobs", "db") \
+                and not name.endswith("_per_job"):
+            continue
+        higher_is_better = DIRECTIONS.get(name, False)
+        worse = new < old * (1 - tolerance) if higher_is_better else new > old * (1 + tolerance)
+        if worse:
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://127.0.0.1:5000")
+    parser.add_argument("--admin", default="admin:admin", help="admin username:password")
+    parser.add_argument("--users", type=int, default=4, help="concurrent users (M)")
+    parser.add_argument("--jobs", type=int, default=25, help="uploads per user")
+    parser.add_argument("--rate", type=float, default=0, help="uploads per second per user (0 = as fast as possible)")
+    parser.add_argument("--dashboard-interval", type=float, default=2.0)
+    parser.add_argument("--nodes", type=int, default=0, help="register N simulated nodes (0 = use existing nodes)")
+    parser.add_argument("--node-host", default="127.0.0.1")
+    parser.add_argument("--node-port", type=int, default=8201)
+    parser.add_argument("--start-sim", action="store_true", help="start fake_comfyui.py with the N nodes")
+    parser.add_argument("--sim-args", default="", help="extra fake_comfyui.py arguments, e.g. '--fail-rate 0.05'")
+    parser.add_argument("--db", help="path of queue.db, to measure its growth")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds to wait for all jobs")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    sim = None
+    if args.start_sim and args.nodes:
+        sim = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_comfyui.py"), "--nodes", str(args.nodes),
+                                "--port", str(args.node_port)] + args.sim_args.split())
+        time.sleep(1)
+
+    try:
+        admin_user, admin_password = args.admin.split(":", 1)
+        admin = Api.login(args.api, admin_user, admin_password)
+        if args.nodes:
+            register_nodes(admin, args.nodes, args.node_host, args.node_port)
+        users = create_users(admin, args.api, args.users, "bench-password")
+
+        size_before = db_size(args.db)
+        results = {"submit_latency": [], "job_ids": [], "submit_errors": 0,
+                   "dashboard_latency": [], "dashboard_errors": 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        dashboards = [threading.Thread(target=run_dashboard, args=(api, args.dashboard_interval, stop, results, lock),
+                                       daemon=True) for _, api in users]
+        for t in dashboards:
+            t.start()
+
+        started = time.time()
+        submitters = [threading.Thread(target=run_user, args=(api, args.jobs, args.rate, results, lock))
+                      for _, api in users]
+        for t in submitters:
+            t.start()
+        for t in submitters:
+            t.join()
+        submit_seconds = time.time() - started
+        print(f"Submitted {len(results['job_ids'])} jobs in {submit_seconds:.1f}s; waiting for completion...")
+
+        unfinished = wait_for_jobs(admin, results["job_ids"], args.timeout)
+        total_seconds = time.time() - started
+        stop.set()
+
+        ids = set(results["job_ids"])
+        rows = [r for r in fetch_timings(admin, [name for name, _ in users]) if r["id"] in ids]
+        dispatch, detection, attempts = [], [], []
+        for row in rows:
+            queued, dispatched = parse_time(row.get("queued_at")), parse_time(row.get("dispatched_at"))
+            finished, completed = parse_time(row.get("finished_at")), parse_time(row.get("completed_at"))
+            if queued and dispatched:
+                dispatch.append((dispatched - queued).total_seconds())
+            if row["status"] == "completed" and finished and completed:
+                detection.append(max(0.0, (completed - finished).total_seconds()))
+            attempts.append(row.get("attempts") or 0)
+
+        size_after = db_size(args.db)
+        completed_count = sum(1 for r in rows if r["status"] == "completed")
+        report = {
+            "config": {"users": args.users, "jobs_per_user": args.jobs, "nodes": args.nodes, "rate": args.rate,
+                       "sim_args": args.sim_args},
+            "jobs": {"submitted": len(ids), "completed": completed_count,
+                     "failed": sum(1 for r in rows if r["status"] == "failed"), "unfinished": len(unfinished),
+                     "submit_errors": results["submit_errors"],
+                     "mean_attempts": round(sum(attempts) / len(attempts), 3) if attempts else None},
+            "submit": dict(summary(results["submit_latency"]),
+                           throughput_per_s=round(len(ids) / submit_seconds, 2) if submit_seconds else None),
+            "completed": {"throughput_per_s": round(completed_count / total_seconds, 3) if total_seconds else None,
+                          "makespan_s": round(total_seconds, 2)},
+            "dispatch_latency_s": summary(dispatch),
+            "detection_lag_s": summary(detection),
+            "dashboard_latency_s": dict(summary(results["dashboard_latency"]),
+                                        dashboard_errors=results["dashboard_errors"]),
+            "db": {"bytes_before": size_before, "bytes_after": size_after,
+                   "growth_bytes": size_after - size_before if size_before is not None else None,
+                   "growth_bytes_per_job": round((size_after - size_before) / len(ids), 1)
+                   if size_before is not None and ids else None},
+        }
+    finally:
+        if sim:
+            sim.terminate()
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old} -> {new}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()